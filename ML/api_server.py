@@ -1,10 +1,11 @@
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from pydantic import BaseModel, Field
 import uvicorn
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 
 from ML.core.ml_firewall import MLFirewall
+from NLP.core.response_profiles import resolve_profile, dumps
 
 app = FastAPI(title="BlueTeam ML Firewall", version="2.0.0")
 
@@ -12,9 +13,25 @@ app = FastAPI(title="BlueTeam ML Firewall", version="2.0.0")
 # This will try to load models from ML/models
 firewall = MLFirewall()
 
+PROFILE_HELP = "'profile': 'verdict' | 'scores' | 'full' (default) selects the response fields"
+
 class PromptRequest(BaseModel):
     prompt: str
-    options: Optional[Dict[str, Any]] = Field(default_factory=dict)
+    options: Optional[Dict[str, Any]] = Field(default_factory=dict, description=PROFILE_HELP)
+
+class BatchPromptRequest(BaseModel):
+    prompts: List[str]
+    options: Optional[Dict[str, Any]] = Field(default_factory=dict, description=PROFILE_HELP)
+
+def _json(content) -> Response:
+    """orjson-encoded body, bypassing FastAPI's jsonable_encoder"""
+    return Response(dumps(content), media_type="application/json")
+
+def _check_profile(options: Optional[Dict[str, Any]]):
+    try:
+        resolve_profile(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @app.get("/")
 def root():
@@ -28,18 +45,33 @@ def root():
 def analyze(request: PromptRequest):
     if not firewall.is_loaded:
         raise HTTPException(status_code=503, detail="Models not loaded. Please run training pipeline first.")
+    _check_profile(request.options)
     
-    return firewall.analyze(request.prompt, options=request.options)
+    return _json(firewall.analyze(request.prompt, options=request.options))
+
+@app.post("/analyze/batch")
+def analyze_batch(request: BatchPromptRequest):
+    """
+    Score many prompts in one call (one nlp.pipe pass, one model call per stage).
+    Results are returned in the same order as the input prompts.
+    """
+    if not firewall.is_loaded:
+        raise HTTPException(status_code=503, detail="Models not loaded. Please run training pipeline first.")
+    _check_profile(request.options)
+    
+    return _json({"results": firewall.analyze_batch(request.prompts, options=request.options)})
 
 @app.post("/analyze/raw")
-async def analyze_raw(request: Request, threshold: float = 0.7):
+async def analyze_raw(request: Request, threshold: float = 0.7, profile: Optional[str] = None):
     """
     Direct raw text endpoint.
-    Usage: POST /analyze/raw?threshold=0.55
+    Usage: POST /analyze/raw?threshold=0.55&profile=verdict
     Body: <your raw text here>
     """
     if not firewall.is_loaded:
         raise HTTPException(status_code=503, detail="Models not loaded. Please run training pipeline first.")
+    if profile:
+        _check_profile({"profile": profile})
     
     try:
         body = await request.body()
@@ -74,15 +106,21 @@ async def analyze_raw(request: Request, threshold: float = 0.7):
         else:
             prompt = content
             options = {"threshold": threshold}
+        if profile:
+            options["profile"] = profile
         
-        return firewall.analyze(prompt, options=options)
+        return _json(firewall.analyze(prompt, options=options))
         
     except Exception as e:
         raise HTTPException(status_code=422, detail=f"Request error: {str(e)}")
 
 @app.get("/health")
 def health():
-    return {"status": "healthy", "models_loaded": firewall.is_loaded}
+    return {
+        "status": "healthy",
+        "models_loaded": firewall.is_loaded,
+        "prefilter": firewall.prefilter.stats() if firewall.prefilter else None
+    }
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8001)
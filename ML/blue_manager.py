@@ -26,8 +26,13 @@ class BlueManager:
 
         # Command: Test
         test_parser = subparsers.add_parser("test", help="Stress test existing firewall against a dataset")
-        test_parser.add_argument("dataset_id", help="HuggingFace Dataset ID")
+        test_parser.add_argument("dataset_id", help="HuggingFace Dataset ID or local .jsonl/.json/.csv/.txt file")
         test_parser.add_argument("--samples", type=int, default=30, help="Number of samples to test")
+        test_parser.add_argument("--batch-size", type=int, default=64, help="Prompts per firewall batch call")
+        test_parser.add_argument("--workers", type=int, default=1, help="Batches scored in parallel")
+        test_parser.add_argument("--label-key", default=None, help="Field with ground-truth labels (enables FP stats)")
+        test_parser.add_argument("--scan-limit", type=int, default=None, help="Max records to read from the stream")
+        test_parser.add_argument("--seed", type=int, default=None, help="Sampling seed for reproducible runs")
 
         # Command: Ingest
         ingest_parser = subparsers.add_parser("ingest", help="Pull a dataset and add it to our training pool")
@@ -35,7 +40,26 @@ class BlueManager:
         ingest_parser.add_argument("--limit", type=int, default=500, help="Max items to ingest")
 
         # Command: Train
-        subparsers.add_parser("train", help="Trigger a full retraining of the ML models")
+        train_parser = subparsers.add_parser("train", help="Trigger a full retraining of the ML models")
+        train_parser.add_argument("--incremental", action="store_true",
+                                  help="Patch current models with unseen local jailbreaks instead of a full retrain")
+        train_parser.add_argument("--search", action="store_true",
+                                  help="Hyperparameter search (successive halving + early stopping) with a latency/accuracy report")
+        train_parser.add_argument("--search-candidates", type=int, default=48, help="Initial XGBoost candidates for --search")
+        train_parser.add_argument("--distill", action="store_true",
+                                  help="Export a compact student model for the fast path. On its own it distills from the "
+                                       "feature cache; with other training flags it runs after a full retrain")
+        train_parser.add_argument("--prefilter", action="store_true",
+                                  help="Also train the parse-free prefilter that lets confidently benign prompts skip spaCy")
+        train_parser.add_argument("--prefilter-max-leak", type=float, default=0.001,
+                                  help="Max share of validation attacks the prefilter may let skip (default 0.1%%)")
+        train_parser.add_argument("--dedup-threshold", type=float, default=None,
+                                  help="Estimated Jaccard above which local jailbreaks are collapsed as near-duplicates "
+                                       "(default: dedup.threshold in NLP/config/system.yaml)")
+        train_parser.add_argument("--objective", choices=["f1", "cost"], default="f1",
+                                  help="Ensemble calibration objective")
+        train_parser.add_argument("--fn-cost", type=float, default=1.0, help="Cost of a missed jailbreak (cost objective)")
+        train_parser.add_argument("--fp-cost", type=float, default=1.0, help="Cost of a blocked benign prompt (cost objective)")
 
         args = parser.parse_args()
 
@@ -44,22 +68,47 @@ class BlueManager:
             self.console.print("\n[yellow]Advice:[/yellow] Use [bold]blue-manager test <dataset_id>[/bold] to see if your current firewall holds up.")
 
         elif args.command == "test":
-            results = self.red_teamer.test_dataset(args.dataset_id, sample_size=args.samples)
+            results = self.red_teamer.test_dataset(
+                args.dataset_id, sample_size=args.samples, batch_size=args.batch_size,
+                workers=args.workers, label_key=args.label_key, seed=args.seed,
+                scan_limit=args.scan_limit
+            )
             if results and results['failures']:
                 choice = input("\nWould you like to analyze these leaks with OpenRouter? (y/n): ")
                 if choice.lower() == 'y':
                     self.analyzer.analyze_leaks(results['failures'])
                 
-                choice = input("\nWould you like to ingest this dataset for reinforcement? (y/n): ")
+                choice = input("\nWould you like to patch these leaks now with an incremental update? (y/n): ")
                 if choice.lower() == 'y':
-                    self.ingest(args.dataset_id)
+                    TrainingPipeline().train_incremental(prompts=[f['prompt'] for f in results['failures']])
+                
+                # Local files are already on disk, ingest only applies to HF datasets
+                if not os.path.isfile(args.dataset_id):
+                    choice = input("\nWould you like to ingest this dataset for reinforcement? (y/n): ")
+                    if choice.lower() == 'y':
+                        self.ingest(args.dataset_id)
 
         elif args.command == "ingest":
             self.ingest(args.dataset_id, args.limit)
 
         elif args.command == "train":
             pipeline = TrainingPipeline()
-            pipeline.train()
+            if args.dedup_threshold is not None:
+                pipeline.dedup_threshold = args.dedup_threshold
+            # --distill alone re-exports the student from the cached features; with any
+            # training flag it runs the full training, which distills at the end
+            training_flags = [k for k in ("search", "search_candidates", "prefilter", "prefilter_max_leak",
+                                          "dedup_threshold", "objective", "fn_cost", "fp_cost")
+                              if getattr(args, k) != train_parser.get_default(k)]
+            if args.incremental:
+                pipeline.train_incremental()
+            elif args.distill and not training_flags and os.path.exists(pipeline.cache_path):
+                pipeline.distill()
+            else:
+                pipeline.train(objective=args.objective, fn_cost=args.fn_cost, fp_cost=args.fp_cost,
+                               search=args.search, search_candidates=args.search_candidates,
+                               distill=args.distill, prefilter=args.prefilter,
+                               prefilter_max_leak=args.prefilter_max_leak)
 
         else:
             parser.print_help()
@@ -81,7 +130,7 @@ class BlueManager:
                     count += 1
             
             self.console.print(f"[bold green]✅ Success![/bold green] Saved {count} items to {output_file}")
-            self.console.print("[yellow]Tip:[/yellow] Run [bold]blue-manager train[/bold] to apply these new lessons.")
+            self.console.print("[yellow]Tip:[/yellow] Run [bold]blue-manager train --incremental[/bold] to apply these new lessons in seconds.")
         except Exception as e:
             self.console.print(f"[red]Ingestion failed: {e}[/red]")
 
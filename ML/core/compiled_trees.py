@@ -0,0 +1,239 @@
+"""
+Flat-array tree predictors for single-prompt inference.
+
+sklearn's IsolationForest.score_samples and XGBoost's predict_proba spend most of a
+one-row call in Python dispatch (one call per tree for IsolationForest, DMatrix
+construction for XGBoost). Here every tree of a model is packed into shared NumPy
+arrays (node feature, threshold, left/right child, leaf value) and all trees are
+walked together, one vectorized step per tree level.
+
+Leaves point to themselves, so walking max_depth steps always ends on a leaf.
+compile_models() checks each compiled predictor against the original on a probe
+matrix and only returns the ones that match within tolerance.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Optional
+
+EULER_GAMMA = 0.5772156649015329
+
+
+def average_path_length(n: np.ndarray) -> np.ndarray:
+    """c(n): average unsuccessful-search path length of a BST with n points (Liu et al.)"""
+    n = np.asarray(n, dtype=np.float64)
+    c = np.zeros_like(n)
+    c[n == 2] = 1.0
+    big = n > 2
+    c[big] = 2.0 * (np.log(n[big] - 1.0) + EULER_GAMMA) - 2.0 * (n[big] - 1.0) / n[big]
+    return c
+
+
+class FlatForest:
+    """All trees of an ensemble in flat arrays. Node ids are global across trees."""
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth,
+                 default_left=None, strict: bool = False):
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int64)
+        self.max_depth = int(max_depth)
+        # Missing values (NaN) follow default_left; sklearn trees never see NaN here
+        self.default_left = None if default_left is None else np.asarray(default_left, dtype=bool)
+        # sklearn goes left on x <= t, XGBoost on x < t
+        self.strict = strict
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node id reached by every (row, tree) pair, shape (n_rows, n_trees)"""
+        rows = np.arange(X.shape[0])[:, None]
+        node = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[node]]
+            go_left = x < self.threshold[node] if self.strict else x <= self.threshold[node]
+            if self.default_left is not None:
+                missing = np.isnan(x)
+                go_left = np.where(missing, self.default_left[node], go_left)
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def sum_leaves(self, X: np.ndarray) -> np.ndarray:
+        return self.value[self.leaves(X)].sum(axis=1)
+
+
+class _Pack:
+    """Accumulates per-tree arrays into one FlatForest"""
+
+    def __init__(self):
+        self.parts = {k: [] for k in ("feature", "threshold", "left", "right", "value", "default_left")}
+        self.roots: List[int] = []
+        self.offset = 0
+        self.max_depth = 0
+
+    def add(self, feature, threshold, left, right, value, default_left=None):
+        n = len(feature)
+        is_leaf = left < 0
+        own = np.arange(n)
+        # Leaves loop on themselves; their feature/threshold are never meaningful
+        left = np.where(is_leaf, own, left) + self.offset
+        right = np.where(is_leaf, own, right) + self.offset
+        self.parts["feature"].append(np.where(is_leaf, 0, feature))
+        self.parts["threshold"].append(np.where(is_leaf, 0.0, threshold))
+        self.parts["left"].append(left)
+        self.parts["right"].append(right)
+        self.parts["value"].append(value)
+        self.parts["default_left"].append(np.ones(n, dtype=bool) if default_left is None else default_left)
+        self.roots.append(self.offset)
+        self.max_depth = max(self.max_depth, _depths(left - self.offset, right - self.offset).max())
+        self.offset += n
+
+    def build(self, strict: bool, with_default: bool) -> FlatForest:
+        cat = {k: np.concatenate(v) for k, v in self.parts.items()}
+        return FlatForest(cat["feature"], cat["threshold"], cat["left"], cat["right"], cat["value"],
+                          self.roots, self.max_depth,
+                          default_left=cat["default_left"] if with_default else None, strict=strict)
+
+
+def _depths(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Depth of every node (root = 0). Children always follow their parent in node order."""
+    depth = np.zeros(len(left), dtype=np.int64)
+    for i in range(len(left)):
+        if left[i] != i:
+            depth[left[i]] = depth[i] + 1
+            depth[right[i]] = depth[i] + 1
+    return depth
+
+
+class CompiledIsolationForest:
+    """Drop-in for IsolationForest.score_samples"""
+
+    def __init__(self, iso_forest):
+        pack = _Pack()
+        n_features = iso_forest.n_features_in_
+        for tree, features in zip(iso_forest.estimators_, iso_forest.estimators_features_):
+            t = tree.tree_
+            leaf = t.children_left < 0
+            depth = _depths(np.where(leaf, np.arange(t.node_count), t.children_left),
+                            np.where(leaf, np.arange(t.node_count), t.children_right))
+            # Path length of a leaf: edges walked + expected remaining depth of its sample
+            value = np.where(leaf, depth + average_path_length(t.n_node_samples), 0.0)
+            pack.add(np.asarray(features)[np.maximum(t.feature, 0)], t.threshold,
+                     t.children_left, t.children_right, value)
+        self.forest = pack.build(strict=False, with_default=False)
+        self.n_features = n_features
+        self.feature_names = list(getattr(iso_forest, "feature_names_in_", []))
+        self.denominator = len(iso_forest.estimators_) * average_path_length([iso_forest.max_samples_])[0]
+
+    def score_samples(self, X) -> np.ndarray:
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = _as_array(X, self.feature_names).astype(np.float32).astype(np.float64)
+        depths = self.forest.sum_leaves(X)
+        return -(2.0 ** (-depths / self.denominator))
+
+
+class CompiledXGBoost:
+    """Drop-in for XGBClassifier.predict_proba / XGBRegressor.predict (binary:logistic or squared error)"""
+
+    def __init__(self, model):
+        booster = model.get_booster()
+        n_rounds = _iteration_limit(model)
+        raw = json.loads(booster.save_raw("json"))
+        trees = raw["learner"]["gradient_booster"]["model"]["trees"]
+        trees_per_round = max(1, len(trees) // max(1, booster.num_boosted_rounds()))
+        if n_rounds is not None:
+            trees = trees[:n_rounds * trees_per_round]
+
+        pack = _Pack()
+        for tree in trees:
+            left = np.asarray(tree["left_children"], dtype=np.int64)
+            right = np.asarray(tree["right_children"], dtype=np.int64)
+            cond = np.asarray(tree["split_conditions"], dtype=np.float32).astype(np.float64)
+            value = np.where(left < 0, cond, 0.0)
+            pack.add(np.asarray(tree["split_indices"], dtype=np.int64), cond, left, right, value,
+                     default_left=np.asarray(tree["default_left"], dtype=bool))
+        self.forest = pack.build(strict=True, with_default=True)
+        self.feature_names = list(booster.feature_names or [])
+        self.logistic = raw["learner"]["objective"]["name"] == "binary:logistic"
+
+        # Base margin differs across XGBoost versions (probability vs logit space);
+        # read it back from the booster instead of reimplementing the conversion
+        probe = np.zeros((1, model.n_features_in_), dtype=np.float32)
+        margin = float(model.predict(pd.DataFrame(probe, columns=self.feature_names) if self.feature_names else probe,
+                                     output_margin=True)[0])
+        self.base_margin = margin - float(self.forest.sum_leaves(probe.astype(np.float64))[0])
+
+    def margin(self, X) -> np.ndarray:
+        X = _as_array(X, self.feature_names).astype(np.float32).astype(np.float64)
+        return self.base_margin + self.forest.sum_leaves(X)
+
+    def predict(self, X) -> np.ndarray:
+        m = self.margin(X)
+        return 1.0 / (1.0 + np.exp(-m)) if self.logistic else m
+
+    def predict_proba(self, X) -> np.ndarray:
+        p = self.predict(X)
+        return np.column_stack([1.0 - p, p])
+
+
+def _iteration_limit(model) -> Optional[int]:
+    """Rounds sklearn's wrapper actually uses (best_iteration after early stopping)"""
+    if model.get_params().get("early_stopping_rounds") is None:
+        return None
+    try:
+        return int(model.best_iteration) + 1
+    except AttributeError:
+        return None
+
+
+def _as_array(X, feature_names: List[str]) -> np.ndarray:
+    if isinstance(X, pd.DataFrame):
+        if feature_names:
+            X = X[feature_names]
+        return X.to_numpy(dtype=np.float64)
+    return np.asarray(X, dtype=np.float64)
+
+
+def verify(original, compiled, X: pd.DataFrame, atol: float = 1e-5) -> float:
+    """Max absolute difference between original and compiled outputs on X. Raises if over atol."""
+    if isinstance(compiled, CompiledIsolationForest):
+        diff = np.abs(original.score_samples(X) - compiled.score_samples(X)).max()
+    elif hasattr(original, "predict_proba"):
+        diff = np.abs(original.predict_proba(X)[:, 1] - compiled.predict_proba(X)[:, 1]).max()
+    else:
+        diff = np.abs(original.predict(X) - compiled.predict(X)).max()
+    if not diff <= atol:
+        raise ValueError(f"compiled predictor deviates from original by {diff:.2e}")
+    return float(diff)
+
+
+def probe_matrix(columns: List[str], n: int = 256, seed: int = 0) -> pd.DataFrame:
+    """Random non-negative feature rows (counts/ratios/flags) for verification"""
+    rng = np.random.default_rng(seed)
+    data = np.where(rng.random((n, len(columns))) < 0.5,
+                    rng.random((n, len(columns))), rng.integers(0, 5, (n, len(columns))))
+    return pd.DataFrame(data, columns=columns)
+
+
+def compile_models(models: Dict[str, Any], X_probe: pd.DataFrame, atol: float = 1e-5) -> Dict[str, Any]:
+    """
+    Compile every supported model in `models` (name -> fitted estimator) and keep
+    only those that match their original on X_probe. Unsupported models are skipped.
+    """
+    compiled = {}
+    for name, model in models.items():
+        try:
+            if hasattr(model, "estimators_features_"):
+                c = CompiledIsolationForest(model)
+            elif hasattr(model, "get_booster"):
+                c = CompiledXGBoost(model)
+            else:
+                continue
+            columns = list(getattr(model, "feature_names_in_", X_probe.columns))
+            verify(model, c, X_probe.reindex(columns=columns, fill_value=0), atol)
+            compiled[name] = c
+        except Exception as e:
+            print(f"[CompiledTrees] Keeping original {name}: {e}")
+    return compiled
@@ -3,36 +3,122 @@ import pickle
 import time
 import numpy as np
 import pandas as pd
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, Tuple
 from ML.features.feature_extractor import FeatureExtractor
+from ML.training.calibration import apply_calibration
+from ML.core.compiled_trees import compile_models, probe_matrix, verify
+from ML.core.prefilter import load_patterns
+from NLP.core.artifact_registry import ArtifactRegistry, ReleaseWatcher, standard_artifacts
+from NLP.core.response_profiles import resolve_profile, project
+
+def ensemble_scores(iso_forest, logreg, xgb, X: pd.DataFrame, config: Dict[str, Any],
+                    anomaly_threshold: float = None) -> Dict[str, np.ndarray]:
+    """
+    Vectorized version of the score MLFirewall returns for each row of X.
+
+    STAGE 1 (Isolation Forest) runs on every row; rows below the anomaly threshold
+    exit early with the anomaly score. STAGE 2 (LogReg + XGBoost) only runs on the rest.
+    Also used by training (distillation targets), so both sides agree on one definition.
+    """
+    n = len(X)
+    if anomaly_threshold is None:
+        anomaly_threshold = config.get('anomaly_threshold', 0.5)
+
+    # STAGE 1: Anomaly Detection (gain 10 to match training pipeline)
+    anomaly = 1 / (1 + np.exp(iso_forest.score_samples(X) * 10))
+    escalated = anomaly >= anomaly_threshold
+
+    # STAGE 2 only runs on rows that did not exit early
+    logreg_scores = np.zeros(n)
+    xgb_scores = np.zeros(n)
+    idx = np.flatnonzero(escalated)
+    if len(idx):
+        X_esc = X.iloc[idx]
+        logreg_scores[idx] = logreg.predict_proba(X_esc)[:, 1]
+        xgb_scores[idx] = xgb.predict_proba(X_esc)[:, 1]
+
+    # Fixed: Use dynamic weights from config, fallback to 0.5/0.1/0.4 if missing
+    w1, w2, w3 = config.get('weights', (0.5, 0.1, 0.4))
+
+    # --- NEW: High Confidence Override (Surgery Fix) ---
+    # If Anomaly or XGBoost are extremely sure (95%+), we essentially ignore
+    # a 'safe' LogReg score which can be socially engineered.
+    is_extreme_risk = (anomaly > 0.95) | (xgb_scores > 0.95)
+    # Force a higher contribution from the experts, cap the LogReg influence
+    # This prevents the 'Linear Veto' exploit.
+    effective_logreg = np.where(is_extreme_risk & (logreg_scores < 0.1), np.maximum(logreg_scores, 0.5), logreg_scores)
+    ensemble = w1 * anomaly + w2 * effective_logreg + w3 * xgb_scores
+    # Safety floor: An extreme risk signal from either expert should nearly guarantee a block
+    ensemble = np.where(is_extreme_risk, np.maximum(ensemble, 0.85), ensemble)
+
+    return {
+        "final": np.where(escalated, ensemble, anomaly),
+        "anomaly": anomaly,
+        "logreg": logreg_scores,
+        "xgboost": xgb_scores,
+        "escalated": escalated
+    }
 
 class MLFirewall:
-    def __init__(self, model_dir: str = None):
+    def __init__(self, model_dir: str = None, nlp=None, prefilter: bool = True):
         if model_dir is None:
             # Default to parallel models directory
             model_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "models")
             
         self.model_dir = model_dir
-        self.extractor = FeatureExtractor()
+        self.use_prefilter = prefilter
+        self.patterns_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                          "NLP", "data", "patterns", "latest.json")
+        self.extractor = FeatureExtractor(nlp=nlp)
+        # Releases activated through the artifact registry (NLP cli.py checkpoint / rollback)
+        nlp_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "NLP")
+        registry = ArtifactRegistry(os.path.join(nlp_dir, "data", "registry"),
+                                    standard_artifacts(self.patterns_path, os.path.join(nlp_dir, "config", "weights.json"),
+                                                       self.model_dir))
+        self.release_watcher = ReleaseWatcher(registry)
         
         # Flags
         self.is_loaded = False
+        self.student = None
+        self.prefilter = None
+        # Prefilter operating point overrides (gateway: system.yaml `prefilter`), reapplied on reload
+        self.prefilter_policy: Dict[str, Any] = {}
         
         # Load models if they exist
         self._load_models()
 
     def _load_models(self):
+        # Everything is loaded into a new bundle and swapped in with one __dict__ update,
+        # so requests on other threads never mix new feature_names with old models
         try:
-            with open(os.path.join(self.model_dir, "isolation_forest.pkl"), "rb") as f:
-                self.iso_forest = pickle.load(f)
-            with open(os.path.join(self.model_dir, "logistic_regression.pkl"), "rb") as f:
-                self.logreg = pickle.load(f)
-            with open(os.path.join(self.model_dir, "xgboost.pkl"), "rb") as f:
-                self.xgb = pickle.load(f)
-            with open(os.path.join(self.model_dir, "ensemble_config.pkl"), "rb") as f:
-                self.config = pickle.load(f)
-                
-            self.is_loaded = True
+            bundle = {}
+            for attr, name in (("iso_forest", "isolation_forest.pkl"), ("logreg", "logistic_regression.pkl"),
+                               ("xgb", "xgboost.pkl"), ("config", "ensemble_config.pkl")):
+                with open(os.path.join(self.model_dir, name), "rb") as f:
+                    bundle[attr] = pickle.load(f)
+            config = bundle["config"]
+
+            # Optional distilled fast-path model (exported by TrainingPipeline.distill)
+            bundle["student"] = None
+            student_path = os.path.join(self.model_dir, "student.pkl")
+            if config.get('student') and os.path.exists(student_path):
+                with open(student_path, "rb") as f:
+                    bundle["student"] = pickle.load(f)
+
+            bundle.update(self._load_compiled(bundle))
+
+            # Optional parse-free prefilter (exported by TrainingPipeline.train_prefilter)
+            bundle["prefilter"] = None
+            prefilter_path = os.path.join(self.model_dir, "prefilter.pkl")
+            if self.use_prefilter and config.get('prefilter') and os.path.exists(prefilter_path):
+                with open(prefilter_path, "rb") as f:
+                    prefilter = pickle.load(f)
+                prefilter.attach_patterns(*load_patterns(self.patterns_path))
+                self._configure_prefilter(prefilter, config)
+                bundle["prefilter"] = prefilter
+
+            bundle["is_loaded"] = True
+            self.__dict__.update(bundle)
             print(f"[MLFirewall] Models loaded successfully from {self.model_dir}")
         except FileNotFoundError:
             print(f"[MLFirewall] Warning: Models not found in {self.model_dir}. Run training first.")
@@ -41,6 +127,69 @@ class MLFirewall:
             print(f"[MLFirewall] Error loading models: {e}")
             self.is_loaded = False
 
+    def _maybe_reload(self):
+        """Reload the model bundle once a new registry release is activated"""
+        if self.release_watcher.changed():
+            print(f"[MLFirewall] Release {self.release_watcher.registry.current()} activated, reloading models")
+            self._load_models()
+
+    def current_prefilter(self):
+        """The live prefilter, after picking up any newly activated release"""
+        self._maybe_reload()
+        return self.prefilter
+
+    def set_prefilter_policy(self, policy: Dict[str, Any]):
+        """
+        Operating point overrides (max_leak, abstain_rate, audit_rate) for the prefilter.
+        Applied now and again to every prefilter loaded by a later release.
+        """
+        self.prefilter_policy = dict(policy)
+        if self.prefilter is not None:
+            self._configure_prefilter(self.prefilter, self.config)
+
+    def _configure_prefilter(self, prefilter, config):
+        """Bundle max_leak unless the policy overrides it, plus the policy's abstain/audit rates"""
+        policy = self.prefilter_policy
+        max_leak = policy.get('max_leak')
+        if max_leak is None:
+            max_leak = config['prefilter'].get('max_leak')
+        prefilter.configure(max_leak=max_leak, abstain_rate=policy.get('abstain_rate'),
+                            audit_rate=policy.get('audit_rate', 0.0))
+
+    def _load_compiled(self, bundle):
+        """
+        Flat-array versions of the tree models for the request path.
+        Uses the bundle exported at training time when it still matches the pickled
+        models, otherwise compiles them here. Anything that fails verification
+        keeps using the original estimator.
+        """
+        models = {"iso_forest": bundle["iso_forest"], "xgb": bundle["xgb"]}
+        if bundle["student"] is not None:
+            models["student"] = bundle["student"]
+        X_probe = probe_matrix(bundle["config"]['feature_names'])
+
+        compiled = {}
+        path = os.path.join(self.model_dir, "compiled_trees.pkl")
+        if os.path.exists(path):
+            try:
+                with open(path, "rb") as f:
+                    exported = pickle.load(f)
+                for name, c in exported.items():
+                    if name in models:
+                        cols = list(getattr(models[name], "feature_names_in_", X_probe.columns))
+                        verify(models[name], c, X_probe.reindex(columns=cols, fill_value=0))
+                        compiled[name] = c
+            except Exception as e:
+                print(f"[MLFirewall] Exported compiled trees are stale ({e}), recompiling.")
+                compiled = {}
+        missing = {k: v for k, v in models.items() if k not in compiled}
+        if missing:
+            compiled.update(compile_models(missing, X_probe))
+
+        return {"iso_scorer": compiled.get("iso_forest", models["iso_forest"]),
+                "xgb_scorer": compiled.get("xgb", models["xgb"]),
+                "student_scorer": compiled.get("student", bundle["student"])}
+
     def _normalize_anomaly(self, score: float) -> float:
         """
         Normalize Isolation Forest score to 0-1.
@@ -48,101 +197,222 @@ class MLFirewall:
         # Fixed: Using gain 10 to match training pipeline
         return 1 / (1 + np.exp(score * 10))
 
-    def analyze(self, prompt: str, options: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Main inference pipeline"""
+    def analyze(self, prompt: str, options: Dict[str, Any] = None, doc=None) -> Dict[str, Any]:
+        """
+        Main inference pipeline. `doc` is an optional pre-computed spaCy parse.
+        `options['profile']` ('verdict', 'scores', 'full') selects the returned fields;
+        explanations and feature dicts are only built for 'full'.
+        """
         start_time = time.time()
         options = options or {}
+        profile = resolve_profile(options)
+        self._maybe_reload()
+
+        # Stage 0: parse-free prefilter lets confidently benign prompts skip everything
+        audit = None
+        prefilter = self.prefilter
+        if self.is_loaded and prefilter is not None and not options.get('skip_prefilter'):
+            pre = prefilter.check(prompt)
+            if pre['skip']:
+                if not prefilter.should_audit():
+                    return project(self._prefilter_result(pre, start_time, profile), profile)
+                audit = pre
+
+        result = self._analyze(prompt, options, doc, start_time)
+        if audit is not None:
+            prefilter.record_audit(prompt, audit['score'], result['verdict'])
+        return project(result, profile)
+
+    def _analyze(self, prompt: str, options: Dict[str, Any], doc, start_time: float) -> Dict[str, Any]:
+        # Fast path: distilled student on parse-free features, unless it is unsure
+        if self.is_loaded and self._student_enabled(options):
+            student_res = self._student_results([prompt], options, start_time)[0]
+            if student_res is not None:
+                return student_res
         
         # Features
-        features = self.extractor.extract_all(prompt)
+        if doc is not None:
+            features = self.extractor.extract_from_doc(prompt or " ", doc)
+        else:
+            features = self.extractor.extract_all(prompt)
         
         if not self.is_loaded:
-             return {
-                "verdict": "pass",
-                "score": 0.0,
-                "stage": "error",
-                "message": "Models not loaded - Training required",
-                "latency_ms": (time.time() - start_time) * 1000
+             return self._not_loaded_result(start_time)
+
+        X = self._build_matrix([features])
+        return self._score_rows(X, [features], options, start_time)[0]
+
+    def analyze_batch(self, prompts: List[str], options: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """
+        Batched inference. Prompts are parsed with nlp.pipe and every model is
+        called once on the whole matrix instead of once per prompt.
+        Reported latency_ms is the amortized per-prompt cost.
+        """
+        start_time = time.time()
+        options = options or {}
+        profile = resolve_profile(options)
+        if not prompts:
+            return []
+        self._maybe_reload()
+
+        if not self.is_loaded:
+            return [project(self._not_loaded_result(start_time), profile) for _ in prompts]
+
+        results = [None] * len(prompts)
+        # Sampled skips go through the full pipeline and are audited, as in analyze()
+        audits = {}
+        prefilter = self.prefilter
+        if prefilter is not None and not options.get('skip_prefilter'):
+            for i, p in enumerate(prompts):
+                pre = prefilter.check(p)
+                if pre['skip']:
+                    if prefilter.should_audit():
+                        audits[i] = pre
+                    else:
+                        results[i] = self._prefilter_result(pre, start_time, profile)
+
+        remaining = [i for i, r in enumerate(results) if r is None]
+        if remaining and self._student_enabled(options):
+            student = self._student_results([prompts[i] for i in remaining], options, start_time)
+            for i, res in zip(remaining, student):
+                results[i] = res
+
+        # Only prompts inside the student's uncertainty band get parsed and fully scored
+        pending = [i for i, r in enumerate(results) if r is None]
+        if pending:
+            features_list = self.extractor.extract_batch([prompts[i] for i in pending])
+            X = self._build_matrix(features_list)
+            for i, res in zip(pending, self._score_rows(X, features_list, options, start_time)):
+                results[i] = res
+        for i, pre in audits.items():
+            prefilter.record_audit(prompts[i], pre['score'], results[i]['verdict'])
+        return [project(r, profile) for r in results]
+
+    def _student_enabled(self, options: Dict[str, Any]) -> bool:
+        if self.student is None or options.get('full_ensemble'):
+            return False
+        # The uncertainty band was fit around the trained thresholds; custom ones bypass it
+        if 'anomaly_threshold' in options:
+            return False
+        try:
+            return float(options.get('threshold', self.config['threshold'])) == float(self.config['threshold'])
+        except (TypeError, ValueError):
+            return False
+
+    def _student_results(self, prompts: List[str], options: Dict[str, Any], start_time: float) -> List[Dict[str, Any]]:
+        """Student verdicts for confident prompts, None where the full ensemble must decide"""
+        cfg = self.config['student']
+        cheap = [self.extractor.extract_cheap(p) for p in prompts]
+        X = pd.DataFrame([[f.get(k, 0) for k in cfg['features']] for f in cheap], columns=cfg['features'], dtype=float)
+        scores = np.clip(self.student_scorer.predict(X), 0.0, 1.0)
+        low, high = cfg['band']
+        threshold = float(self.config['threshold'])
+        full = resolve_profile(options) == "full"
+
+        latency = (time.time() - start_time) * 1000 / len(prompts)
+        results = []
+        for features, score in zip(cheap, scores):
+            if low <= score <= high:
+                results.append(None)
+                continue
+            score = float(score)
+            verdict = "block" if score > threshold else "pass"
+            result = {
+                "verdict": verdict,
+                "score": score,
+                "stage": "student",
+                "latency_ms": latency
             }
+            if full:
+                result["explanation"] = self._explain_verdict(verdict, score, features, threshold)
+                result["features"] = features
+            results.append(result)
+        return results
 
+    def _prefilter_result(self, pre: Dict[str, Any], start_time: float, profile: str = "full") -> Dict[str, Any]:
+        result = {
+            "verdict": "pass",
+            "score": pre['score'],
+            "stage": "prefilter",
+            "latency_ms": (time.time() - start_time) * 1000
+        }
+        if profile == "full":
+            result["explanation"] = f"Passed: Confidently benign (Risk: {pre['score']:.3f}, Prefilter threshold: {self.prefilter.threshold:.3f})"
+            result["features"] = {}
+        return result
+
+    def _not_loaded_result(self, start_time: float) -> Dict[str, Any]:
+        return {
+            "verdict": "pass",
+            "score": 0.0,
+            "stage": "error",
+            "message": "Models not loaded - Training required",
+            "latency_ms": (time.time() - start_time) * 1000
+        }
+
+    def _build_matrix(self, features_list: List[Dict[str, Any]]) -> pd.DataFrame:
         if hasattr(self, 'config') and isinstance(self.config, dict) and self.config.get('feature_names'):
             cols = self.config['feature_names']
-            row_data = [features.get(k, 0) for k in cols]
-            X = pd.DataFrame([row_data], columns=cols)
+            rows = [[features.get(k, 0) for k in cols] for features in features_list]
         else:
-            sorted_keys = sorted(features.keys())
-            row_data = [features[k] for k in sorted_keys]
-            X = pd.DataFrame([row_data], columns=sorted_keys)
+            cols = sorted(features_list[0].keys())
+            rows = [[features[k] for k in cols] for features in features_list]
+        return pd.DataFrame(rows, columns=cols)
 
-        # STAGE 1: Anomaly Detection
-        raw_anomaly = self.iso_forest.score_samples(X)[0] 
-        anomaly_score_norm = self._normalize_anomaly(raw_anomaly)
-        
+    def _score_rows(self, X: pd.DataFrame, features_list: List[Dict[str, Any]],
+                    options: Dict[str, Any], start_time: float) -> List[Dict[str, Any]]:
+        n = len(features_list)
         anomaly_threshold = options.get('anomaly_threshold', self.config.get('anomaly_threshold', 0.5))
+        scores = ensemble_scores(self.iso_scorer, self.logreg, self.xgb_scorer, X, self.config, anomaly_threshold)
 
-        # Early exit
-        if anomaly_score_norm < anomaly_threshold:
-            latency = (time.time() - start_time) * 1000
-            return {
-                "verdict": "pass",
-                "score": float(anomaly_score_norm),
-                "stage": "anomaly_filter",
-                "latency_ms": latency,
-                "explanation": f"Passed: Low Anomaly ({anomaly_score_norm:.2f})",
-                "features": features
-            }
-            
-        # STAGE 2: Intent Ensemble
-        logreg_score = self.logreg.predict_proba(X)[0, 1]
-        xgb_score = self.xgb.predict_proba(X)[0, 1]
-        
-        # Fixed: Use dynamic weights from config, fallback to 0.5/0.1/0.4 if missing
-        w1, w2, w3 = self.config.get('weights', (0.5, 0.1, 0.4))
-        
-        # --- NEW: High Confidence Override (Surgery Fix) ---
-        # If Anomaly or XGBoost are extremely sure (95%+), we essentially ignore 
-        # a 'safe' LogReg score which can be socially engineered.
-        is_extreme_risk = anomaly_score_norm > 0.95 or xgb_score > 0.95
-        
-        if is_extreme_risk:
-             # Force a higher contribution from the experts, cap the LogReg influence
-             # This prevents the 'Linear Veto' exploit.
-             effective_logreg = max(logreg_score, 0.5) if logreg_score < 0.1 else logreg_score
-             final_score = (w1 * anomaly_score_norm + w2 * effective_logreg + w3 * xgb_score)
-             # Safety floor: An extreme risk signal from either expert should nearly guarantee a block
-             final_score = max(final_score, 0.85) 
-        else:
-             final_score = (
-                w1 * anomaly_score_norm +
-                w2 * logreg_score +
-                w3 * xgb_score
-             )
-        
         threshold_val = options.get('threshold', self.config.get('threshold', 0.7))
         try:
             threshold = float(threshold_val)
         except:
             threshold = 0.7
-            
-        verdict = "block" if final_score > threshold else "pass"
-        
-        latency = (time.time() - start_time) * 1000
-        
-        explanation = self._explain_verdict(verdict, final_score, features, threshold)
-        
-        return {
-            "verdict": verdict,
-            "score": float(final_score),
-            "stage": "intent_ensemble",
-            "breakdown": {
-                "anomaly_norm": float(anomaly_score_norm),
-                "logreg": float(logreg_score),
-                "xgboost": float(xgb_score)
-            },
-            "latency_ms": latency,
-            "explanation": explanation,
-            "features": features
-        }
+
+        full = resolve_profile(options) == "full"
+        latency = (time.time() - start_time) * 1000 / n
+        results = []
+        for i, features in enumerate(features_list):
+            anomaly_score_norm = float(scores['anomaly'][i])
+
+            # Early exit
+            if not scores['escalated'][i]:
+                result = {
+                    "verdict": "pass",
+                    "score": anomaly_score_norm,
+                    "stage": "anomaly_filter",
+                    "latency_ms": latency
+                }
+                if full:
+                    result["explanation"] = f"Passed: Low Anomaly ({anomaly_score_norm:.2f})"
+                    result["features"] = features
+                results.append(result)
+                continue
+
+            final_score = float(scores['final'][i])
+            verdict = "block" if final_score > threshold else "pass"
+
+            result = {
+                "verdict": verdict,
+                "score": final_score,
+                "stage": "intent_ensemble",
+                "breakdown": {
+                    "anomaly_norm": anomaly_score_norm,
+                    "logreg": float(scores['logreg'][i]),
+                    "xgboost": float(scores['xgboost'][i])
+                },
+                "latency_ms": latency
+            }
+            if full:
+                result["explanation"] = self._explain_verdict(verdict, final_score, features, threshold)
+                result["features"] = features
+            # Calibrated attack probability, when training produced a calibration
+            if self.config.get('calibration'):
+                result["probability"] = float(apply_calibration(final_score, self.config['calibration']))
+            results.append(result)
+        return results
 
     def _explain_verdict(self, verdict: str, score: float, features: dict, threshold: float) -> str:
         if verdict == "pass":
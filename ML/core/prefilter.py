@@ -0,0 +1,269 @@
+"""
+Parse-free prefilter that runs before any spaCy call.
+
+Short benign chat ("write a poem about trees") is most of the traffic, and every
+such prompt used to pay for a full parse in both layers. The prefilter scores a
+prompt from string-level signals only:
+
+- StatisticalExtractor-style counts (length, word stats, special chars, delimiters)
+- the regex fast-fail patterns and the trigram index from the NLP pattern DB
+- every behavioral marker list, matched in one pass by a single compiled alternation
+- a tiny logistic model trained by TrainingPipeline.train_prefilter
+
+Prompts it is confident are benign skip parsing and the ML layer; in the integrated
+gateway the NLP layer's parse-free stages (regex and trigrams, per-user overlays
+included) still run and send any hit through the full pipeline. Anything else (and
+any regex hit) abstains and goes through the full pipeline. A small share of
+skipped prompts is audited against the full pipeline to track its recall.
+"""
+
+import os
+import re
+import json
+import random
+import threading
+import numpy as np
+from collections import Counter
+from typing import Dict, Any, List, Optional, Iterable
+from NLP.core.normalizer import normalize, fold_phrase
+
+DELIMITERS = "-_=|:;,.\\/<>[]{}()?!*#@$%^&+"
+# Groups that look for obfuscation itself, matched on the unfolded lowercase view
+LITERAL_GROUPS = ("leet",)
+
+STAT_FEATURES = [
+    "char_count", "word_count", "avg_word_length", "repetition_ratio",
+    "special_char_ratio", "delimiter_count", "trigram_matches", "regex_hit"
+]
+
+
+class MarkerAutomaton:
+    """
+    All marker phrases of all groups in one compiled alternation (longest first).
+    count() returns, per group, how many distinct markers of that group occur in the
+    folded text (LITERAL_GROUPS are matched on the plain lowercase text instead).
+    """
+
+    def __init__(self, groups: Dict[str, Iterable[str]]):
+        self.groups = {name: sorted(set(m.lower() for m in markers)) for name, markers in groups.items()}
+        self.owners: Dict[str, List[str]] = {}
+        self.literal_owners: Dict[str, List[str]] = {}
+        for name, markers in self.groups.items():
+            owners = self.literal_owners if name in LITERAL_GROUPS else self.owners
+            for m in markers:
+                owners.setdefault(m, []).append(name)
+        self.pattern = self._compile(self.owners)
+        self.literal_pattern = self._compile(self.literal_owners)
+
+    @staticmethod
+    def _compile(owners):
+        phrases = sorted(owners, key=len, reverse=True)
+        return re.compile("|".join(re.escape(p) for p in phrases)) if phrases else None
+
+    def count(self, text_folded: str, text_lower: Optional[str] = None) -> Dict[str, int]:
+        counts = dict.fromkeys(self.groups, 0)
+        for pattern, owners, text in ((self.pattern, self.owners, text_folded),
+                                      (self.literal_pattern, self.literal_owners,
+                                       text_folded if text_lower is None else text_lower)):
+            if pattern is None:
+                continue
+            for marker in set(pattern.findall(text)):
+                for name in owners[marker]:
+                    counts[name] += 1
+        return counts
+
+    def __getstate__(self):
+        return {"groups": self.groups}
+
+    def __setstate__(self, state):
+        self.__init__(state["groups"])
+
+
+class Prefilter:
+    def __init__(self, marker_groups: Dict[str, Iterable[str]], trigrams: Iterable[str] = (),
+                 regexes: Iterable[str] = ()):
+        self.automaton = MarkerAutomaton(marker_groups)
+        self.feature_names = STAT_FEATURES + [f"markers_{g}" for g in self.automaton.groups]
+        self.model: Optional[Dict[str, Any]] = None
+        self.curve: Optional[Dict[str, np.ndarray]] = None
+        self.threshold = 0.0
+        self.audit_rate = 0.0
+        self.attach_patterns(trigrams, regexes)
+        self._init_stats()
+
+    # ------------------------------------------------------------------
+    # Patterns are attached at load time so they follow the live pattern DB
+    # ------------------------------------------------------------------
+    def attach_patterns(self, trigrams: Iterable[str] = (), regexes: Iterable[str] = ()):
+        self.trigrams = {fold_phrase(t) for t in trigrams}
+        self.regexes = []
+        for p in regexes:
+            try:
+                self.regexes.append(re.compile(p, re.IGNORECASE))
+            except re.error:
+                print(f"[Prefilter] Invalid regex pattern ignored: {p}")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("trigrams", "regexes", "_lock", "_stats"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach_patterns()
+        self._init_stats()
+
+    # ------------------------------------------------------------------
+    # Features / scoring
+    # ------------------------------------------------------------------
+    def features(self, prompt: str) -> Dict[str, float]:
+        prompt = prompt or ""
+        norm = normalize(prompt)
+        words = norm.tokens
+        folded_words = norm.folded_tokens
+        n_words = len(words)
+
+        feats = {
+            "char_count": len(prompt),
+            "word_count": n_words,
+            "avg_word_length": sum(len(w) for w in words) / n_words if n_words else 0,
+            "repetition_ratio": Counter(norm.lower_tokens).most_common(1)[0][1] / n_words if n_words else 0,
+            "special_char_ratio": sum(1 for c in prompt if not c.isalnum() and c != ' ') / len(prompt) if prompt else 0,
+            "delimiter_count": sum(1 for c in prompt if c in DELIMITERS),
+            "trigram_matches": sum(1 for i in range(n_words - 2)
+                                   if ' '.join(folded_words[i:i + 3]) in self.trigrams),
+            "regex_hit": int(any(r.search(prompt) for r in self.regexes)),
+        }
+        for group, count in self.automaton.count(norm.folded, norm.lower).items():
+            feats[f"markers_{group}"] = count
+        return feats
+
+    def matrix(self, prompts: List[str]) -> np.ndarray:
+        return np.array([[f[k] for k in self.feature_names] for f in map(self.features, prompts)], dtype=float)
+
+    def score_matrix(self, X: np.ndarray) -> np.ndarray:
+        """P(attack) from the linear model (coefficients already include feature scaling)"""
+        z = X @ self.model["coef"] + self.model["intercept"]
+        return 1.0 / (1.0 + np.exp(-z))
+
+    # ------------------------------------------------------------------
+    # Operating point
+    # ------------------------------------------------------------------
+    def configure(self, max_leak: Optional[float] = None, abstain_rate: Optional[float] = None,
+                  threshold: Optional[float] = None, audit_rate: Optional[float] = None):
+        """
+        Pick the skip threshold from the validation curve saved at training time.
+
+        - max_leak: highest share of positives (attacks or full-pipeline blocks) allowed to skip
+        - abstain_rate: minimum share of all traffic that must still go through the full pipeline
+        - threshold: explicit score cut, overrides both
+        The strictest of the given constraints wins.
+        """
+        if audit_rate is not None:
+            self.audit_rate = float(audit_rate)
+        if threshold is not None:
+            self.threshold = float(threshold)
+            return self.threshold
+        if self.curve is None or (max_leak is None and abstain_rate is None):
+            return self.threshold
+
+        t, leak, skip = self.curve["thresholds"], self.curve["leak_rate"], self.curve["skip_rate"]
+        allowed = np.ones(len(t), dtype=bool)
+        if max_leak is not None:
+            allowed &= leak <= max_leak
+        if abstain_rate is not None:
+            allowed &= skip <= 1.0 - abstain_rate
+        self.threshold = float(t[allowed].max()) if allowed.any() else 0.0
+        return self.threshold
+
+    # ------------------------------------------------------------------
+    # Request path
+    # ------------------------------------------------------------------
+    def check(self, prompt: str) -> Dict[str, Any]:
+        """{'skip': True} when the prompt is confidently benign and may bypass parsing"""
+        feats = self.features(prompt)
+        if feats["regex_hit"]:
+            decision = {"skip": False, "score": 1.0, "reason": "regex"}
+        elif self.model is None:
+            decision = {"skip": False, "score": None, "reason": "untrained"}
+        else:
+            x = np.array([feats[k] for k in self.feature_names], dtype=float)
+            score = float(self.score_matrix(x[None, :])[0])
+            skip = score < self.threshold
+            decision = {"skip": skip, "score": score, "reason": "confident_benign" if skip else "abstain"}
+
+        with self._lock:
+            self._stats["seen"] += 1
+            self._stats["skipped" if decision["skip"] else "abstained"] += 1
+        return decision
+
+    def record_screen_hit(self):
+        """A skip overruled by the NLP layer's parse-free stages (user regex / trigram hit)"""
+        with self._lock:
+            self._stats["skipped"] -= 1
+            self._stats["abstained"] += 1
+            self._stats["screen_hits"] += 1
+
+    def should_audit(self) -> bool:
+        return self.audit_rate > 0 and random.random() < self.audit_rate
+
+    def record_audit(self, prompt: str, score: float, verdict: str):
+        """
+        Outcome of running the full pipeline on a prompt the prefilter would have skipped.
+        Any verdict but 'pass' (block or review, from the cascade or the ML layer alone) is a miss.
+        """
+        full_flagged = verdict != "pass"
+        with self._lock:
+            self._stats["audited"] += 1
+            self._stats["audit_misses"] += int(full_flagged)
+        if full_flagged:
+            print(f"⚠️ [Prefilter] Would have skipped a prompt the full pipeline flagged "
+                  f"(score {score:.3f} < {self.threshold:.3f}): {prompt[:80]!r}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+        s["skip_rate"] = s["skipped"] / s["seen"] if s["seen"] else 0.0
+        # Share of audited skips the full pipeline agreed were benign
+        s["audit_agreement"] = 1 - s["audit_misses"] / s["audited"] if s["audited"] else None
+        s["threshold"] = self.threshold
+        return s
+
+    def _init_stats(self):
+        self._lock = threading.Lock()
+        self._stats = {"seen": 0, "skipped": 0, "abstained": 0, "audited": 0, "audit_misses": 0,
+                       "screen_hits": 0}
+
+
+def load_patterns(path: str):
+    """(trigrams, regexes) from an NLP pattern file such as NLP/data/patterns/latest.json"""
+    if not os.path.exists(path):
+        return [], []
+    with open(path, 'r') as f:
+        patterns = json.load(f).get('global_patterns', {})
+    return patterns.get('trigrams', []), patterns.get('regex_exact', [])
+
+
+def skip_curve(scores: np.ndarray, positive: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    For every candidate cut t (skip when score < t): share of positives that would
+    skip (leak_rate) and share of all prompts that would skip (skip_rate).
+    Thresholds ascend; t = 0 skips nothing.
+    """
+    order = np.argsort(scores, kind="mergesort")
+    s = scores[order]
+    pos = positive[order].astype(np.int64)
+    n, n_pos = len(s), max(int(pos.sum()), 1)
+
+    # Cut just above each distinct score: everything up to and including it skips
+    distinct = np.r_[s[1:] != s[:-1], True]
+    upto = np.flatnonzero(distinct)
+    thresholds = np.nextafter(s[upto], np.inf)
+    leak = np.cumsum(pos)[upto] / n_pos
+    skip = (upto + 1) / n
+    return {
+        "thresholds": np.r_[0.0, thresholds],
+        "leak_rate": np.r_[0.0, leak],
+        "skip_rate": np.r_[0.0, skip],
+    }
@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Dict, Any, Optional, List, Tuple
+
+import numpy as np
+
+from ML.core.prefilter import MarkerAutomaton
+from NLP.core.normalizer import normalize
+
+# Phrases that steer a conversation across turns. Kept apart from the feature extractor's
+# marker lists, whose single words ("first", "manager", "character", "scenario") are common
+# in benign chats. Override with `sessions.steering_phrases` in system.yaml.
+STEERING_PHRASES = {
+    "stay_in_character": ["stay in character", "remain in character", "don't break character",
+                          "do not break character", "stay in role"],
+    "override": ["ignore previous", "ignore all previous", "ignore your previous", "disregard previous",
+                 "forget your instructions", "forget previous instructions"],
+    "continuation": ["continue from", "continue where you left off", "pick up where", "as we agreed earlier"],
+    "role_play": ["pretend you are", "act as if you are", "you are now", "from now on you are",
+                  "roleplay as", "simulate being", "answer as if you were"],
+}
+
+
+# Sessions are namespaced by the caller's user_id: conversation ids are client-chosen,
+# so one tenant must not be able to read, feed or end another tenant's conversation.
+SessionKey = Tuple[Optional[str], str]
+
+
+class SessionStore:
+    """
+    Per-conversation state keyed by (user_id, conversation_id), with a TTL and a
+    size cap (oldest-touched evicted first). Same bounded OrderedDict approach as
+    the shadow task store.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: "OrderedDict[SessionKey, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, key: SessionKey, factory) -> Dict[str, Any]:
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(key)
+            if session is None:
+                session = factory()
+                self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            session["touched_at"] = time.time()
+            return session
+
+    def get(self, key: SessionKey) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._evict()
+            return self._sessions.get(key)
+
+    def delete(self, key: SessionKey) -> bool:
+        with self._lock:
+            return self._sessions.pop(key, None) is not None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "max_sessions": self.max_sessions, "ttl_seconds": self.ttl}
+
+    def _evict(self):
+        """Drop idle sessions, then the least recently touched over the cap. Caller holds the lock."""
+        now = time.time()
+        while self._sessions:
+            _, oldest = next(iter(self._sessions.items()))
+            if now - oldest["touched_at"] <= self.ttl and len(self._sessions) < self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+
+class SessionTracker:
+    """
+    Rolling conversation-level signals for session-aware analysis.
+
+    Only the new turn is analyzed; its outcome is folded into fixed-size
+    accumulators (per-turn trigram hits and steering phrases over the last `window`
+    turns, score window, EWMA), so per-turn cost does not grow with the conversation
+    and a signal stops counting once it leaves the window. Escalation is flagged when:
+
+    - rising:      scores over the last `window` turns trend up by `slope_threshold` per turn
+    - sustained:   the score EWMA crosses `ewma_threshold`
+    - accumulated: trigram hits over the last `window` turns reach `max_trigram_hits`
+    - persistent:  steering phrases ("stay in character", "ignore previous", ...) occur in
+                   `persistent_turns` of the last `window` turns
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        config = config or {}
+        self.store = SessionStore(config.get("max_sessions", 10000), config.get("ttl_seconds", 1800))
+        self.automaton = MarkerAutomaton(config.get("steering_phrases") or STEERING_PHRASES)
+        self.window = config.get("window", 6)
+        self.slope_threshold = config.get("slope_threshold", 0.05)
+        self.min_rising_score = config.get("min_rising_score", 0.3)
+        self.ewma_alpha = config.get("ewma_alpha", 0.5)
+        self.ewma_threshold = config.get("ewma_threshold", 0.45)
+        self.max_trigram_hits = config.get("max_trigram_hits", 6)
+        self.persistent_turns = config.get("persistent_turns", 3)
+        self.escalation_verdict = config.get("escalation_verdict", "review")
+
+    def _new_session(self) -> Dict[str, Any]:
+        now = time.time()
+        return {
+            "created_at": now,
+            "touched_at": now,
+            "turns": 0,
+            "trigram_hits": deque(maxlen=self.window),
+            "steering": deque(maxlen=self.window),
+            "scores": deque(maxlen=self.window),
+            "ewma": 0.0,
+            "max_score": 0.0,
+            "blocked_turns": 0,
+            "escalated_at_turn": None,
+            "lock": threading.Lock(),
+        }
+
+    def record(self, conversation_id: str, prompt: str, turn_result: Dict[str, Any],
+               user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Fold one analyzed turn into the user's session and return the conversation-level view"""
+        score = turn_score(turn_result)
+        nlp = turn_result.get("layers", {}).get("nlp") or {}
+        trigram_hits = len(nlp.get("matched_patterns", []))
+        norm = normalize(prompt)
+        markers = {g: c for g, c in self.automaton.count(norm.folded, norm.lower).items() if c}
+
+        session = self.store.get_or_create((user_id, conversation_id), self._new_session)
+        with session["lock"]:
+            session["turns"] += 1
+            session["trigram_hits"].append(trigram_hits)
+            session["steering"].append(markers)
+            session["scores"].append(score)
+            session["ewma"] = score if session["turns"] == 1 else (
+                self.ewma_alpha * score + (1 - self.ewma_alpha) * session["ewma"])
+            session["max_score"] = max(session["max_score"], score)
+            session["blocked_turns"] += int(turn_result.get("verdict") == "block")
+
+            reasons = self._escalation(session)
+            if reasons and session["escalated_at_turn"] is None:
+                session["escalated_at_turn"] = session["turns"]
+            return {**self._snapshot(session), "turn_score": score, "escalation": reasons}
+
+    def get(self, conversation_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Session snapshot; None unless it exists under this user_id"""
+        session = self.store.get((user_id, conversation_id))
+        if session is None:
+            return None
+        with session["lock"]:
+            return self._snapshot(session)
+
+    def delete(self, conversation_id: str, user_id: Optional[str] = None) -> bool:
+        return self.store.delete((user_id, conversation_id))
+
+    def _escalation(self, session) -> List[str]:
+        reasons = []
+        scores = np.array(session["scores"], dtype=float)
+        if len(scores) >= 3:
+            slope = np.polyfit(np.arange(len(scores)), scores, 1)[0]
+            if slope >= self.slope_threshold and scores[-1] >= self.min_rising_score:
+                reasons.append("rising")
+        if session["turns"] >= 2 and session["ewma"] >= self.ewma_threshold:
+            reasons.append("sustained")
+        if sum(session["trigram_hits"]) >= self.max_trigram_hits:
+            reasons.append("accumulated")
+        if sum(1 for markers in session["steering"] if markers) >= self.persistent_turns:
+            reasons.append("persistent")
+        return reasons
+
+    def _snapshot(self, session) -> Dict[str, Any]:
+        return {
+            "turns": session["turns"],
+            # Over the last `window` turns
+            "trigram_hits": sum(session["trigram_hits"]),
+            "steering_turns": sum(1 for markers in session["steering"] if markers),
+            "markers": dict(sum((Counter(m) for m in session["steering"]), Counter())),
+            "score_window": [round(s, 4) for s in session["scores"]],
+            "ewma": session["ewma"],
+            "max_score": session["max_score"],
+            "blocked_turns": session["blocked_turns"],
+            "escalated_at_turn": session["escalated_at_turn"],
+            "age_seconds": time.time() - session["created_at"],
+        }
+
+
+def turn_score(result: Dict[str, Any]) -> float:
+    """Risk of a single turn: the highest score any layer gave it"""
+    scores = [result.get("final_score") or 0.0]
+    for layer in ("nlp", "ml"):
+        s = (result.get("layers", {}).get(layer) or {}).get("score")
+        if isinstance(s, (int, float)):
+            scores.append(float(s))
+    return max(scores)
@@ -0,0 +1,188 @@
+import json
+import time
+import threading
+import urllib.parse
+import urllib.request
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, Callable, Iterable
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """An allowlisted callback host must not bounce the POST somewhere else"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+_callback_opener = urllib.request.build_opener(_NoRedirect)
+
+
+class ShadowScorer:
+    """
+    Background ML scoring for requests that already received an NLP verdict.
+
+    Tasks run on a small worker pool. Pending tasks are tracked apart from finished
+    ones and never evicted; each finished task is kept (bounded, TTL) so callers can
+    poll it by id, and can optionally be pushed to a Python callback or POSTed to a
+    callback URL (only to allowlisted hosts). Callbacks run on their own small pool,
+    so a slow callback host never holds up a scoring worker. Borderline
+    NLP verdicts are written to the ReviewQueue from the worker, with the ML
+    signal attached, so the request path never waits on the queue file; tasks
+    that are dropped or fail are still queued, without it.
+    """
+
+    def __init__(self, ml_firewall, review_queue=None, workers: int = 2,
+                 max_pending: int = 1000, max_results: int = 10000, result_ttl: float = 600.0,
+                 callback_hosts: Iterable[str] = (), callback_schemes: Iterable[str] = ("https",),
+                 callback_workers: int = 2):
+        self.ml_firewall = ml_firewall
+        self.review_queue = review_queue
+        # callback_url is client-supplied: the server only POSTs to these hosts
+        self.callback_hosts = {h.lower() for h in callback_hosts}
+        self.callback_schemes = {s.lower() for s in callback_schemes}
+        self.max_pending = max_pending
+        self.max_results = max_results
+        self.result_ttl = result_ttl
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ml-shadow")
+        self._callback_executor = ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix="ml-shadow-callback")
+        # Pending tasks (at most max_pending) live apart from finished ones, so eviction
+        # can never drop a task whose callback has not fired yet
+        self._pending_tasks: Dict[str, Dict[str, Any]] = {}
+        self._tasks: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._callbacks_pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, prompt: str, nlp_result: Dict[str, Any], options: Dict[str, Any] = None, doc=None,
+               callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+               callback_url: Optional[str] = None) -> str:
+        """Schedule ML scoring. Returns a task id usable with get()."""
+        if callback_url:
+            self.check_callback_url(callback_url)
+        task_id = uuid.uuid4().hex
+        task = {
+            "id": task_id,
+            "status": "pending",
+            "nlp_classification": nlp_result.get('classification'),
+            "submitted_at": time.time()
+        }
+
+        with self._lock:
+            # Backpressure: never let shadow work pile up behind the request path
+            dropped = len(self._pending_tasks) >= self.max_pending
+            if dropped:
+                task["status"] = "dropped"
+                self._store(task)
+            else:
+                self._pending_tasks[task_id] = task
+
+        if dropped:
+            # The NLP layer skipped its own queue write; do it here, without ML signal
+            self._enqueue_review(prompt, nlp_result, {"status": "dropped"})
+            return task_id
+
+        self._executor.submit(self._run, task_id, prompt, nlp_result, options or {}, doc, callback, callback_url)
+        return task_id
+
+    def check_callback_url(self, url: str):
+        """ValueError unless the URL's scheme and host are allowlisted (`shadow` in system.yaml)"""
+        parsed = urllib.parse.urlsplit(url)
+        host = (parsed.hostname or "").lower()
+        if parsed.scheme.lower() not in self.callback_schemes or host not in self.callback_hosts:
+            raise ValueError(f"callback_url '{parsed.scheme}://{host}' is not allowed "
+                             f"(shadow.callback_hosts / shadow.callback_schemes)")
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            task = self._pending_tasks.get(task_id) or self._tasks.get(task_id)
+            return dict(task) if task else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            counts = {"pending": len(self._pending_tasks), "stored": len(self._tasks),
+                      "callbacks_pending": self._callbacks_pending}
+        return counts
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+        self._callback_executor.shutdown(wait=wait)
+
+    def _run(self, task_id, prompt, nlp_result, options, doc, callback, callback_url):
+        start_time = time.time()
+        try:
+            ml_res = self.ml_firewall.analyze(prompt, options=options, doc=doc)
+            update = {"status": "done", "ml": ml_res}
+            ml_signal = {k: ml_res.get(k) for k in ("verdict", "score", "stage", "breakdown")}
+        except Exception as e:
+            update = {"status": "failed", "error": str(e)}
+            ml_signal = {"status": "failed", "error": str(e)}
+        if self._enqueue_review(prompt, nlp_result, ml_signal):
+            update["enqueued_for_review"] = True
+        update["latency_ms"] = (time.time() - start_time) * 1000
+
+        with self._lock:
+            task = self._pending_tasks.pop(task_id)
+            task.update(update)
+            task["completed_at"] = time.time()
+            self._store(task)
+            snapshot = dict(task)
+            notify = callback is not None or bool(callback_url)
+            # Slow callback hosts back up the callback pool, not the scoring workers
+            overloaded = notify and self._callbacks_pending >= self.max_pending
+            notify = notify and not overloaded
+            if notify:
+                self._callbacks_pending += 1
+
+        if overloaded:
+            print(f"⚠️ [Shadow] Callback queue full, result of {task_id} kept for polling only")
+        if notify:
+            self._callback_executor.submit(self._notify, snapshot, callback, callback_url)
+
+    def _enqueue_review(self, prompt: str, nlp_result: Dict[str, Any], ml_signal: Dict[str, Any]) -> bool:
+        """Borderline NLP verdicts go to the ReviewQueue whatever happened to the ML task"""
+        if nlp_result.get('classification') != 'borderline' or self.review_queue is None:
+            return False
+        try:
+            self.review_queue.enqueue(prompt, nlp_result['score'], nlp_result.get('features', {}),
+                                      extra={"ml": ml_signal})
+            return True
+        except Exception as e:
+            print(f"❌ [Shadow] Review queue write failed: {e}")
+            return False
+
+    def _notify(self, task, callback, callback_url):
+        try:
+            self._deliver(task, callback, callback_url)
+        finally:
+            with self._lock:
+                self._callbacks_pending -= 1
+
+    def _deliver(self, task, callback, callback_url):
+        if callback is not None:
+            try:
+                callback(task)
+            except Exception as e:
+                print(f"❌ [Shadow] Callback failed for {task['id']}: {e}")
+        if callback_url:
+            try:
+                body = json.dumps(task, default=str).encode("utf-8")
+                req = urllib.request.Request(callback_url, data=body, headers={"Content-Type": "application/json"})
+                _callback_opener.open(req, timeout=5).close()
+            except Exception as e:
+                print(f"❌ [Shadow] Callback POST to {callback_url} failed: {e}")
+
+    def _store(self, task):
+        """Keep a finished (or dropped) task for polling. Caller holds the lock."""
+        self._evict()
+        self._tasks[task["id"]] = task
+
+    def _evict(self):
+        """Drop expired results, then oldest ones over the cap. Caller holds the lock."""
+        now = time.time()
+        while self._tasks:
+            _, oldest = next(iter(self._tasks.items()))
+            expired = now - oldest.get("completed_at", oldest["submitted_at"]) > self.result_ttl
+            if not expired and len(self._tasks) < self.max_results:
+                break
+            self._tasks.popitem(last=False)
@@ -1,19 +1,31 @@
-import spacy
 import numpy as np
 import re
-from textstat import flesch_kincaid_grade
 from typing import Dict, List, Any
+from NLP.extractors.syntax_kernel import syntax_stats, NEGATION_WORDS, CONDITIONAL_WORDS
+from NLP.core.spacy_profiles import load_profile
+from NLP.core.normalizer import normalize
+from NLP.extractors.text_stats import char_stats
+
+# Features computable from the raw string alone (used by the distilled fast-path model)
+CHEAP_FEATURES = [
+    "authority_count", "delimiter_count", "formatting_pressure_count", "hypothetical_count",
+    "hypothetical_framing", "indirect_request_count", "justification_ratio", "leetspeak_detected",
+    "multi_turn_setup", "politeness_score", "role_play_detected", "safety_keyword_density",
+    "special_char_ratio", "urgency_markers"
+]
 
 class FeatureExtractor:
-    def __init__(self):
-        # Load the same model as NLP module for consistency, but standalone
-        try:
-            self.nlp = spacy.load("en_core_web_md")
-        except OSError:
-            print("Downloading spacy model en_core_web_md...")
-            from spacy.cli import download
-            download("en_core_web_md")
-            self.nlp = spacy.load("en_core_web_md")
+    # Bump whenever feature definitions change; invalidates cached training features
+    VERSION = 3
+
+    def __init__(self, nlp=None, profile="ml"):
+        # Load the same model as NLP module for consistency, but standalone.
+        # An injected pipeline lets the integrated gateway share one parse.
+        if nlp is not None:
+            self.nlp = nlp
+        else:
+            # 'ml' = tagger + parser + vectors (no NER/lemmatizer); 'ml-fast' drops the parser
+            self.nlp = load_profile(profile)
 
         # Behavioral Markers
         self.politeness_markers = [
@@ -66,46 +78,26 @@ class FeatureExtractor:
             "for now", "first", "initially", "let's start with", "stay in character",
             "ignore previous", "continue from", "step 1", "reminder"
         ]
-        self.negation_word_list = ["not", "without", "except", "unless", "besides", "never", "no", "avoid"]
+        self.negation_word_list = NEGATION_WORDS
 
         # Evasion Markers
-        self.conditional_markers = ["if", "when", "unless", "provided that", "assuming", "in case"]
+        self.conditional_markers = CONDITIONAL_WORDS
         self.indirect_markers = ["could you", "would it be possible", "i wonder if", "can we", "is it possible"]
 
     def extract_nlp_features_reused(self, prompt: str, doc) -> Dict[str, Any]:
         """
         Re-implementation of core NLP phase 1 metrics to ensure standalone capability.
+        Syntax statistics come from the shared single-pass kernel (cached on the Doc).
         """
-        words = [token.text for token in doc if not token.is_punct and not token.is_space]
-        word_count = len(words) if words else 1
-        
-        # Syntax - Parse Depth (Simplified approximation)
-        def _depth(token):
-            if not list(token.children): return 1
-            return 1 + max(_depth(child) for child in token.children)
-        parse_tree_depth = max([_depth(sent.root) for sent in doc.sents]) if list(doc.sents) else 0
-
-        # Syntax - Modal Verbs
-        modal_verb_count = sum(1 for token in doc if token.tag_ == "MD")
-
-        # Syntax - Passive Voice
-        passive_voice_ratio = 0.0
-        total_verbs = 0
-        for token in doc:
-            if token.pos_ == "VERB":
-                total_verbs += 1
-                if any(child.dep_ in ["auxpass", "nsubjpass"] for child in token.children):
-                    passive_voice_ratio += 1  # Using count for numerator, div later
-        passive_voice_ratio = passive_voice_ratio / total_verbs if total_verbs > 0 else 0.0
+        stats = syntax_stats(doc)
+        word_count = stats["word_count"] or 1
 
         # Stats - Special Chars
-        delimiters = "-_=|:;,.\\/<>[]{}()?!*#@$%^&+"
-        delimiter_count = sum(1 for c in prompt if c in delimiters)
-        special_char_ratio = sum(1 for c in prompt if not c.isalnum() and c != ' ') / len(prompt) if len(prompt) > 0 else 0
+        char_feats = char_stats(prompt)
 
         # Stats - Lengths
-        avg_word_length = sum(len(w) for w in words) / word_count
-        sentence_count = len(list(doc.sents))
+        avg_word_length = stats["word_chars"] / word_count
+        sentence_count = stats["sentence_count"]
         avg_sentence_length = word_count / sentence_count if sentence_count > 0 else word_count
 
         # Semantic Density (Simplified)
@@ -120,17 +112,35 @@ class FeatureExtractor:
             semantic_density = 0.0
 
         return {
-            "parse_tree_depth": parse_tree_depth,
-            "modal_verb_count": modal_verb_count,
-            "passive_voice_ratio": passive_voice_ratio,
-            "special_char_ratio": special_char_ratio,
-            "delimiter_count": delimiter_count,
+            "parse_tree_depth": stats["parse_tree_depth"],
+            "modal_verb_count": stats["modal_verb_count"],
+            "passive_voice_ratio": stats["passive_voice_ratio"],
+            "special_char_ratio": char_feats["special_char_ratio"],
+            "delimiter_count": char_feats["delimiter_count"],
             "avg_word_length": avg_word_length,
             "sentence_count": sentence_count,
             "avg_sentence_length": avg_sentence_length,
             "semantic_density": float(semantic_density)
         }
 
+    def marker_groups(self) -> Dict[str, List[str]]:
+        """Every marker list by name (used by the parse-free prefilter)"""
+        return {
+            "politeness": self.politeness_markers,
+            "urgency": self.urgency_markers,
+            "authority": self.authority_markers,
+            "safety": self.safety_keywords,
+            "hypothetical": self.hypothetical_markers,
+            "role_play": self.role_play_markers,
+            "slang": self.special_slang_markers,
+            "leet": self.leet_markers,
+            "formatting": self.formatting_pressure_markers,
+            "multi_turn": self.multi_turn_markers,
+            "indirect": self.indirect_markers,
+            "conditional": self.conditional_markers,
+            "negation": self.negation_word_list
+        }
+
     def _count_markers(self, text_lower: str, markers: List[str]) -> int:
         count = 0
         for m in markers:
@@ -138,9 +148,13 @@ class FeatureExtractor:
                 count += 1
         return count
 
-    def extract_ml_features(self, prompt: str, doc) -> Dict[str, Any]:
-        prompt_lower = prompt.lower()
-        
+    def _marker_features(self, norm) -> Dict[str, Any]:
+        """
+        Behavioral/contextual markers that only need the raw string (no parse).
+        Markers are matched on the folded view (homoglyph/leet folded) so obfuscated
+        variants still hit; leet markers look for leetspeak itself, on the plain lowercase view.
+        """
+        prompt_lower = norm.folded
         # Behavioral
         politeness_count = self._count_markers(prompt_lower, self.politeness_markers)
         # Score normalized roughly 0-1 (assuming >3 polite phrases is max "polite")
@@ -152,7 +166,7 @@ class FeatureExtractor:
         authority_count = len(authority_matches)
         
         safety_density = 0.0
-        words = prompt_lower.split()
+        words = norm.folded_tokens
         if words:
             safety_count = sum(1 for w in words if w in self.safety_keywords)
             safety_density = safety_count / len(words)
@@ -163,7 +177,7 @@ class FeatureExtractor:
         # Augmented Roleplay/Behavioral detection
         role_play_score = self._count_markers(prompt_lower, self.role_play_markers)
         slang_score = self._count_markers(prompt_lower, self.special_slang_markers)
-        leet_detected = self._count_markers(prompt_lower, self.leet_markers) > 0
+        leet_detected = self._count_markers(norm.lower, self.leet_markers) > 0
         
         formatting_pressure_count = self._count_markers(prompt_lower, self.formatting_pressure_markers)
         
@@ -177,17 +191,6 @@ class FeatureExtractor:
             # Very rough heuristic: longer prompts often have more justification
             justification_ratio = min(len(words) / 100.0, 1.0) 
 
-        negation_count = sum(1 for token in doc if token.dep_ == "neg" or token.text.lower() in self.negation_word_list)
-
-        # Evasion
-        question_count = sum(1 for sent in doc.sents if sent.text.strip().endswith("?"))
-        question_density = question_count / len(list(doc.sents)) if list(doc.sents) else 0.0
-        
-        conditional_count = 0
-        for token in doc:
-            if token.pos_ == "SCONJ" or token.text.lower() in self.conditional_markers: # Subordinating conjunctions often 'if', 'because'
-                 conditional_count += 1
-        
         indirect_request_count = self._count_markers(prompt_lower, self.indirect_markers)
 
         return {
@@ -200,21 +203,47 @@ class FeatureExtractor:
             "role_play_detected": role_play_detected,
             "justification_ratio": justification_ratio,
             "multi_turn_setup": multi_turn_setup,
-            "negation_count": negation_count,
-            "question_density": question_density,
-            "conditional_count": conditional_count,
             "indirect_request_count": indirect_request_count,
             "leetspeak_detected": leet_detected,
             "formatting_pressure_count": formatting_pressure_count
         }
 
+    def extract_ml_features(self, prompt: str, doc) -> Dict[str, Any]:
+        markers = self._marker_features(normalize(prompt))
+
+        stats = syntax_stats(doc)
+
+        # Evasion
+        sentence_count = stats["sentence_count"]
+        question_density = stats["question_count"] / sentence_count if sentence_count else 0.0
+
+        return {
+            **markers,
+            "negation_count": stats["negation_count"],
+            "question_density": question_density,
+            # Subordinating conjunctions often 'if', 'because'
+            "conditional_count": stats["conditional_count"]
+        }
+
+    def extract_cheap(self, prompt: str) -> Dict[str, Any]:
+        """
+        Parse-free subset of the features (see CHEAP_FEATURES). Values are identical
+        to the same keys in extract_all, but no spaCy call is made.
+        """
+        if not prompt:
+            prompt = " "
+        return {**char_stats(prompt), **self._marker_features(normalize(prompt))}
+
     def extract_all(self, prompt: str) -> Dict[str, Any]:
         """Combined feature set entry point"""
         if not prompt:
             prompt = " "
             
         doc = self.nlp(prompt)
-        
+        return self.extract_from_doc(prompt, doc)
+
+    def extract_from_doc(self, prompt: str, doc) -> Dict[str, Any]:
+        """Combined feature set for an already parsed prompt"""
         # Reuse NLP Features (Standalone)
         nlp_feats = self.extract_nlp_features_reused(prompt, doc)
         
@@ -222,3 +251,12 @@ class FeatureExtractor:
         ml_feats = self.extract_ml_features(prompt, doc)
         
         return {**nlp_feats, **ml_feats}
+
+    def extract_batch(self, prompts: List[str], batch_size: int = 64) -> List[Dict[str, Any]]:
+        """
+        Batched entry point. Parses all prompts through nlp.pipe so spaCy can
+        process them in chunks instead of one call per prompt.
+        """
+        prompts = [p if p else " " for p in prompts]
+        docs = self.nlp.pipe(prompts, batch_size=batch_size)
+        return [self.extract_from_doc(p, doc) for p, doc in zip(prompts, docs)]
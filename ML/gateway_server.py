@@ -0,0 +1,152 @@
+"""
+BlueTeam Security Suite - Integrated Gateway
+Serves the full NLP -> ML cascade (IntegratedFirewall) from a single process.
+
+Both layers share one spaCy pipeline and one parse per prompt, so clients get
+the whole cascade in one network hop instead of calling ports 8000 and 8001.
+"""
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+import uvicorn
+import time
+from typing import Optional, Dict, Any
+
+from ML.orchestrator import IntegratedFirewall, CASCADE_MODES
+from NLP.core.response_profiles import resolve_profile, dumps
+
+app = FastAPI(title="BlueTeam Integrated Gateway", version="2.1.0")
+
+# Both layers are loaded once at import time (same as the standalone ML server)
+firewall = IntegratedFirewall()
+
+SERVER_START_TIME = time.time()
+
+class GatewayRequest(BaseModel):
+    prompt: str
+    user_id: Optional[str] = None
+    mode: str = Field("full", description="Cascade policy: 'fast' (NLP only), 'full' or 'shadow'")
+    options: Optional[Dict[str, Any]] = Field(default_factory=dict, description="'profile': 'verdict' | 'scores' | 'full' (default) selects the response fields")
+    callback_url: Optional[str] = Field(None, description="Shadow mode: URL that receives the ML result as a JSON POST")
+
+class TurnRequest(BaseModel):
+    prompt: str = Field(..., description="The new turn only; earlier turns are summarized in the session state")
+    user_id: Optional[str] = None
+    mode: str = Field("full", description="Cascade policy: 'fast' (NLP only), 'full' or 'shadow'")
+    options: Optional[Dict[str, Any]] = Field(default_factory=dict)
+
+def _json(content) -> Response:
+    """orjson-encoded body, bypassing FastAPI's jsonable_encoder"""
+    return Response(dumps(content), media_type="application/json")
+
+def _check_request(mode: str, options: Dict[str, Any]):
+    if mode not in CASCADE_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}'. Expected one of {list(CASCADE_MODES)}")
+    try:
+        resolve_profile(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _run(prompt: str, mode: str, options: Dict[str, Any], user_id: Optional[str],
+         callback_url: Optional[str] = None):
+    _check_request(mode, options)
+    if not firewall.nlp_enabled and not firewall.ml_enabled:
+        raise HTTPException(status_code=503, detail="No detection layer loaded.")
+    if callback_url and mode == "shadow" and firewall.shadow is not None:
+        try:
+            firewall.shadow.check_callback_url(callback_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return _json(firewall.analyze(prompt, mode=mode, options=options, user_id=user_id, callback_url=callback_url))
+
+@app.get("/")
+def root():
+    return {
+        "system": "BlueTeam Integrated Gateway",
+        "layers": {
+            "nlp": firewall.nlp_enabled,
+            "ml": firewall.ml_enabled and firewall.ml_firewall.is_loaded
+        },
+        "shared_parse": firewall.shared_nlp is not None,
+        "modes": list(CASCADE_MODES),
+        "endpoints": {
+            "analyze": "POST /analyze (JSON)",
+            "analyze_raw": "POST /analyze/raw?mode=full (Text)",
+            "session_turn": "POST /sessions/{conversation_id}/turns (JSON)",
+            "session_state": "GET /sessions/{conversation_id}?user_id=...",
+            "shadow_result": "GET /shadow/{task_id}",
+            "health": "GET /health"
+        }
+    }
+
+@app.post("/analyze")
+def analyze(request: GatewayRequest):
+    return _run(request.prompt, request.mode, request.options or {}, request.user_id, request.callback_url)
+
+@app.post("/analyze/raw")
+async def analyze_raw(request: Request, mode: str = "full", threshold: Optional[float] = None,
+                      user_id: Optional[str] = None, profile: Optional[str] = None):
+    """
+    Raw text endpoint.
+    Usage: POST /analyze/raw?mode=fast&threshold=0.7&profile=verdict
+    Body: <your raw text here>
+    """
+    body = await request.body()
+    prompt = body.decode("utf-8").strip()
+    if not prompt:
+        raise HTTPException(status_code=400, detail="Empty prompt")
+
+    options = {"threshold": threshold} if threshold is not None else {}
+    if profile:
+        options["profile"] = profile
+    return _run(prompt, mode, options, user_id)
+
+@app.post("/sessions/{conversation_id}/turns")
+def session_turn(conversation_id: str, request: TurnRequest):
+    """Analyze one new turn of a conversation against its rolling session state"""
+    _check_request(request.mode, request.options)
+    if firewall.sessions is None:
+        raise HTTPException(status_code=503, detail="Session tracking is disabled.")
+    return _json(firewall.analyze_turn(conversation_id, request.prompt, mode=request.mode,
+                                       options=request.options or {}, user_id=request.user_id))
+
+# Sessions are namespaced by user_id: reading or ending one needs the user_id its turns used
+@app.get("/sessions/{conversation_id}")
+def session_state(conversation_id: str, user_id: Optional[str] = None):
+    state = firewall.session_status(conversation_id, user_id=user_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return state
+
+@app.delete("/sessions/{conversation_id}")
+def end_session(conversation_id: str, user_id: Optional[str] = None):
+    if not firewall.end_session(conversation_id, user_id=user_id):
+        raise HTTPException(status_code=404, detail="Unknown or expired session")
+    return {"deleted": conversation_id}
+
+@app.get("/shadow/{task_id}")
+def shadow_result(task_id: str):
+    """Poll the background ML result of a shadow-mode request"""
+    task = firewall.shadow_status(task_id)
+    if task is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired shadow task")
+    return task
+
+@app.get("/health")
+def health():
+    return {
+        "status": "healthy",
+        "nlp_loaded": firewall.nlp_enabled,
+        "ml_loaded": bool(firewall.ml_enabled and firewall.ml_firewall.is_loaded),
+        "shadow": firewall.shadow.stats() if firewall.shadow else None,
+        "prefilter": firewall.prefilter.stats() if firewall.prefilter else None,
+        "sessions": firewall.sessions.store.stats() if firewall.sessions else None,
+        "uptime_seconds": round(time.time() - SERVER_START_TIME, 2)
+    }
+
+@app.on_event("shutdown")
+def shutdown_event():
+    firewall.shutdown()
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8002)
@@ -1,81 +1,235 @@
 import os
+import csv
+import json
+import time
 import random
-from typing import List, Dict, Any
-from datasets import load_dataset
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from rich.console import Console
-from rich.progress import track
+from rich.progress import Progress
+from rich.table import Table
 from ML.core.ml_firewall import MLFirewall
 
+LOCAL_EXTENSIONS = ('.jsonl', '.json', '.csv', '.txt')
+BENIGN_LABELS = {'0', 'false', 'benign', 'safe', 'harmless', 'negative'}
+
 class RedTeamer:
     def __init__(self, firewall: MLFirewall = None):
         self.firewall = firewall or MLFirewall()
         self.console = Console()
 
-    def test_dataset(self, dataset_id: str, sample_size: int = 50) -> Dict[str, Any]:
-        """Test the firewall against a sample from a HuggingFace dataset"""
+    def test_dataset(self, dataset_id: str, sample_size: int = 50, batch_size: int = 64,
+                     workers: int = 1, label_key: Optional[str] = None, seed: Optional[int] = None,
+                     scan_limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Test the firewall against a HuggingFace dataset or a local file.
+
+        - dataset_id: HF dataset ID, or a path to a .jsonl/.json/.csv/.txt file
+        - sample_size: Reservoir-sampled uniformly from the whole stream (up to scan_limit items)
+        - batch_size / workers: Prompts are scored through the firewall's batch path,
+          `workers` batches in flight at a time
+        - label_key: Optional field holding the ground truth. Without it every prompt
+          is treated as an attack (leakage = share of prompts that passed)
+        """
         self.console.print(f"[bold red]⚔️  Red-Teaming against: {dataset_id}[/bold red]")
-        
+        rng = random.Random(seed)
+
         try:
-            # We use streaming=True to avoid massive downloads for large datasets
-            ds = load_dataset(dataset_id, split="train", streaming=True)
+            stream = self._load_stream(dataset_id)
         except Exception as e:
             self.console.print(f"[red]Failed to load dataset: {e}[/red]")
             return None
 
-        samples = []
-        count = 0
-        for item in ds:
-            if count >= sample_size * 2: # Get extra to handle filtering
-                break
-            
-            # Smart text extraction
-            text = self._extract_text(item)
-            if text and len(text) > 20:
-                samples.append(text)
-                count += 1
-        
+        samples, scanned = self._reservoir_sample(self._labelled_texts(stream, label_key), sample_size, rng, scan_limit)
+
         if not samples:
             self.console.print("[yellow]No text found in dataset. Ensure it's JSONL/CSV format.[/yellow]")
             return None
 
-        # Pick random samples
-        test_prompts = random.sample(samples, min(len(samples), sample_size))
-        
-        results = []
-        blocked = 0
+        self.console.print(f"   Sampled {len(samples)} prompts from {scanned} scanned records.")
+
+        prompts = [p for p, _ in samples]
+        labels = [y for _, y in samples]
+
+        start_time = time.time()
+        results = self._score_all(prompts, batch_size, workers)
+        elapsed = time.time() - start_time
+
+        report = self._build_report(dataset_id, prompts, labels, results, elapsed)
+        self._print_report(report)
+        return report
+
+    # ------------------------------------------------------------------
+    # Sources
+    # ------------------------------------------------------------------
+    def _load_stream(self, dataset_id: str) -> Iterable[Dict]:
+        if os.path.isfile(dataset_id):
+            return self._iter_local(dataset_id)
+
+        from datasets import load_dataset
+        # We use streaming=True to avoid massive downloads for large datasets
+        return load_dataset(dataset_id, split="train", streaming=True)
+
+    def _iter_local(self, path: str) -> Iterator[Dict]:
+        """Offline source: stream records from a local file without loading it whole"""
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in LOCAL_EXTENSIONS:
+            raise ValueError(f"Unsupported file type '{ext}'. Expected one of {LOCAL_EXTENSIONS}")
+
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            if ext == '.jsonl':
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+            elif ext == '.json':
+                data = json.load(f)
+                for item in (data if isinstance(data, list) else [data]):
+                    yield item if isinstance(item, dict) else {"text": str(item)}
+            elif ext == '.csv':
+                yield from csv.DictReader(f)
+            else:
+                for line in f:
+                    if line.strip():
+                        yield {"text": line.strip()}
+
+    def _labelled_texts(self, stream: Iterable[Dict], label_key: Optional[str]) -> Iterator[Tuple[str, int]]:
+        for item in stream:
+            # Smart text extraction
+            text = self._extract_text(item)
+            if text and len(text) > 20:
+                yield text, self._extract_label(item, label_key)
+
+    def _reservoir_sample(self, stream: Iterable, k: int, rng: random.Random,
+                          scan_limit: Optional[int] = None) -> Tuple[List, int]:
+        """Algorithm R: uniform k-sample over a stream of unknown length in O(k) memory"""
+        reservoir = []
+        n = 0
+        for item in stream:
+            if scan_limit is not None and n >= scan_limit:
+                break
+            if n < k:
+                reservoir.append(item)
+            else:
+                j = rng.randint(0, n)
+                if j < k:
+                    reservoir[j] = item
+            n += 1
+        return reservoir, n
+
+    # ------------------------------------------------------------------
+    # Scoring
+    # ------------------------------------------------------------------
+    def _score_all(self, prompts: List[str], batch_size: int, workers: int) -> List[Dict[str, Any]]:
+        batches = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+        results: List[List[Dict[str, Any]]] = [None] * len(batches)
+
+        with Progress(console=self.console) as progress:
+            task = progress.add_task("Simulating attacks...", total=len(prompts))
+            with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+                futures = {pool.submit(self.firewall.analyze_batch, batch): i for i, batch in enumerate(batches)}
+                for future in futures:
+                    i = futures[future]
+                    results[i] = future.result()
+                    progress.update(task, advance=len(batches[i]))
+
+        return [r for batch in results for r in batch]
+
+    # ------------------------------------------------------------------
+    # Reporting
+    # ------------------------------------------------------------------
+    def _build_report(self, dataset_id: str, prompts: List[str], labels: List[int],
+                      results: List[Dict[str, Any]], elapsed: float) -> Dict[str, Any]:
+        confusion = {"tp": 0, "fp": 0, "tn": 0, "fn": 0}
+        stages: Dict[str, Dict[str, Any]] = {}
         passed = []
+        false_positives = []
 
-        for prompt in track(test_prompts, description="Simulating attacks..."):
-            res = self.firewall.analyze(prompt)
-            if res['verdict'] == 'block':
-                blocked += 1
+        for prompt, label, res in zip(prompts, labels, results):
+            blocked = res['verdict'] == 'block'
+            if label == 1:
+                confusion["tp" if blocked else "fn"] += 1
             else:
-                passed.append({
-                    "prompt": prompt,
-                    "score": res['score'],
-                    "features": res.get('features', {})
-                })
-            results.append(res)
-
-        leakage_rate = (len(passed) / len(test_prompts)) * 100
-        
-        self.console.print(f"\n[bold]Results for {dataset_id}:[/bold]")
-        self.console.print(f"✅ Blocked: {blocked}")
-        self.console.print(f"❌ Leakage: {len(passed)} ({leakage_rate:.1f}%)")
-        
+                confusion["fp" if blocked else "tn"] += 1
+
+            stage = stages.setdefault(res.get('stage', 'unknown'), {"count": 0, "blocked": 0, "score_sum": 0.0})
+            stage["count"] += 1
+            stage["blocked"] += int(blocked)
+            stage["score_sum"] += res['score']
+
+            record = {
+                "prompt": prompt,
+                "score": res['score'],
+                "stage": res.get('stage'),
+                "features": res.get('features', {})
+            }
+            if label == 1 and not blocked:
+                passed.append(record)
+            elif label == 0 and blocked:
+                false_positives.append(record)
+
+        for stage in stages.values():
+            stage["mean_score"] = stage.pop("score_sum") / stage["count"]
+
+        positives = confusion["tp"] + confusion["fn"]
+        negatives = confusion["tn"] + confusion["fp"]
+        leakage_rate = (confusion["fn"] / positives) * 100 if positives else 0.0
+
         return {
             "dataset_id": dataset_id,
+            "evaluated": len(results),
             "leakage_rate": leakage_rate,
-            "failures": passed
+            "false_positive_rate": (confusion["fp"] / negatives) * 100 if negatives else 0.0,
+            "confusion": confusion,
+            "stages": stages,
+            "elapsed_s": elapsed,
+            "throughput_pps": len(results) / elapsed if elapsed > 0 else 0.0,
+            "failures": passed,
+            "false_positives": false_positives
         }
 
+    def _print_report(self, report: Dict[str, Any]):
+        c = report["confusion"]
+        self.console.print(f"\n[bold]Results for {report['dataset_id']}:[/bold]")
+        self.console.print(f"✅ Blocked: {c['tp'] + c['fp']}")
+        self.console.print(f"❌ Leakage: {c['fn']} ({report['leakage_rate']:.1f}%)")
+        if c['tn'] + c['fp']:
+            self.console.print(f"⚠️  False Positives: {c['fp']} ({report['false_positive_rate']:.1f}%)")
+        self.console.print(f"⚡ Throughput: {report['throughput_pps']:.1f} prompts/s ({report['elapsed_s']:.1f}s total)")
+
+        matrix = Table(title="Confusion Matrix")
+        matrix.add_column("")
+        matrix.add_column("Blocked", style="green")
+        matrix.add_column("Passed", style="red")
+        matrix.add_row("Attack", str(c['tp']), str(c['fn']))
+        matrix.add_row("Benign", str(c['fp']), str(c['tn']))
+        self.console.print(matrix)
+
+        table = Table(title="Per-Stage Stats")
+        table.add_column("Stage", style="cyan")
+        table.add_column("Prompts")
+        table.add_column("Blocked")
+        table.add_column("Mean Score")
+        for name, s in report["stages"].items():
+            table.add_row(name, str(s['count']), str(s['blocked']), f"{s['mean_score']:.3f}")
+        self.console.print(table)
+
     def _extract_text(self, item: Dict) -> str:
         """Find the most likely prompt field in the item"""
         # Common keys
         for key in ['Prompt', 'prompt', 'text', 'instruction', 'query', 'input']:
             if key in item and isinstance(item[key], str):
                 return item[key]
-        
+
         # Fallback to longest string
         str_vals = [v for v in item.values() if isinstance(v, str)]
         return max(str_vals, key=len) if str_vals else None
+
+    def _extract_label(self, item: Dict, label_key: Optional[str]) -> int:
+        """1 = attack, 0 = benign. Without a label field every prompt counts as an attack."""
+        if not label_key or label_key not in item:
+            return 1
+        value = item[label_key]
+        if isinstance(value, str):
+            return 0 if value.strip().lower() in BENIGN_LABELS else 1
+        return 1 if value else 0
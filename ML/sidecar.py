@@ -0,0 +1,413 @@
+"""
+BlueTeam Security Suite - Local Sidecar Transport
+Serves IntegratedFirewall over a Unix domain socket for callers on the same host.
+
+- Frames are a 4-byte big-endian length followed by a msgpack map, so a request
+  costs one syscall each way and no HTTP parsing, JSON or pydantic validation.
+- A connection is persistent and serves requests in order; clients may pipeline.
+- Requests (`id` is echoed back on every reply):
+    {"op": "analyze", "id", "prompt", "mode", "options", "user_id", "callback_url"}
+        -> {"id", "result"}
+    {"op": "batch", "id", "prompts", "mode", "options", "user_id", "batch_size"}
+        -> one {"id", "index", "result"} per prompt as each chunk finishes
+           (IntegratedFirewall.analyze_batch), then {"id", "done": true, "count"}
+    {"op": "shadow", "id", "task_id"} -> {"id", "result"}  (None if unknown)
+    {"op": "health", "id"} -> {"id", "result"}
+  Any failure is answered with {"id", "error"}; the connection stays open.
+
+Run next to the gateway (same firewall settings, no port):
+    python -m ML.sidecar serve --socket /tmp/blueteam.sock
+Compare round-trip overhead with the FastAPI gateway path:
+    python -m ML.sidecar bench --requests 2000
+"""
+
+import os
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import msgpack
+import numpy as np
+
+from ML.client import BlueTeamClientError
+
+DEFAULT_SOCKET = "/tmp/blueteam.sock"
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+_HEADER = struct.Struct(">I")
+
+
+def _pack_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+def write_frame(sock: socket.socket, message: Dict[str, Any]):
+    body = msgpack.packb(message, default=_pack_default, use_bin_type=True)
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _read_exact(sock: socket.socket, n: int) -> Optional[bytes]:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            return None
+        got += k
+    return bytes(buf)
+
+
+def read_frame(sock: socket.socket) -> Optional[Dict[str, Any]]:
+    """Next message, or None when the peer closed the connection"""
+    header = _read_exact(sock, _HEADER.size)
+    if header is None:
+        return None
+    (size,) = _HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame of {size} bytes exceeds the {MAX_FRAME_BYTES} byte limit")
+    body = _read_exact(sock, size)
+    if body is None:
+        return None
+    return msgpack.unpackb(body, raw=False)
+
+
+class _SidecarHandler(socketserver.BaseRequestHandler):
+    """One thread per connection, requests answered in arrival order"""
+
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                message = read_frame(sock)
+            except (ValueError, msgpack.UnpackException) as e:
+                # The stream can no longer be framed; report and drop the connection
+                write_frame(sock, {"id": None, "error": f"Bad frame: {e}"})
+                return
+            except OSError:
+                return
+            if message is None:
+                return
+            try:
+                self.server.dispatch(sock, message)
+            except OSError:
+                return
+            except Exception as e:
+                write_frame(sock, {"id": message.get("id") if isinstance(message, dict) else None,
+                                   "error": f"{type(e).__name__}: {e}"})
+
+
+class SidecarServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, firewall, socket_path: str = DEFAULT_SOCKET, socket_mode: int = 0o660,
+                 batch_size: int = 64):
+        self.firewall = firewall
+        self.socket_path = socket_path
+        self.batch_size = batch_size
+        # A stale socket from a previous run would make bind() fail
+        if os.path.exists(socket_path) and stat.S_ISSOCK(os.stat(socket_path).st_mode):
+            os.unlink(socket_path)
+        super().__init__(socket_path, _SidecarHandler)
+        os.chmod(socket_path, socket_mode)
+
+    def dispatch(self, sock: socket.socket, message: Dict[str, Any]):
+        op = message.get("op", "analyze")
+        rid = message.get("id")
+        if op == "analyze":
+            self._check_layers()
+            result = self.firewall.analyze(message["prompt"], mode=message.get("mode", "full"),
+                                           options=message.get("options") or {},
+                                           user_id=message.get("user_id"),
+                                           callback_url=message.get("callback_url"))
+            write_frame(sock, {"id": rid, "result": result})
+        elif op == "batch":
+            self._check_layers()
+            prompts = message["prompts"]
+            mode = message.get("mode", "full")
+            options = message.get("options") or {}
+            size = max(1, int(message.get("batch_size") or self.batch_size))
+            # Each chunk is streamed back as soon as it is scored
+            for start in range(0, len(prompts), size):
+                results = self.firewall.analyze_batch(prompts[start:start + size], mode=mode, options=options,
+                                                      user_id=message.get("user_id"), batch_size=size)
+                for offset, result in enumerate(results):
+                    write_frame(sock, {"id": rid, "index": start + offset, "result": result})
+            write_frame(sock, {"id": rid, "done": True, "count": len(prompts)})
+        elif op == "shadow":
+            write_frame(sock, {"id": rid, "result": self.firewall.shadow_status(message["task_id"])})
+        elif op == "health":
+            write_frame(sock, {"id": rid, "result": self.health()})
+        else:
+            raise ValueError(f"Unknown op '{op}'")
+
+    def _check_layers(self):
+        if not self.firewall.nlp_enabled and not self.firewall.ml_enabled:
+            raise RuntimeError("No detection layer loaded.")
+
+    def health(self) -> Dict[str, Any]:
+        fw = self.firewall
+        return {
+            "status": "healthy",
+            "nlp_loaded": fw.nlp_enabled,
+            "ml_loaded": bool(fw.ml_enabled and fw.ml_firewall.is_loaded),
+            "socket": self.socket_path,
+        }
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+def serve_in_thread(firewall, socket_path: str = DEFAULT_SOCKET, **kwargs) -> SidecarServer:
+    """Start a sidecar on a daemon thread (e.g. next to a FastAPI app sharing the firewall)"""
+    server = SidecarServer(firewall, socket_path, **kwargs)
+    threading.Thread(target=server.serve_forever, daemon=True, name="blueteam-sidecar").start()
+    return server
+
+
+class SidecarClient:
+    """
+    Blocking client for the sidecar socket.
+
+    One persistent connection per instance; a lock serializes requests, so share an
+    instance across threads only when calls are short, or open one per thread.
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET, timeout: Optional[float] = 30.0):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._sock = None
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError as e:
+                sock.close()
+                raise BlueTeamClientError(f"Cannot connect to sidecar at {self.socket_path}: {e}")
+            self._sock = sock
+        return self._sock
+
+    def _send(self, message: Dict[str, Any]) -> Tuple[socket.socket, int]:
+        self._next_id += 1
+        message["id"] = self._next_id
+        sock = self._connect()
+        try:
+            write_frame(sock, message)
+        except OSError as e:
+            self._drop()
+            raise BlueTeamClientError(f"Sidecar send failed: {e}")
+        return sock, self._next_id
+
+    def _recv(self, sock: socket.socket, rid: int) -> Dict[str, Any]:
+        try:
+            reply = read_frame(sock)
+        except (OSError, ValueError) as e:
+            self._drop()
+            raise BlueTeamClientError(f"Sidecar receive failed: {e}")
+        if reply is None:
+            self._drop()
+            raise BlueTeamClientError("Sidecar closed the connection")
+        if reply.get("error") is not None:
+            if reply.get("id") != rid:
+                self._drop()
+            raise BlueTeamClientError(reply["error"])
+        return reply
+
+    def _drop(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _call(self, message: Dict[str, Any]) -> Any:
+        with self._lock:
+            sock, rid = self._send(message)
+            return self._recv(sock, rid)["result"]
+
+    def analyze(self, prompt: str, mode: str = "full", options: Dict[str, Any] = None,
+                user_id: str = None, callback_url: str = None) -> Dict[str, Any]:
+        return self._call({"op": "analyze", "prompt": prompt, "mode": mode, "options": options or {},
+                           "user_id": user_id, "callback_url": callback_url})
+
+    def analyze_stream(self, prompts: List[str], mode: str = "full", options: Dict[str, Any] = None,
+                       user_id: str = None, batch_size: int = None) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """(index, result) pairs as the sidecar finishes each chunk, in input order"""
+        with self._lock:
+            sock, rid = self._send({"op": "batch", "prompts": list(prompts), "mode": mode,
+                                    "options": options or {}, "user_id": user_id, "batch_size": batch_size})
+            done = False
+            try:
+                while True:
+                    reply = self._recv(sock, rid)
+                    if reply.get("done"):
+                        done = True
+                        return
+                    yield reply["index"], reply["result"]
+            finally:
+                # Abandoned mid-stream: the rest of the replies would desync the connection
+                if not done:
+                    self._drop()
+
+    def analyze_many(self, prompts: List[str], mode: str = "full", options: Dict[str, Any] = None,
+                     user_id: str = None, batch_size: int = None) -> List[Dict[str, Any]]:
+        results = [None] * len(prompts)
+        for index, result in self.analyze_stream(prompts, mode, options, user_id, batch_size):
+            results[index] = result
+        return results
+
+    def shadow_status(self, task_id: str) -> Optional[Dict[str, Any]]:
+        return self._call({"op": "shadow", "task_id": task_id})
+
+    def health(self) -> Dict[str, Any]:
+        return self._call({"op": "health"})
+
+    def close(self):
+        with self._lock:
+            self._drop()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    arr = np.asarray(samples_ms)
+    return {"p50": float(np.percentile(arr, 50)), "p95": float(np.percentile(arr, 95)),
+            "p99": float(np.percentile(arr, 99)), "mean": float(arr.mean())}
+
+
+def benchmark(requests: int = 1000, batch: int = 256, mode: str = "fast",
+              prompt: str = "What is the capital of France?", socket_path: str = None,
+              warmup: int = 50) -> Dict[str, Any]:
+    """
+    Round-trip overhead of the sidecar vs the FastAPI gateway, in one process.
+
+    Both front ends serve the same IntegratedFirewall (the gateway's), so the
+    transport overhead of a request is its round trip minus the `latency_ms.total`
+    the firewall reports for it. Single requests are sequential on a keep-alive
+    connection; the batch figure streams `batch` prompts through one sidecar request.
+    """
+    import httpx
+    import uvicorn
+    from ML import gateway_server
+
+    firewall = gateway_server.firewall
+    socket_path = socket_path or f"/tmp/blueteam-bench-{os.getpid()}.sock"
+    sidecar = serve_in_thread(firewall, socket_path)
+
+    probe = socket.socket()
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    http = uvicorn.Server(uvicorn.Config(gateway_server.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=http.run, daemon=True).start()
+    while not http.started:
+        time.sleep(0.05)
+
+    def run(call):
+        rtt, overhead = [], []
+        for i in range(warmup + requests):
+            t = time.perf_counter()
+            result = call()
+            elapsed = (time.perf_counter() - t) * 1000
+            if i >= warmup:
+                rtt.append(elapsed)
+                overhead.append(elapsed - result["latency_ms"]["total"])
+        return {"round_trip_ms": _percentiles(rtt), "overhead_ms": _percentiles(overhead)}
+
+    report = {"mode": mode, "requests": requests}
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30.0) as client:
+            def post():
+                response = client.post("/analyze", json={"prompt": prompt, "mode": mode})
+                response.raise_for_status()
+                return response.json()
+            report["fastapi"] = run(post)
+        with SidecarClient(socket_path) as client:
+            report["sidecar"] = run(lambda: client.analyze(prompt, mode=mode))
+            prompts = [prompt] * batch
+            t = time.perf_counter()
+            client.analyze_many(prompts, mode=mode)
+            elapsed = time.perf_counter() - t
+            report["sidecar_batch"] = {"prompts": batch, "prompts_per_s": batch / elapsed}
+    finally:
+        http.should_exit = True
+        sidecar.shutdown()
+        sidecar.server_close()
+    return report
+
+
+def _print_report(report: Dict[str, Any]):
+    print(f"\n📊 Transport benchmark ({report['requests']} sequential requests, mode={report['mode']})")
+    print(f"{'path':<10}{'rtt p50':>10}{'rtt p99':>10}{'ovh p50':>10}{'ovh p99':>10}   (ms)")
+    for path in ("fastapi", "sidecar"):
+        rtt, ovh = report[path]["round_trip_ms"], report[path]["overhead_ms"]
+        print(f"{path:<10}{rtt['p50']:>10.3f}{rtt['p99']:>10.3f}{ovh['p50']:>10.3f}{ovh['p99']:>10.3f}")
+    ratio = report["fastapi"]["overhead_ms"]["p50"] / max(report["sidecar"]["overhead_ms"]["p50"], 1e-9)
+    print(f"Sidecar transport overhead is {ratio:.1f}x lower at p50")
+    b = report["sidecar_batch"]
+    print(f"Sidecar streaming batch: {b['prompts']} prompts at {b['prompts_per_s']:,.0f} prompts/s")
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="IntegratedFirewall over a Unix domain socket")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="Serve the firewall on a Unix socket")
+    p_serve.add_argument("--socket", default=DEFAULT_SOCKET, help="Socket path")
+    p_serve.add_argument("--socket-mode", default="660", help="Octal permissions of the socket file")
+    p_serve.add_argument("--batch-size", type=int, default=64, help="Default chunk size of batch requests")
+    p_serve.add_argument("--spacy-profile", help="Shared spaCy profile (default: spacy.shared_profile)")
+
+    p_bench = sub.add_parser("bench", help="Round-trip overhead vs the FastAPI gateway")
+    p_bench.add_argument("--requests", type=int, default=1000, help="Sequential requests per path")
+    p_bench.add_argument("--batch", type=int, default=256, help="Prompts in the streaming batch run")
+    p_bench.add_argument("--mode", choices=("fast", "full"), default="fast", help="Cascade policy")
+    p_bench.add_argument("--prompt", default="What is the capital of France?", help="Prompt sent on every request")
+    p_bench.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        report = benchmark(requests=args.requests, batch=args.batch, mode=args.mode, prompt=args.prompt)
+        _print_report(report)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    from ML.orchestrator import IntegratedFirewall
+
+    firewall = IntegratedFirewall(spacy_profile=args.spacy_profile)
+    server = SidecarServer(firewall, args.socket, socket_mode=int(args.socket_mode, 8), batch_size=args.batch_size)
+    print(f"🔌 BlueTeam sidecar listening on {args.socket}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        firewall.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+Ensemble calibration: weight/threshold search and score calibration.
+
+Replaces the nested Python loops over hand-written weight tuples with:
+- a grid over the whole weight simplex, scored with one histogram pass per grid
+- exact threshold curves from sorted-score cumulative sums (every threshold in one pass)
+- F1 or cost-weighted (FN vs FP) objectives
+- Platt scaling of the final score into a calibrated probability
+"""
+
+import numpy as np
+from typing import Dict, Any, Tuple
+
+
+def simplex_grid(step: float = 0.05, n_models: int = 3) -> np.ndarray:
+    """All weight vectors on the simplex with the given resolution, shape (K, n_models)"""
+    n = int(round(1 / step))
+    grid = [w for w in np.ndindex(*([n + 1] * (n_models - 1))) if sum(w) <= n]
+    grid = np.array([list(w) + [n - sum(w)] for w in grid], dtype=float)
+    return grid / n
+
+
+def _objective(tp, fp, fn, objective, fn_cost, fp_cost):
+    """Higher is better. Works elementwise on count arrays."""
+    if objective == "cost":
+        return -(fn_cost * fn + fp_cost * fp)
+    denom = 2 * tp + fp + fn
+    return np.divide(2 * tp, denom, out=np.zeros_like(denom, dtype=float), where=denom > 0)
+
+
+def threshold_curve(scores: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Exact confusion counts for every distinct threshold in one sort + cumsum.
+
+    Returns (thresholds, tp, fp) where predicting `score >= thresholds[i]`
+    yields tp[i] true positives and fp[i] false positives.
+    """
+    order = np.argsort(-scores, kind="mergesort")
+    s = scores[order]
+    y_sorted = y[order].astype(np.int64)
+
+    tp = np.cumsum(y_sorted)
+    fp = np.cumsum(1 - y_sorted)
+
+    # Only the last position of each run of tied scores is a valid cut
+    distinct = np.r_[s[1:] != s[:-1], True]
+    return s[distinct], tp[distinct], fp[distinct]
+
+
+def best_threshold(scores: np.ndarray, y: np.ndarray, objective: str = "f1",
+                   fn_cost: float = 1.0, fp_cost: float = 1.0) -> Tuple[float, float]:
+    """Best `score > threshold` cut for one score vector. Returns (threshold, objective value)."""
+    thresholds, tp, fp = threshold_curve(scores, y)
+    fn = int(y.sum()) - tp
+    values = _objective(tp, fp, fn, objective, fn_cost, fp_cost)
+    i = int(np.argmax(values))
+
+    # Convert the inclusive cut into the strict `>` rule used at inference:
+    # place the threshold halfway to the next lower distinct score
+    lower = thresholds[i + 1] if i + 1 < len(thresholds) else thresholds[i] - 1e-6
+    return float((thresholds[i] + lower) / 2), float(values[i])
+
+
+def search_ensemble(component_scores: np.ndarray, y: np.ndarray, step: float = 0.05,
+                    bins: int = 1000, objective: str = "f1", fn_cost: float = 1.0,
+                    fp_cost: float = 1.0, chunk: int = 16) -> Dict[str, Any]:
+    """
+    Find ensemble weights and threshold.
+
+    component_scores: (N, M) matrix of per-model scores in [0, 1]
+    The simplex grid is evaluated with binned score histograms (all thresholds at
+    1/bins resolution for every weight vector at once), then the winner is refined
+    with the exact sorted-score curve.
+    """
+    y = np.asarray(y).astype(np.int64)
+    weights = simplex_grid(step, component_scores.shape[1])   # (K, M)
+    n_pos = int(y.sum())
+    pos_scores, neg_scores = component_scores[y == 1], component_scores[y == 0]
+
+    best_k, best_value = 0, -np.inf
+    # Weight vectors are processed in chunks to keep the (chunk, N) matrices small
+    for start in range(0, len(weights), chunk):
+        w = weights[start:start + chunk]
+        k = len(w)
+        offsets = np.arange(k)[:, None] * bins
+
+        # Histogram every weight vector's scores, split by class, in one bincount each
+        pos_bins = np.clip((w @ pos_scores.T * bins).astype(np.int64), 0, bins - 1) + offsets
+        neg_bins = np.clip((w @ neg_scores.T * bins).astype(np.int64), 0, bins - 1) + offsets
+        pos_hist = np.bincount(pos_bins.ravel(), minlength=k * bins).reshape(k, bins)
+        neg_hist = np.bincount(neg_bins.ravel(), minlength=k * bins).reshape(k, bins)
+
+        # Reverse cumulative sums: counts with score in bin >= j, for every j
+        tp = np.cumsum(pos_hist[:, ::-1], axis=1)[:, ::-1]
+        fp = np.cumsum(neg_hist[:, ::-1], axis=1)[:, ::-1]
+        values = _objective(tp, fp, n_pos - tp, objective, fn_cost, fp_cost)
+
+        i = int(np.argmax(values))
+        if values.flat[i] > best_value:
+            best_value = values.flat[i]
+            best_k = start + i // bins
+
+    combined = component_scores @ weights[best_k]
+    threshold, value = best_threshold(combined, y, objective, fn_cost, fp_cost)
+
+    return {
+        "weights": tuple(float(w) for w in weights[best_k]),
+        "threshold": threshold,
+        "objective": objective,
+        "value": value,
+        "grid_size": len(weights)
+    }
+
+
+def fit_platt(scores: np.ndarray, y: np.ndarray, iterations: int = 200) -> Dict[str, float]:
+    """
+    Platt scaling: P(y=1 | s) = 1 / (1 + exp(-(a * s + b))), fit by Newton's method
+    with the usual label smoothing to avoid overconfident extremes.
+    """
+    y = np.asarray(y, dtype=float)
+    n_pos, n_neg = y.sum(), len(y) - y.sum()
+    t = np.where(y == 1, (n_pos + 1) / (n_pos + 2), 1 / (n_neg + 2))
+
+    a, b = 1.0, 0.0
+    for _ in range(iterations):
+        p = 1 / (1 + np.exp(-(a * scores + b)))
+        w = np.maximum(p * (1 - p), 1e-12)
+        g_a, g_b = np.dot(p - t, scores), np.sum(p - t)
+        h_aa, h_ab, h_bb = np.dot(w, scores * scores), np.dot(w, scores), np.sum(w)
+        det = h_aa * h_bb - h_ab * h_ab
+        if abs(det) < 1e-12:
+            break
+        da = (h_bb * g_a - h_ab * g_b) / det
+        db = (h_aa * g_b - h_ab * g_a) / det
+        a, b = a - da, b - db
+        if abs(da) < 1e-9 and abs(db) < 1e-9:
+            break
+    return {"method": "platt", "a": float(a), "b": float(b)}
+
+
+def apply_calibration(score, calibration: Dict[str, float]):
+    return 1 / (1 + np.exp(-(calibration["a"] * score + calibration["b"])))
@@ -0,0 +1,147 @@
+"""
+Hyperparameter search for the supervised ensemble members.
+
+- Successive halving (HalvingRandomSearchCV) spread across all cores
+- XGBoost candidates stop early on the validation split, and the winner is refit
+  with exactly the number of trees it needed
+- Every fold reuses the one precomputed feature matrix (features are never re-extracted)
+- A latency/accuracy report for the best candidates, so a smaller/shallower model
+  can be picked when it costs little accuracy
+"""
+
+import time
+import numpy as np
+import pandas as pd
+from typing import Dict, Any, List, Tuple
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+from sklearn.model_selection import HalvingRandomSearchCV, StratifiedKFold
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import f1_score, roc_auc_score
+from xgboost import XGBClassifier
+
+DEFAULT_SEARCH_SPACE = {
+    "xgboost": {
+        "max_depth": [2, 3, 4, 5, 6],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "n_estimators": [100, 200, 400],
+        "min_child_weight": [1, 3, 5],
+        "subsample": [0.7, 0.85, 1.0],
+        "colsample_bytree": [0.6, 0.8, 1.0],
+    },
+    "logreg": {
+        "C": [0.01, 0.03, 0.1, 0.3, 1.0, 3.0, 10.0],
+    },
+}
+
+def single_row_latency_ms(model, X: pd.DataFrame, repeats: int = 200) -> float:
+    """Median wall time of predict_proba on one row, the shape of a live request"""
+    row = X.iloc[[0]]
+    model.predict_proba(row)  # warm-up
+    timings = []
+    for i in range(repeats):
+        row = X.iloc[[i % len(X)]]
+        t = time.perf_counter()
+        model.predict_proba(row)
+        timings.append((time.perf_counter() - t) * 1000)
+    return float(np.median(timings))
+
+def _evaluate(model, X_val, y_val, threshold: float = 0.5) -> Dict[str, float]:
+    proba = model.predict_proba(X_val)[:, 1]
+    return {
+        "val_f1": float(f1_score(y_val, (proba > threshold).astype(int))),
+        "val_auc": float(roc_auc_score(y_val, proba)),
+    }
+
+def search_xgboost(X_train, y_train, X_val, y_val, space: Dict[str, List] = None, n_candidates: int = 48,
+                   cv: int = 3, early_stopping_rounds: int = 30, n_jobs: int = -1, top_k: int = 5,
+                   random_state: int = 42) -> Tuple[XGBClassifier, List[Dict[str, Any]]]:
+    """
+    Returns (compact best model, report rows). Each candidate is single-threaded so the
+    search itself can use every core.
+    """
+    space = space or DEFAULT_SEARCH_SPACE["xgboost"]
+    base = XGBClassifier(
+        tree_method='hist',
+        eval_metric='logloss',
+        early_stopping_rounds=early_stopping_rounds,
+        random_state=random_state,
+        n_jobs=1
+    )
+    search = HalvingRandomSearchCV(
+        base, space, n_candidates=n_candidates, factor=3,
+        cv=StratifiedKFold(cv, shuffle=True, random_state=random_state),
+        scoring='f1', n_jobs=n_jobs, random_state=random_state, refit=False
+    )
+    # eval_set is forwarded to every candidate fit -> early stopping on the validation split
+    search.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+
+    report = []
+    for params in _top_params(search, top_k):
+        model = XGBClassifier(**{**base.get_params(), **params})
+        model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+        trees = int(model.best_iteration) + 1
+
+        # Refit without the unused tail of trees: smaller model, same predictions
+        compact = XGBClassifier(**{**base.get_params(), **params, "n_estimators": trees,
+                                   "early_stopping_rounds": None, "n_jobs": -1})
+        compact.fit(X_train, y_train)
+        report.append({
+            "model": "xgboost",
+            "params": {**params, "n_estimators": trees},
+            "trees": trees,
+            **_evaluate(compact, X_val, y_val),
+            "latency_ms": single_row_latency_ms(compact, X_val),
+            "_estimator": compact,
+        })
+    return _pick(report)
+
+def search_logreg(X_train, y_train, X_val, y_val, space: Dict[str, List] = None, cv: int = 3,
+                  n_jobs: int = -1, top_k: int = 3, random_state: int = 42):
+    space = space or DEFAULT_SEARCH_SPACE["logreg"]
+    base = LogisticRegression(max_iter=2000, class_weight='balanced', random_state=random_state)
+    n_candidates = int(np.prod([len(v) for v in space.values()]))
+    search = HalvingRandomSearchCV(
+        base, space, n_candidates=n_candidates, factor=2,
+        cv=StratifiedKFold(cv, shuffle=True, random_state=random_state),
+        scoring='f1', n_jobs=n_jobs, random_state=random_state, refit=False
+    )
+    search.fit(X_train, y_train)
+
+    report = []
+    for params in _top_params(search, top_k):
+        model = LogisticRegression(**{**base.get_params(), **params})
+        model.fit(X_train, y_train)
+        report.append({
+            "model": "logreg",
+            "params": params,
+            **_evaluate(model, X_val, y_val),
+            "latency_ms": single_row_latency_ms(model, X_val),
+            "_estimator": model,
+        })
+    return _pick(report)
+
+def _top_params(search, k: int) -> List[Dict[str, Any]]:
+    """Best k parameter sets from the last (largest-resource) halving round"""
+    results = pd.DataFrame(search.cv_results_)
+    last = results[results["iter"] == results["iter"].max()]
+    last = last.sort_values("mean_test_score", ascending=False).head(k)
+    return list(last["params"])
+
+def _pick(report: List[Dict[str, Any]], f1_tolerance: float = 0.005):
+    """
+    Cheapest candidate within f1_tolerance of the best validation F1.
+    Accuracy ties go to the faster model.
+    """
+    best_f1 = max(r["val_f1"] for r in report)
+    eligible = [r for r in report if r["val_f1"] >= best_f1 - f1_tolerance]
+    chosen = min(eligible, key=lambda r: r["latency_ms"])
+    for r in report:
+        r["selected"] = r is chosen
+    return chosen.pop("_estimator"), [{k: v for k, v in r.items() if k != "_estimator"} for r in report]
+
+def print_report(rows: List[Dict[str, Any]]):
+    print(f"   {'model':<8} {'trees':>5} {'val_f1':>7} {'val_auc':>7} {'lat_ms':>7}  params")
+    for r in rows:
+        mark = "*" if r.get("selected") else " "
+        print(f" {mark} {r['model']:<8} {str(r.get('trees', '-')):>5} {r['val_f1']:>7.3f} "
+              f"{r['val_auc']:>7.3f} {r['latency_ms']:>7.3f}  {r['params']}")
@@ -1,5 +1,9 @@
 import os
 import sys
+import copy
+import json
+import time
+import hashlib
 import pickle
 import numpy as np
 import pandas as pd
@@ -7,11 +11,24 @@ import subprocess
 import re
 from datasets import load_dataset
 from sklearn.ensemble import IsolationForest
-from sklearn.linear_model import LogisticRegression
-from sklearn.model_selection import train_test_split, GridSearchCV
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.model_selection import train_test_split
 from sklearn.metrics import f1_score
-from xgboost import XGBClassifier
-from ML.features.feature_extractor import FeatureExtractor
+from xgboost import XGBClassifier, XGBRegressor
+from ML.features.feature_extractor import FeatureExtractor, CHEAP_FEATURES
+from ML.core.ml_firewall import ensemble_scores
+from ML.core.compiled_trees import compile_models, probe_matrix
+from ML.core.prefilter import Prefilter, load_patterns, skip_curve
+from ML.training.calibration import search_ensemble, fit_platt
+from NLP.core.dedup import dedup_near_duplicates, print_cluster_report
+from NLP.core.artifact_registry import ArtifactRegistry, standard_artifacts
+
+def iso_norm(model, Data):
+    """Map IsolationForest.score_samples to 0-1 with High Value = Anomaly (gain 10, same as MLFirewall)"""
+    return 1 / (1 + np.exp(model.score_samples(Data) * 10))
+
+def prompt_key(prompt):
+    return hashlib.sha1(prompt.encode('utf-8', errors='ignore')).hexdigest()
 
 class TrainingPipeline:
     def __init__(self, data_dir="data"):
@@ -19,11 +36,39 @@ class TrainingPipeline:
         # Resolve paths relative to this script or project root
         self.root_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         self.model_dir = os.path.join(self.root_dir, "ML", "models")
+        # Featurized training set kept next to the models so incremental updates can replay it
+        self.cache_path = os.path.join(self.model_dir, "training_cache.pkl")
+        # Per-prompt feature dicts, so repeated runs (and searches) never re-parse a prompt
+        self.feature_cache_path = os.path.join(self.model_dir, "feature_cache.pkl")
         self.nlp_data_dir = os.path.join(self.root_dir, "NLP", "data", "lethal_dataset")
+        # NLP pattern DB: regex fast-fail + trigram index used by the prefilter
+        self.patterns_path = os.path.join(self.root_dir, "NLP", "data", "patterns", "latest.json")
+        # Near-duplicate collapsing of local jailbreaks, same `dedup` section of
+        # NLP/config/system.yaml as NLP/train.py (threshold = estimated Jaccard)
+        dedup_cfg = self._load_system_config().get('dedup', {})
+        self.dedup_enabled = dedup_cfg.get('enabled', True)
+        self.dedup_threshold = dedup_cfg.get('threshold', 0.8)
+        self.dedup_num_perm = dedup_cfg.get('num_perm', 64)
+        
+        # Live patterns/weights/models are recorded as registry releases around every model
+        # update, so a run can be rolled back with `NLP/cli.py rollback --to <release>`
+        nlp_dir = os.path.join(self.root_dir, "NLP")
+        self.registry = ArtifactRegistry(
+            os.path.join(nlp_dir, "data", "registry"),
+            standard_artifacts(self.patterns_path, os.path.join(nlp_dir, "config", "weights.json"), self.model_dir))
         
         os.makedirs(self.model_dir, exist_ok=True)
         self.extractor = FeatureExtractor()
 
+    def _load_system_config(self):
+        """NLP/config/system.yaml, empty if unavailable"""
+        try:
+            import yaml
+            with open(os.path.join(self.root_dir, "NLP", "config", "system.yaml"), "r") as f:
+                return yaml.safe_load(f) or {}
+        except Exception:
+            return {}
+
     def _get_local_jailbreaks(self):
         """
         PRIORITY 1: Look for JSONL files in DataExtractor/data
@@ -72,7 +117,12 @@ class TrainingPipeline:
                                         prompts.append(m.group(1).strip())
                         except: pass
 
-        prompts = list(set(prompts))
+        prompts = list(dict.fromkeys(prompts))
+        # Collapse near-duplicate variants (renamed personas, one-line edits) to one representative
+        if self.dedup_enabled and prompts:
+            dedup = dedup_near_duplicates(prompts, threshold=self.dedup_threshold, num_perm=self.dedup_num_perm)
+            print_cluster_report(dedup, prompts)
+            prompts = [prompts[i] for i in dedup['keep']]
         print(f"   -> Successfully extracted {len(prompts)} REAL jailbreaks.")
         return prompts
 
@@ -138,17 +188,27 @@ class TrainingPipeline:
         print(f"📦 Final Dataset: {len(X_raw)} total samples ({len(X_class1)} Malicious, {len(X_class0)} Benign)")
         return X_raw, y_raw
 
-    def extract_features(self, X_raw):
+    def extract_features(self, X_raw, use_cache=True):
         print("⚙️  [2/5] Extracting Features (this may take a while)...")
-        features_list = []
-        for i, prompt in enumerate(X_raw):
-            feats = self.extractor.extract_all(prompt)
-            features_list.append(feats)
-            if i > 0 and i % 500 == 0:
-                print(f"   Processed {i}/{len(X_raw)} samples...", end='\r')
+        cache = self._load_feature_cache() if use_cache else {}
+        keys = [prompt_key(p) for p in X_raw]
+        missing = list({k: p for k, p in zip(keys, X_raw) if k not in cache}.items())
+        if use_cache:
+            print(f"   {len(X_raw) - len(missing)} cached, {len(missing)} to extract.")
+
+        chunk = 500
+        for i in range(0, len(missing), chunk):
+            batch = missing[i:i + chunk]
+            for (k, _), feats in zip(batch, self.extractor.extract_batch([p for _, p in batch])):
+                cache[k] = feats
+            print(f"   Processed {min(i + chunk, len(missing))}/{len(missing)} samples...", end='\r')
         print(f"   Processed {len(X_raw)}/{len(X_raw)} samples. Done.")
+
+        if use_cache and missing:
+            self._dump({"version": FeatureExtractor.VERSION, "features": cache},
+                       os.path.basename(self.feature_cache_path))
         
-        df = pd.DataFrame(features_list)
+        df = pd.DataFrame([cache[k] for k in keys])
         # Handle potential NaNs
         df = df.fillna(0)
         # Ensure column order is alphabetical for consistency with inference
@@ -156,12 +216,23 @@ class TrainingPipeline:
         df = df[cols]
         return df
 
-    def train(self):
+    def train(self, objective="f1", fn_cost=1.0, fp_cost=1.0, search=False, search_candidates=48,
+              distill=False, prefilter=False, prefilter_max_leak=0.001):
+        """
+        Full training run.
+        objective: 'f1', or 'cost' to minimize fn_cost * FN + fp_cost * FP when
+        picking ensemble weights and threshold.
+        search: run a successive-halving hyperparameter search for XGBoost and
+        Logistic Regression instead of the fixed settings.
+        distill: also export a compact fast-path student model (see distill()).
+        prefilter: also train the parse-free prefilter (see train_prefilter()).
+        """
         # 1. Data
         X_raw, y_raw = self.load_and_prep_data(samples=6000) # Aim for 3k each
         if not X_raw:
             print("❌ No data loaded. Aborting.")
             return
+        self._checkpoint("before training")
 
         X = self.extract_features(X_raw)
         y = np.array(y_raw)
@@ -180,91 +251,453 @@ class TrainingPipeline:
         iso = IsolationForest(n_estimators=100, contamination=0.1, random_state=42, n_jobs=-1)
         iso.fit(X) 
         
-        # B. Logistic Regression (Linear)
-        print("   -> Training Logistic Regression...")
-        logreg = LogisticRegression(max_iter=2000, class_weight='balanced', random_state=42)
-        logreg.fit(X_train, y_train)
-        
-        # C. XGBoost (Non-Linear)
-        print("   -> Training XGBoost...")
-        xgb = XGBClassifier(
-            n_estimators=200, 
-            max_depth=6, 
-            learning_rate=0.05, 
-            tree_method='hist', # fast on CPU
-            random_state=42,
-            n_jobs=-1
-        )
-        xgb.fit(X_train, y_train)
+        if search:
+            logreg, xgb = self._search_models(X_train, y_train, X_val, y_val, search_candidates)
+        else:
+            # B. Logistic Regression (Linear)
+            print("   -> Training Logistic Regression...")
+            logreg = LogisticRegression(max_iter=2000, class_weight='balanced', random_state=42)
+            logreg.fit(X_train, y_train)
+            
+            # C. XGBoost (Non-Linear)
+            print("   -> Training XGBoost...")
+            xgb = XGBClassifier(
+                n_estimators=200, 
+                max_depth=6, 
+                learning_rate=0.05, 
+                tree_method='hist', # fast on CPU
+                random_state=42,
+                n_jobs=-1
+            )
+            xgb.fit(X_train, y_train)
 
         print("⚖️  [4/5] Optimizing Ensemble...")
         
         # Normalize scores
-        def get_iso_norm(model, Data):
-            # score_samples returns negative values (closer to 0 is better, more negative is anomaly)
-            # e.g -0.4 to -0.8. 
-            s = model.score_samples(Data)
-            # We want High Value = Anomaly.
-            # So -0.8 (anomaly) -> 0.9
-            # -0.4 (normal) -> 0.1
-            # Sigmoid on negative input: 1 / (1 + exp(-x)) -> x is negative, exp(-x) is large, result small
-            # We need to flip 's' or adjust gain.
-            # Let's try: 1 / (1 + exp(s * 5)) -> -0.4*5 = -2 -> exp(-2)=0.13 -> 1/1.13 = 0.88 (Wait, normal is high?)
-            # Standard IF logic: "Score is opposite of anomaly score". Lower = Anomaly.
-            # So -0.8 < -0.4.
-            # If we want Anomaly=1.0, we need function that maps Large Negative to 1.0.
-            # Sigmoid(-s): -(-0.8)=0.8 -> High. -(-0.4)=0.4 -> Lower.
-            return 1 / (1 + np.exp(s * 10)) # Sharper slope
-            
-        anom_val = get_iso_norm(iso, X_val)
+        # score_samples returns negative values (closer to 0 is better, more negative is anomaly)
+        # e.g -0.4 to -0.8. Standard IF logic: "Score is opposite of anomaly score". Lower = Anomaly.
+        # Sigmoid(-s * 10): -0.8 (anomaly) -> High, -0.4 (normal) -> Lower. Sharper slope than gain 5.
+        anom_val = iso_norm(iso, X_val)
         lr_val = logreg.predict_proba(X_val)[:, 1]
         xgb_val = xgb.predict_proba(X_val)[:, 1]
         
-        best_f1 = 0
-        best_w = (0.3, 0.3, 0.4)
-        best_t = 0.7
+        # Vectorized search over the weight simplex (0.05 steps) and every threshold
+        component_scores = np.column_stack([anom_val, lr_val, xgb_val])
+        search = search_ensemble(component_scores, y_val, objective=objective, fn_cost=fn_cost, fp_cost=fp_cost)
+        best_w, best_t = search['weights'], search['threshold']
         
-        # Quick coarse grid search
-        weights_to_try = [
-            (0.1, 0.3, 0.6),
-            (0.2, 0.3, 0.5),
-            (0.3, 0.3, 0.4),
-            (0.4, 0.2, 0.4)
-        ]
-        
-        for w in weights_to_try:
-            # Ensure sum is approx 1 (it is for these tuples)
-            score = (w[0]*anom_val + w[1]*lr_val + w[2]*xgb_val)
-            for t in [0.6, 0.7, 0.8, 0.85]:
-                preds = (score > t).astype(int)
-                f1 = f1_score(y_val, preds)
-                if f1 > best_f1:
-                    best_f1 = f1
-                    best_w = w
-                    best_t = t
+        # Calibrate the final ensemble score into a probability (Platt scaling)
+        val_score = component_scores @ np.array(best_w)
+        calibration = fit_platt(val_score, y_val)
+        best_f1 = f1_score(y_val, (val_score > best_t).astype(int))
                     
-        print(f"   Best Weights: {best_w} | Best Threshold: {best_t} | Val F1: {best_f1:.3f}")
+        print(f"   Searched {search['grid_size']} weight vectors | Objective: {objective} ({search['value']:.3f})")
+        print(f"   Best Weights: {best_w} | Best Threshold: {best_t:.3f} | Val F1: {best_f1:.3f}")
 
         # Save
         print(f"💾 [5/5] Saving Artifacts to {self.model_dir}...")
-        with open(os.path.join(self.model_dir, "isolation_forest.pkl"), "wb") as f:
-            pickle.dump(iso, f)
-        with open(os.path.join(self.model_dir, "logistic_regression.pkl"), "wb") as f:
-            pickle.dump(logreg, f)
-        with open(os.path.join(self.model_dir, "xgboost.pkl"), "wb") as f:
-            pickle.dump(xgb, f)
-            
         config = {
             "weights": best_w,
             "threshold": best_t,
             "anomaly_threshold": 0.5,
-            "feature_names": feature_names
+            "feature_names": feature_names,
+            "objective": {"name": objective, "fn_cost": fn_cost, "fp_cost": fp_cost},
+            "calibration": calibration
         }
-        with open(os.path.join(self.model_dir, "ensemble_config.pkl"), "wb") as f:
-            pickle.dump(config, f)
+        if prefilter:
+            # Positives for the prefilter = attacks plus anything the full ensemble blocks
+            teacher_block = ensemble_scores(iso, logreg, xgb, X, config)['final'] > best_t
+            config["prefilter"] = self.train_prefilter(X_raw, y, teacher_block, max_leak=prefilter_max_leak)
+        self._save_models(iso, logreg, xgb, config)
+        self._save_cache({
+            "X": X,
+            "y": y,
+            "holdout_idx": X_test.index,
+            "seen": {prompt_key(p) for p in X_raw}
+        })
+        self._checkpoint(f"train: objective={objective}, val F1 {best_f1:.3f}")
             
         print("✅ Training Complete!")
 
+        if distill:
+            self.distill(sample_prompts=X_raw[:200])
+
+    def train_prefilter(self, X_raw, y, teacher_block=None, max_leak=0.001):
+        """
+        Tiny logistic model over string-level signals (see ML/core/prefilter.py).
+
+        The skip threshold is the highest one where at most `max_leak` of the
+        validation positives (attack labels, plus full-pipeline blocks when
+        teacher_block is given) would skip the full pipeline. The whole
+        skip/leak curve is saved so the operating point can be moved at load time.
+        """
+        print("\n🚦 Training parse-free prefilter...")
+        y = np.asarray(y)
+        trigrams, regexes = load_patterns(self.patterns_path)
+        pre = Prefilter(self.extractor.marker_groups(), trigrams, regexes)
+
+        t = time.perf_counter()
+        F = pre.matrix(X_raw)
+        feature_ms = (time.perf_counter() - t) * 1000 / max(len(X_raw), 1)
+
+        # Same split as the ensemble, so validation prompts were never fit on
+        tr, va = train_test_split(np.arange(len(X_raw)), test_size=0.3, stratify=y, random_state=42)
+        mean, scale = F[tr].mean(axis=0), F[tr].std(axis=0)
+        scale[scale == 0] = 1.0
+        lr = LogisticRegression(max_iter=1000, class_weight='balanced', random_state=42)
+        lr.fit((F[tr] - mean) / scale, y[tr])
+        # Fold the standardization into the weights: one dot product at inference
+        coef = lr.coef_[0] / scale
+        pre.model = {"coef": coef, "intercept": float(lr.intercept_[0] - np.dot(coef, mean))}
+
+        scores = pre.score_matrix(F[va])
+        scores = np.where(F[va, pre.feature_names.index("regex_hit")] > 0, 1.0, scores)  # regex hits never skip
+        positive = y[va] == 1
+        if teacher_block is not None:
+            positive = positive | np.asarray(teacher_block)[va]
+        pre.curve = skip_curve(scores, positive)
+        pre.configure(max_leak=max_leak)
+
+        skipped = scores < pre.threshold
+        label_recall = float(1 - skipped[y[va] == 1].mean()) if (y[va] == 1).any() else 1.0
+        report = {
+            "max_leak": max_leak,
+            "threshold": pre.threshold,
+            "skip_rate": float(skipped.mean()),
+            "benign_skip_rate": float(skipped[y[va] == 0].mean()) if (y[va] == 0).any() else 0.0,
+            "attack_recall": label_recall,
+            "feature_ms": feature_ms,
+        }
+        if teacher_block is not None:
+            blocked = np.asarray(teacher_block)[va]
+            # Of what the full pipeline blocks, how much still reaches it
+            report["full_pipeline_recall"] = float(1 - skipped[blocked].mean()) if blocked.any() else 1.0
+
+        print(f"   Threshold {pre.threshold:.4f} (max leak {max_leak:.2%}) | Skips {report['skip_rate']:.1%} of traffic, "
+              f"{report['benign_skip_rate']:.1%} of benign")
+        print(f"   Recall: attacks {label_recall:.2%}"
+              + (f" | full pipeline {report['full_pipeline_recall']:.2%}" if 'full_pipeline_recall' in report else "")
+              + f" | {feature_ms:.3f}ms/prompt")
+        self._dump(pre, "prefilter.pkl")
+        return report
+
+    def distill(self, kind="gbdt", agreement_target=0.995, sample_prompts=None):
+        """
+        Fit a small student to the ensemble's final_score on parse-free features only.
+
+        - kind: 'gbdt' (shallow XGBoost regressor) or 'linear' (ridge)
+        - The student's uncertainty band around the threshold is the narrowest one
+          where student and ensemble verdicts agree on >= agreement_target of the
+          held-out prompts outside it. MLFirewall answers from the student outside
+          the band and escalates to spaCy + full ensemble inside it.
+        Works from the cached training features, so no prompt is re-parsed.
+        """
+        print("\n🎓 Distilling fast-path student model...")
+        models = self._load_models()
+        cache = self._load_cache()
+        if models is None or cache is None:
+            print("❌ No trained models / feature cache found. Run a full `train` once first.")
+            return None
+        iso, logreg, xgb, config = models
+        X = cache['X'].reindex(columns=config['feature_names'], fill_value=0)
+        threshold = float(config['threshold'])
+
+        # Teacher targets: exactly the score MLFirewall would return
+        teacher = ensemble_scores(iso, logreg, xgb, X, config)['final']
+
+        is_holdout = X.index.isin(cache['holdout_idx'])
+        X_cheap = X[CHEAP_FEATURES].astype(float)
+        X_fit, y_fit = X_cheap[~is_holdout], teacher[~is_holdout]
+        X_val, y_val = X_cheap[is_holdout], teacher[is_holdout]
+
+        if kind == "linear":
+            student = Ridge(alpha=1.0)
+        else:
+            student = XGBRegressor(n_estimators=40, max_depth=3, learning_rate=0.2,
+                                   tree_method='hist', random_state=42, n_jobs=1)
+        student.fit(X_fit, y_fit)
+
+        s_val = np.clip(student.predict(X_val), 0.0, 1.0)
+        student_block = s_val > threshold
+        teacher_block = y_val > threshold
+        agree = student_block == teacher_block
+
+        # Narrowest symmetric band meeting the agreement target outside it
+        margin = 0.5
+        for m in np.linspace(0.0, 0.5, 101):
+            outside = np.abs(s_val - threshold) > m
+            if not outside.any() or agree[outside].mean() >= agreement_target:
+                margin = float(m)
+                break
+        band = (max(0.0, threshold - margin), min(1.0, threshold + margin))
+        outside = (s_val < band[0]) | (s_val > band[1])
+        escalation_rate = float(1 - outside.mean())
+        outside_agreement = float(agree[outside].mean()) if outside.any() else 1.0
+        # Final verdicts: student outside the band, ensemble inside it
+        cascade_agreement = float(outside_agreement * outside.mean() + (1 - outside.mean()))
+
+        report = {
+            "kind": kind,
+            "features": list(CHEAP_FEATURES),
+            "band": band,
+            "raw_agreement": float(agree.mean()),
+            "outside_band_agreement": outside_agreement,
+            "cascade_agreement": cascade_agreement,
+            "escalation_rate": escalation_rate,
+            "score_mae": float(np.abs(s_val - y_val).mean()),
+            **self._distill_speed(student, iso, logreg, xgb, config, sample_prompts)
+        }
+
+        print(f"   Band: [{band[0]:.3f}, {band[1]:.3f}] | Escalation: {escalation_rate:.1%}")
+        print(f"   Agreement: raw {report['raw_agreement']:.1%} | outside band {outside_agreement:.1%} | cascade {cascade_agreement:.1%}")
+        if 'student_ms' in report:
+            print(f"   Speed per prompt: student {report['student_ms']:.3f}ms vs full {report['full_ms']:.3f}ms")
+
+        self._checkpoint("before distill")
+        self._dump(student, "student.pkl")
+        self._export_compiled({"student": student}, config['feature_names'])
+        config = {**config, "student": report}
+        self._dump(config, "ensemble_config.pkl")
+        print(f"💾 Student exported to {self.model_dir}")
+        self._checkpoint(f"distill: {kind} student, cascade agreement {cascade_agreement:.3f}")
+        return report
+
+    def _distill_speed(self, student, iso, logreg, xgb, config, sample_prompts):
+        """Median per-prompt time: cheap features + student vs parse + features + ensemble"""
+        sample_prompts = [p for p in (sample_prompts or []) if p][:200]
+        if not sample_prompts:
+            return {}
+        student_t, full_t = [], []
+        for p in sample_prompts:
+            t = time.perf_counter()
+            f = self.extractor.extract_cheap(p)
+            student.predict(pd.DataFrame([[f[k] for k in CHEAP_FEATURES]], columns=CHEAP_FEATURES, dtype=float))
+            student_t.append((time.perf_counter() - t) * 1000)
+
+            t = time.perf_counter()
+            f = self.extractor.extract_all(p)
+            row = pd.DataFrame([[f.get(k, 0) for k in config['feature_names']]], columns=config['feature_names'])
+            ensemble_scores(iso, logreg, xgb, row, config)
+            full_t.append((time.perf_counter() - t) * 1000)
+        return {"student_ms": float(np.median(student_t)), "full_ms": float(np.median(full_t))}
+
+    def train_incremental(self, prompts=None, labels=None, new_trees=25, window=5000,
+                          replay=2000, tolerance=0.01):
+        """
+        Patch the current models with new cases instead of retraining from scratch.
+
+        - prompts/labels: New cases (labels default to 1 = jailbreak). If omitted, local
+          jailbreak sources are rescanned and only prompts never trained on are used.
+        - XGBoost continues boosting `new_trees` extra rounds from the existing booster
+        - Logistic Regression is warm-started from its current coefficients
+        - Isolation Forest is refit on a sliding window of the last `window` rows,
+          keeping the class mix of the full training set (see _recent_window)
+        Candidates only replace the live models if held-out F1 does not drop by more
+        than `tolerance`.
+        """
+        print("🩹 [1/5] Loading current models and feature cache...")
+        models = self._load_models()
+        cache = self._load_cache()
+        if models is None or cache is None:
+            print("❌ No trained models / feature cache found. Run a full `train` once first.")
+            return None
+        iso, logreg, xgb, config = models
+        feature_names = config['feature_names']
+        X_cache = cache['X'].reindex(columns=feature_names, fill_value=0)
+        y_cache = np.asarray(cache['y'])
+
+        if prompts is None:
+            prompts = self._get_local_jailbreaks()
+        if labels is None:
+            labels = [1] * len(prompts)
+
+        new_cases = {}
+        for p, label in zip(prompts, labels):
+            key = prompt_key(p)
+            if p and key not in cache['seen']:
+                new_cases[key] = (p, int(label))
+        if not new_cases:
+            print("✅ Nothing new to learn. Models unchanged.")
+            return {"new_cases": 0, "promoted": False}
+
+        print(f"   -> {len(new_cases)} new cases to learn from.")
+        new_prompts = [p for p, _ in new_cases.values()]
+        X_new = self.extract_features(new_prompts).reindex(columns=feature_names, fill_value=0)
+        # Continue the cache index so holdout indices stay unique
+        X_new.index = np.arange(len(X_new)) + (int(X_cache.index.max()) + 1 if len(X_cache) else 0)
+        y_new = np.array([label for _, label in new_cases.values()])
+
+        # Hold out a slice of the new cases (and keep the original test split) for validation
+        rng = np.random.RandomState(42)
+        perm = rng.permutation(len(X_new))
+        n_hold = int(len(X_new) * 0.2) if len(X_new) >= 5 else 0
+        hold_pos, fit_pos = perm[:n_hold], perm[n_hold:]
+
+        is_holdout = X_cache.index.isin(cache['holdout_idx'])
+        X_pool, y_pool = X_cache[~is_holdout], y_cache[~is_holdout]
+        X_hold = pd.concat([X_cache[is_holdout], X_new.iloc[hold_pos]])
+        y_hold = np.concatenate([y_cache[is_holdout], y_new[hold_pos]])
+
+        # Replay a sample of past data so the update does not forget the benign manifold
+        replay_pos = rng.choice(len(X_pool), size=min(replay, len(X_pool)), replace=False)
+        X_fit = pd.concat([X_pool.iloc[replay_pos], X_new.iloc[fit_pos]])
+        y_fit = np.concatenate([y_pool[replay_pos], y_new[fit_pos]])
+
+        print(f"🧠 [3/5] Updating models on {len(X_fit)} rows ({len(fit_pos)} new)...")
+        print(f"   -> XGBoost: +{new_trees} boosting rounds")
+        xgb_new = XGBClassifier(**{**xgb.get_params(), "n_estimators": new_trees})
+        xgb_new.fit(X_fit, y_fit, xgb_model=xgb.get_booster())
+
+        print("   -> Logistic Regression: warm start")
+        logreg_new = copy.deepcopy(logreg)
+        logreg_new.set_params(warm_start=True)
+        logreg_new.fit(X_fit, y_fit)
+
+        print(f"   -> Isolation Forest: refit on last {window} rows")
+        X_window = self._recent_window(pd.concat([X_pool, X_new.iloc[fit_pos]]),
+                                       np.concatenate([y_pool, y_new[fit_pos]]), window)
+        iso_new = IsolationForest(**iso.get_params())
+        iso_new.fit(X_window)
+
+        print("🔍 [4/5] Validating on held-out slice...")
+        w, t = config['weights'], config['threshold']
+        old_f1 = f1_score(y_hold, self._ensemble_predict(iso, logreg, xgb, X_hold, w, t), zero_division=0)
+        new_f1 = f1_score(y_hold, self._ensemble_predict(iso_new, logreg_new, xgb_new, X_hold, w, t), zero_division=0)
+        # How many of the new cases would the candidate now catch
+        new_X, new_y = X_new.iloc[fit_pos], y_new[fit_pos]
+        old_hit = (self._ensemble_predict(iso, logreg, xgb, new_X, w, t) == new_y).mean() if len(new_y) else 1.0
+        new_hit = (self._ensemble_predict(iso_new, logreg_new, xgb_new, new_X, w, t) == new_y).mean() if len(new_y) else 1.0
+        print(f"   Held-out F1: {old_f1:.3f} -> {new_f1:.3f} | New-case accuracy: {old_hit:.1%} -> {new_hit:.1%}")
+
+        promoted = new_f1 >= old_f1 - tolerance
+        if promoted:
+            print(f"💾 [5/5] Promoting updated models to {self.model_dir}...")
+            self._checkpoint("before incremental update")
+            self._save_models(iso_new, logreg_new, xgb_new, config)
+            self._save_cache({
+                "X": pd.concat([X_cache, X_new]),
+                "y": np.concatenate([y_cache, y_new]),
+                "holdout_idx": cache['holdout_idx'].append(X_new.index[hold_pos]),
+                "seen": cache['seen'] | set(new_cases)
+            })
+            self._checkpoint(f"update: +{len(new_cases)} cases, held-out F1 {old_f1:.3f} -> {new_f1:.3f}")
+            print("✅ Incremental update complete!")
+            if 'student' in config:
+                # The student mimics the old ensemble; refit it to the promoted one
+                self.distill(kind=config['student'].get('kind', 'gbdt'), sample_prompts=[p for p, _ in new_cases.values()][:200])
+        else:
+            print("⛔ [5/5] Candidate regressed on held-out data. Live models unchanged.")
+
+        return {
+            "new_cases": len(new_cases),
+            "promoted": promoted,
+            "holdout_f1": {"before": old_f1, "after": new_f1},
+            "new_case_accuracy": {"before": float(old_hit), "after": float(new_hit)}
+        }
+
+    @staticmethod
+    def _recent_window(X, y, window):
+        """
+        Most recent `window` rows with the class mix of X: per class, the latest rows by
+        index (it grows with insertion) up to that class's share of the window. The cache
+        stores a full run's rows one class after the other, so a plain tail would refit
+        the Isolation Forest on benign prompts only.
+        """
+        if len(X) <= window:
+            return X
+        order = np.argsort(X.index.to_numpy(), kind='stable')
+        picked = []
+        for label in np.unique(y):
+            pos = order[y[order] == label]
+            quota = int(round(window * len(pos) / len(X)))
+            picked.append(pos[len(pos) - quota:])
+        return X.iloc[np.sort(np.concatenate(picked))]
+
+    def _search_models(self, X_train, y_train, X_val, y_val, n_candidates):
+        """Hyperparameter search for LogReg + XGBoost, writes search_report.json"""
+        from ML.training.hyperparam_search import search_logreg, search_xgboost, print_report
+
+        print(f"   -> Searching XGBoost ({n_candidates} candidates, successive halving, early stopping)...")
+        xgb, xgb_report = search_xgboost(X_train, y_train, X_val, y_val, n_candidates=n_candidates)
+        print_report(xgb_report)
+
+        print("   -> Searching Logistic Regression...")
+        logreg, logreg_report = search_logreg(X_train, y_train, X_val, y_val)
+        print_report(logreg_report)
+
+        with open(os.path.join(self.model_dir, "search_report.json"), "w") as f:
+            json.dump({"xgboost": xgb_report, "logreg": logreg_report}, f, indent=2, default=str)
+        return logreg, xgb
+
+    def _load_feature_cache(self):
+        if not os.path.exists(self.feature_cache_path):
+            return {}
+        with open(self.feature_cache_path, "rb") as f:
+            cache = pickle.load(f)
+        if cache.get("version") != FeatureExtractor.VERSION:
+            print("   Feature definitions changed, discarding feature cache.")
+            return {}
+        return cache["features"]
+
+    def _ensemble_predict(self, iso, logreg, xgb, X, weights, threshold):
+        score = (weights[0] * iso_norm(iso, X) +
+                 weights[1] * logreg.predict_proba(X)[:, 1] +
+                 weights[2] * xgb.predict_proba(X)[:, 1])
+        return (score > threshold).astype(int)
+
+    def _dump(self, obj, name):
+        # Write-then-rename so a running server never reads a half-written pickle
+        path = os.path.join(self.model_dir, name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(obj, f)
+        os.replace(tmp_path, path)
+
+    def _checkpoint(self, description):
+        """Record the live artifacts as a registry release (no-op when nothing changed)"""
+        try:
+            release = self.registry.create(description)
+            print(f"   📌 Release {release['id']} ({release['description']})")
+        except OSError as e:
+            print(f"   ⚠️ Could not record release ({description}): {e}")
+
+    def _save_models(self, iso, logreg, xgb, config):
+        self._dump(iso, "isolation_forest.pkl")
+        self._dump(logreg, "logistic_regression.pkl")
+        self._dump(xgb, "xgboost.pkl")
+        self._dump(config, "ensemble_config.pkl")
+        self._export_compiled({"iso_forest": iso, "xgb": xgb}, config['feature_names'])
+
+    def _export_compiled(self, models, feature_names):
+        """Flat-array predictors for MLFirewall, merged into compiled_trees.pkl"""
+        path = os.path.join(self.model_dir, "compiled_trees.pkl")
+        exported = {}
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                exported = pickle.load(f)
+        exported.update(compile_models(models, probe_matrix(feature_names)))
+        self._dump(exported, "compiled_trees.pkl")
+        print(f"   Compiled (verified) trees exported: {sorted(exported)}")
+
+    def _load_models(self):
+        try:
+            loaded = []
+            for name in ("isolation_forest.pkl", "logistic_regression.pkl", "xgboost.pkl", "ensemble_config.pkl"):
+                with open(os.path.join(self.model_dir, name), "rb") as f:
+                    loaded.append(pickle.load(f))
+            return tuple(loaded)
+        except FileNotFoundError:
+            return None
+
+    def _save_cache(self, cache):
+        self._dump(cache, os.path.basename(self.cache_path))
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return None
+        with open(self.cache_path, "rb") as f:
+            return pickle.load(f)
+
 if __name__ == "__main__":
     try:
         pipeline = TrainingPipeline()
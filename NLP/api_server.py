@@ -5,16 +5,17 @@ Phase 1: NLP Module API
 Single endpoint for prompt analysis with jailbreak detection.
 """
 
-from fastapi import FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import time
 import yaml
 import json
 from datetime import datetime
 
 from core.pipeline import DetectionPipeline
+from core.response_profiles import resolve_profile, dumps
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -45,18 +46,31 @@ class AnalyzeRequest(BaseModel):
     user_id: Optional[str] = Field(None, description="Optional user identifier for tracking")
     options: Optional[Dict[str, Any]] = Field(
         default_factory=lambda: {"threshold": 0.55, "return_features": False},
-        description="Analysis options"
+        description="Analysis options ('profile': 'verdict' | 'scores' | 'full' selects the response fields)"
     )
 
 class AnalyzeResponse(BaseModel):
+    """Fields returned by the 'full' profile; 'scores' and 'verdict' return subsets"""
     verdict: str = Field(..., description="Final verdict: 'allow', 'block', or 'review'")
-    score: float = Field(..., description="Risk score between 0 and 1")
-    classification: str = Field(..., description="Classification: 'benign', 'suspicious', or 'borderline'")
+    score: Optional[float] = Field(None, description="Risk score between 0 and 1 (scores, full)")
+    classification: Optional[str] = Field(None, description="Classification: 'benign', 'suspicious', or 'borderline' (scores, full)")
     latency_ms: float = Field(..., description="Processing time in milliseconds")
-    explanation: str = Field(..., description="Human-readable explanation of the decision")
-    features: Optional[Dict[str, Any]] = Field(None, description="Detailed feature breakdown (if requested)")
-    matched_patterns: Optional[list] = Field(None, description="List of matched pattern IDs")
-    timestamp: str = Field(..., description="ISO timestamp of the analysis")
+    explanation: Optional[str] = Field(None, description="Human-readable explanation of the decision (full)")
+    features: Optional[Dict[str, Any]] = Field(None, description="Detailed feature breakdown (full, if requested)")
+    matched_patterns: Optional[list] = Field(None, description="List of matched pattern IDs (full)")
+    timestamp: Optional[str] = Field(None, description="ISO timestamp of the analysis (scores, full)")
+
+class BatchAnalyzeRequest(BaseModel):
+    prompts: List[str] = Field(..., description="Prompts to analyze, results are returned in the same order")
+    user_id: Optional[str] = Field(None, description="Optional user identifier for tracking")
+    options: Optional[Dict[str, Any]] = Field(
+        default_factory=lambda: {"threshold": 0.55, "return_features": False},
+        description="Analysis options (applied to every prompt in the batch)"
+    )
+
+class BatchAnalyzeResponse(BaseModel):
+    results: List[AnalyzeResponse] = Field(..., description="One analysis per prompt, in request order")
+    latency_ms: float = Field(..., description="Total processing time for the batch in milliseconds")
 
 class HealthResponse(BaseModel):
     status: str
@@ -98,6 +112,47 @@ async def startup_event():
 # Track server start time for uptime calculation
 SERVER_START_TIME = time.time()
 
+def request_profile(options: Optional[Dict[str, Any]]) -> str:
+    try:
+        return resolve_profile(options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def json_response(content: Dict[str, Any]) -> Response:
+    """orjson-encoded body, bypassing pydantic validation and jsonable_encoder"""
+    return Response(dumps(content), media_type="application/json")
+
+def build_response(result: Dict[str, Any], latency_ms: float, return_features: bool,
+                   profile: str = "full") -> Dict[str, Any]:
+    """Map a pipeline result onto the public verdict/explanation schema (AnalyzeResponse)"""
+    # Determine verdict based on classification
+    classification = result['classification']
+    if classification == 'suspicious':
+        verdict = 'block'
+        explanation = "Prompt matches known jailbreak patterns with high confidence"
+    elif classification == 'benign':
+        verdict = 'allow'
+        explanation = "Prompt appears safe with no suspicious patterns detected"
+    else:  # borderline
+        verdict = 'review'
+        explanation = "Prompt shows some suspicious characteristics and requires human review"
+
+    if profile == "verdict":
+        return {"verdict": verdict, "latency_ms": round(latency_ms, 2)}
+
+    response = {
+        "verdict": verdict,
+        "score": result['score'],
+        "classification": classification,
+        "latency_ms": round(latency_ms, 2),
+    }
+    if profile == "full":
+        response["explanation"] = explanation
+        response["features"] = result.get('features') if return_features else None
+        response["matched_patterns"] = result.get('matched_patterns', [])
+    response["timestamp"] = datetime.utcnow().isoformat() + 'Z'
+    return response
+
 # Main endpoint: Analyze prompt
 @app.post("/api/v1/analyze", response_model=AnalyzeResponse)
 async def analyze_prompt(request: AnalyzeRequest):
@@ -107,6 +162,7 @@ async def analyze_prompt(request: AnalyzeRequest):
     Returns a verdict (allow/block/review) along with risk score and explanation.
     """
     start_time = time.time()
+    profile = request_profile(request.options)
     
     try:
         # Extract options
@@ -114,36 +170,12 @@ async def analyze_prompt(request: AnalyzeRequest):
         return_features = request.options.get("return_features", False) if request.options else False
         
         # Run detection
-        result = pipeline.detect(request.prompt, user_id=request.user_id)
+        result = pipeline.detect(request.prompt, user_id=request.user_id, profile=profile)
         
         # Calculate latency
         latency_ms = (time.time() - start_time) * 1000
         
-        # Determine verdict based on classification
-        classification = result['classification']
-        if classification == 'suspicious':
-            verdict = 'block'
-            explanation = "Prompt matches known jailbreak patterns with high confidence"
-        elif classification == 'benign':
-            verdict = 'allow'
-            explanation = "Prompt appears safe with no suspicious patterns detected"
-        else:  # borderline
-            verdict = 'review'
-            explanation = "Prompt shows some suspicious characteristics and requires human review"
-        
-        # Build response
-        response = AnalyzeResponse(
-            verdict=verdict,
-            score=result['score'],
-            classification=classification,
-            latency_ms=round(latency_ms, 2),
-            explanation=explanation,
-            features=result.get('features') if return_features else None,
-            matched_patterns=result.get('matched_patterns', []),
-            timestamp=datetime.utcnow().isoformat() + 'Z'
-        )
-        
-        return response
+        return json_response(build_response(result, latency_ms, return_features, profile))
         
     except Exception as e:
         import traceback
@@ -158,14 +190,16 @@ async def analyze_raw_prompt(
     request: Request,
     threshold: float = 0.55,
     return_features: bool = False,
-    user_id: Optional[str] = None
+    user_id: Optional[str] = None,
+    profile: Optional[str] = None
 ):
     """
     Analyze raw text prompt (Content-Type: text/plain).
     Use this for complex prompts with quotes/newlines that are hard to escape in JSON.
-    Pass options as query parameters: ?threshold=0.55&return_features=true
+    Pass options as query parameters: ?threshold=0.55&return_features=true&profile=verdict
     """
     start_time = time.time()
+    profile = request_profile({"profile": profile})
     
     try:
         # Read raw body
@@ -176,41 +210,49 @@ async def analyze_raw_prompt(
             raise HTTPException(status_code=400, detail="Prompt cannot be empty")
             
         # Run detection
-        result = pipeline.detect(prompt, user_id=user_id)
+        result = pipeline.detect(prompt, user_id=user_id, profile=profile)
         
         # Calculate latency
         latency_ms = (time.time() - start_time) * 1000
         
-        # Determine verdict based on classification
-        classification = result['classification']
-        if classification == 'suspicious':
-            verdict = 'block'
-            explanation = "Prompt matches known jailbreak patterns with high confidence"
-        elif classification == 'benign':
-            verdict = 'allow'
-            explanation = "Prompt appears safe with no suspicious patterns detected"
-        else:  # borderline
-            verdict = 'review'
-            explanation = "Prompt shows some suspicious characteristics and requires human review"
+        return json_response(build_response(result, latency_ms, return_features, profile))
         
-        # Build response
-        response = AnalyzeResponse(
-            verdict=verdict,
-            score=result['score'],
-            classification=classification,
-            latency_ms=round(latency_ms, 2),
-            explanation=explanation,
-            features=result.get('features') if return_features else None,
-            matched_patterns=result.get('matched_patterns', []),
-            timestamp=datetime.utcnow().isoformat() + 'Z'
-        )
+    except Exception as e:
+        import traceback
+        error_trace = traceback.format_exc()
+        print(f"❌ ERROR in /api/v1/analyze/raw:")
+        print(error_trace)
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+# Batch endpoint for clients that coalesce concurrent calls
+@app.post("/api/v1/analyze/batch", response_model=BatchAnalyzeResponse)
+async def analyze_batch(request: BatchAnalyzeRequest):
+    """
+    Analyze several prompts in a single request.
+    
+    Saves one HTTP round-trip per prompt for gateways that batch their calls.
+    Each result carries its own amortized latency_ms.
+    """
+    start_time = time.time()
+    profile = request_profile(request.options)
+    
+    try:
+        return_features = request.options.get("return_features", False) if request.options else False
         
-        return response
+        results = pipeline.detect_batch(request.prompts, user_id=request.user_id, profile=profile)
+        
+        latency_ms = (time.time() - start_time) * 1000
+        per_prompt_ms = latency_ms / len(results) if results else 0.0
+        
+        return json_response({
+            "results": [build_response(r, per_prompt_ms, return_features, profile) for r in results],
+            "latency_ms": round(latency_ms, 2)
+        })
         
     except Exception as e:
         import traceback
         error_trace = traceback.format_exc()
-        print(f"❌ ERROR in /api/v1/analyze/raw:")
+        print(f"❌ ERROR in /api/v1/analyze/batch:")
         print(error_trace)
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
@@ -244,6 +286,7 @@ async def root():
         "endpoints": {
             "analyze": "POST /api/v1/analyze (JSON)",
             "analyze_raw": "POST /api/v1/analyze/raw (Text)",
+            "analyze_batch": "POST /api/v1/analyze/batch (JSON)",
             "health": "GET /health",
             "docs": "GET /docs",
             "redoc": "GET /redoc"
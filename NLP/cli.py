@@ -2,7 +2,7 @@ import argparse
 import sys
 import json
 import os
-import shutil
+import time
 
 # Try importing yaml, if not found we might need to install it
 try:
@@ -13,6 +13,9 @@ except ImportError:
 
 from core.pipeline import DetectionPipeline
 from core.pattern_learner import PatternLearner
+from core.spacy_profiles import resolve_profiles, benchmark_profiles, print_benchmark
+from core.artifact_registry import ArtifactRegistry
+from core.bulk_scan import bulk_scan
 
 def load_config():
     with open('config/system.yaml', 'r') as f:
@@ -21,8 +24,34 @@ def load_config():
         weights = json.load(f)
     return config, weights
 
+def pipeline_scanner(config, weights, enqueue_review=False, return_features=False):
+    """Bulk-scan worker: one DetectionPipeline per process, batches go through detect_batch"""
+    pipeline = DetectionPipeline()
+    pipeline.setup(config, weights)
+
+    def scan_batch(prompts):
+        results = pipeline.detect_batch(prompts, enqueue_review=enqueue_review)
+        if not return_features:
+            results = [{k: v for k, v in r.items() if k not in ('features', 'weighted_features')} for r in results]
+        return results
+    return scan_batch
+
 def scan(args):
     config, weights = load_config()
+    if args.input:
+        if not args.output:
+            print("--output is required with --input")
+            sys.exit(1)
+        print(f"Scanning {args.input} with {args.workers} worker(s), batches of {args.batch_size}")
+        bulk_scan(args.input, args.output, pipeline_scanner,
+                  (config, weights, args.enqueue_reviews, args.features),
+                  workers=args.workers, batch_size=args.batch_size, resume=not args.restart,
+                  field=args.field, limit=args.limit)
+        return
+    if not args.prompt:
+        print("Give a prompt, or --input/--output for a bulk scan")
+        sys.exit(1)
+
     pipeline = DetectionPipeline()
     pipeline.setup(config, weights)
     
@@ -30,24 +59,71 @@ def scan(args):
     result = pipeline.detect(args.prompt)
     print(json.dumps(result, indent=2))
 
+def open_registry():
+    config, _ = load_config()
+    return config, ArtifactRegistry.from_config(config)
+
 def checkpoint_create(args):
     print(f"Creating checkpoint: {args.description}")
-    # Implementation: copy current patterns/weights to checkpoints folder
-    timestamp = "2026-01-25_1430" # Mock time
-    
-    # 1. Patterns
-    shutil.copy('data/patterns/latest.json', f'checkpoints/patterns/v_{timestamp}.json')
-    
-    # 2. Weights
-    shutil.copy('config/weights.json', f'checkpoints/weights/v_{timestamp}.json')
-    
-    print("Checkpoint created successfully.")
+    _, registry = open_registry()
+    previous = registry.current()
+    release = registry.create(args.description)
+    if release['id'] == previous:
+        print(f"Nothing changed since {release['id']}, no new release.")
+        return
+    for name, entry in sorted(release['artifacts'].items()):
+        print(f"   {name:<32} {entry['sha256'][:12]}  {entry['size']:>10} B")
+    print(f"Checkpoint {release['id']} created and active.")
+
+def checkpoint_list(args):
+    _, registry = open_registry()
+    current = registry.current()
+    releases = registry.releases()
+    if not releases:
+        print("No checkpoints yet (cli.py checkpoint create <description>).")
+        return
+    for m in releases:
+        marker = '*' if m['id'] == current else ' '
+        created = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(m['created_at']))
+        print(f"{marker} {m['id']}  {created}  {len(m['artifacts']):>2} artifacts  {m['description']}")
+
+def checkpoint_diff(args):
+    _, registry = open_registry()
+    diff = registry.diff(args.old, args.new)
+    print(f"{diff['from']} -> {diff['to']}")
+    if not diff['changes']:
+        print("   (identical)")
+    for name, change in diff['changes'].items():
+        if change['status'] != 'changed':
+            print(f"   {change['status']:<8} {name}")
+            continue
+        print(f"   changed  {name} ({change['size'][0]} -> {change['size'][1]} B)")
+        for key, d in change.get('entries', {}).items():
+            print(f"      {key}: {json.dumps(d)}")
+
+def checkpoint_gc(args):
+    config, registry = open_registry()
+    ckpt = config.get('checkpoints', {})
+    keep = args.keep if args.keep is not None else ckpt.get('keep', 10)
+    retention = args.retention_days if args.retention_days is not None else ckpt.get('retention')
+    result = registry.gc(keep=keep, retention_days=retention, dry_run=args.dry_run)
+    verb = "Would remove" if args.dry_run else "Removed"
+    print(f"{verb} {len(result['releases_removed'])} releases and {result['objects_removed']} objects "
+          f"({result['bytes_freed'] / 1024:.1f} KB).")
+    for release_id in result['releases_removed']:
+        print(f"   - {release_id}")
 
 def rollback(args):
     print(f"Rolling back to version: {args.to}")
-    # Simulating rollback logic
-    # In real app: find file with matching version tag, copy back to current
-    print("Rollback complete (simulation).")
+    _, registry = open_registry()
+    start = time.perf_counter()
+    try:
+        release = registry.activate(args.to)
+    except (KeyError, FileNotFoundError) as e:
+        print(f"Rollback failed: {e}")
+        sys.exit(1)
+    print(f"Rollback complete: {release['id']} ({release['description']}) active "
+          f"in {(time.perf_counter() - start) * 1000:.1f}ms. Running servers reload on their next request.")
 
 def approve_patterns(args):
     print("Starting interactive pattern approval...")
@@ -56,27 +132,67 @@ def approve_patterns(args):
     # For MVP verifying the CLI structure:
     print("No pending patterns found in queue.")
 
+def profiles_bench(args):
+    config, _ = load_config()
+    profiles = resolve_profiles(config)
+    names = args.profiles or sorted(profiles)
+    prompts = None
+    if args.prompts:
+        with open(args.prompts, 'r', encoding='utf-8') as f:
+            prompts = [line.strip() for line in f if line.strip()]
+    print(f"Benchmarking spaCy profiles: {', '.join(names)}")
+    rows = benchmark_profiles(names, profiles, prompts, repeats=args.repeats)
+    print_benchmark(rows)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(rows, f, indent=2)
+
 def main():
     parser = argparse.ArgumentParser(description="NLP Jailbreak Detection System CLI")
     subparsers = parser.add_subparsers(dest='command', help='Commands')
 
     # Scan command
-    scan_parser = subparsers.add_parser('scan', help='Scan a prompt for jailbreaks')
-    scan_parser.add_argument('prompt', type=str, help='The prompt to analyze')
+    scan_parser = subparsers.add_parser('scan', help='Scan a prompt (or a JSONL/CSV file) for jailbreaks')
+    scan_parser.add_argument('prompt', type=str, nargs='?', help='The prompt to analyze')
+    scan_parser.add_argument('--input', help='Bulk mode: .jsonl / .csv / .json / .txt file of prompts')
+    scan_parser.add_argument('--output', help='Bulk mode: JSONL results (input record + "result"), in input order')
+    scan_parser.add_argument('--field', help='Record field holding the prompt (default: prompt/Prompt/text/UserQuery)')
+    scan_parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                             help='Worker processes, each loads the pipeline once')
+    scan_parser.add_argument('--batch-size', type=int, default=64, help='Prompts per batch')
+    scan_parser.add_argument('--limit', type=int, help='Stop after this many records (resumable)')
+    scan_parser.add_argument('--restart', action='store_true', help='Ignore the checkpoint and start from the top')
+    scan_parser.add_argument('--features', action='store_true', help='Include feature breakdowns in the results')
+    scan_parser.add_argument('--enqueue-reviews', action='store_true', help='Send borderline prompts to the review queue')
 
     # Checkpoint command
     ckpt_parser = subparsers.add_parser('checkpoint', help='Manage checkpoints')
     ckpt_sub = ckpt_parser.add_subparsers(dest='subcommand')
     create_parser = ckpt_sub.add_parser('create', help='Create a new checkpoint')
     create_parser.add_argument('description', type=str, help='Description of checkpoint')
+    ckpt_sub.add_parser('list', help='List checkpoints (* = active)')
+    diff_parser = ckpt_sub.add_parser('diff', help='Compare two checkpoints')
+    diff_parser.add_argument('old', help='Release id (or unique prefix)')
+    diff_parser.add_argument('new', nargs='?', help='Release id (default: the active one)')
+    gc_parser = ckpt_sub.add_parser('gc', help='Remove old checkpoints and unreferenced objects')
+    gc_parser.add_argument('--keep', type=int, help='Newest releases to keep (default: checkpoints.keep)')
+    gc_parser.add_argument('--retention-days', type=float, help='Keep anything younger (default: checkpoints.retention)')
+    gc_parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
 
     # Rollback command
     roll_parser = subparsers.add_parser('rollback', help='Rollback to previous state')
-    roll_parser.add_argument('--to', required=True, help='Version ID to rollback to')
+    roll_parser.add_argument('--to', required=True, help='Release id (or unique prefix) to activate')
 
     # Approve Patterns
     subparsers.add_parser('approve-patterns', help='Interactive pattern approval')
 
+    # spaCy profile benchmark
+    prof_parser = subparsers.add_parser('profiles', help='Measure load time, memory and parse time per spaCy profile')
+    prof_parser.add_argument('--profiles', nargs='+', help='Profiles to measure (default: all)')
+    prof_parser.add_argument('--prompts', help='Text file with one prompt per line')
+    prof_parser.add_argument('--repeats', type=int, default=20, help='Passes over the prompts per profile')
+    prof_parser.add_argument('--output', help='Write the measurements as JSON')
+
     args = parser.parse_args()
 
     if args.command == 'scan':
@@ -84,10 +200,20 @@ def main():
     elif args.command == 'checkpoint':
         if args.subcommand == 'create':
             checkpoint_create(args)
+        elif args.subcommand == 'list':
+            checkpoint_list(args)
+        elif args.subcommand == 'diff':
+            checkpoint_diff(args)
+        elif args.subcommand == 'gc':
+            checkpoint_gc(args)
+        else:
+            ckpt_parser.print_help()
     elif args.command == 'rollback':
         rollback(args)
     elif args.command == 'approve-patterns':
         approve_patterns(args)
+    elif args.command == 'profiles':
+        profiles_bench(args)
     else:
         parser.print_help()
 
@@ -0,0 +1,383 @@
+"""
+Content-addressed registry for the live artifacts: pattern DB, weights and the ML model bundle.
+
+<root>/
+  objects/<sha256[:2]>/<sha256>   file contents, stored once and read-only
+  releases/<release_id>.json      manifest: id, created_at, description, parent, {name: {sha256, size}}
+  CURRENT                         id of the active release
+  STATS                           live path -> (size, mtime, ctime, inode, sha256) when last hashed
+  ACTIVATING                      journal of an activation in progress
+
+- create:   hashes the live files and copies new content into objects/. A live file
+            whose size, mtime, ctime and inode match STATS is not re-hashed, so an
+            unchanged checkpoint costs a few stats; any edit (in place or by rename)
+            changes ctime and is hashed again.
+- activate: every object is first copied next to its live path, the list of renames
+            is written to ACTIVATING, then each copy is renamed over its live path and
+            CURRENT is replaced. A crash after the journal is written is rolled forward
+            by the next registry operation, so live files never stay mixed across
+            releases. Rollback is just activating an older release.
+- diff / gc: compare two releases (JSON artifacts entry by entry), drop old releases
+            and the objects no remaining release references.
+
+Live files are ordinary writable copies: editing config/weights.json by hand never
+touches a stored release. Long-running servers poll CURRENT with ReleaseWatcher and
+reload when it changes.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import stat
+import time
+from typing import Any, Dict, List, Optional
+
+# ML model bundle tracked under models/<file> (optional files are skipped when absent)
+MODEL_FILES = ("isolation_forest.pkl", "logistic_regression.pkl", "xgboost.pkl", "ensemble_config.pkl",
+               "compiled_trees.pkl", "student.pkl", "prefilter.pkl")
+
+
+def standard_artifacts(patterns_path: str, weights_path: str, models_dir: Optional[str]) -> Dict[str, str]:
+    """Artifact name -> live path for the pattern DB, weights.json and the model bundle"""
+    artifacts = {"patterns": patterns_path, "weights": weights_path}
+    if models_dir:
+        for name in MODEL_FILES:
+            artifacts[f"models/{name}"] = os.path.join(models_dir, name)
+    return artifacts
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _copy_to_temp(src: str, dst: str) -> str:
+    """Copy src to a temp name next to dst (same filesystem, so it can be renamed over dst)"""
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    shutil.copyfile(src, tmp)
+    return tmp
+
+
+def _stat_key(st: os.stat_result) -> List[int]:
+    return [st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino]
+
+
+def _write_json_atomic(path: str, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp, path)
+
+
+class ArtifactRegistry:
+    def __init__(self, root: str, artifacts: Dict[str, str]):
+        self.root = root
+        self.artifacts = artifacts
+        self.objects_dir = os.path.join(root, "objects")
+        self.releases_dir = os.path.join(root, "releases")
+        self.current_path = os.path.join(root, "CURRENT")
+        self.stats_path = os.path.join(root, "STATS")
+        self.journal_path = os.path.join(root, "ACTIVATING")
+
+    @classmethod
+    def from_config(cls, config):
+        """Registry described by system.yaml (`checkpoints` section; paths relative to the NLP dir)"""
+        ckpt = config.get("checkpoints", {})
+        artifacts = standard_artifacts(config["patterns"]["global_path"],
+                                       config.get("weights", {}).get("global_path", "config/weights.json"),
+                                       ckpt.get("models_dir", "../ML/models"))
+        return cls(ckpt.get("root", "data/registry"), artifacts)
+
+    # ------------------------------------------------------------------
+    # Objects
+    # ------------------------------------------------------------------
+    def object_path(self, sha: str) -> str:
+        return os.path.join(self.objects_dir, sha[:2], sha)
+
+    def _load_stats(self) -> Dict[str, List]:
+        try:
+            with open(self.stats_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _store(self, path: str, stats: Dict[str, List]) -> Dict[str, Any]:
+        """Add one live file to the object store; returns its manifest entry"""
+        st = os.stat(path)
+        key = _stat_key(st)
+        cached = stats.get(os.path.abspath(path))
+        if cached is not None and cached[:4] == key:
+            # Not modified since it was last hashed
+            sha = cached[4]
+        else:
+            sha = file_sha256(path)
+        target = self.object_path(sha)
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = _copy_to_temp(path, target)
+            os.chmod(tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            os.replace(tmp, target)
+        elif st.st_nlink > 1 and os.path.samestat(st, os.stat(target)):
+            # Hard link left by an older registry version: give the live file its own inode
+            os.replace(_copy_to_temp(target, path), path)
+            key = _stat_key(os.stat(path))
+        stats[os.path.abspath(path)] = key + [sha]
+        return {"sha256": sha, "size": st.st_size}
+
+    # ------------------------------------------------------------------
+    # Releases
+    # ------------------------------------------------------------------
+    def current(self) -> Optional[str]:
+        try:
+            with open(self.current_path, "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def releases(self) -> List[Dict[str, Any]]:
+        """Every release manifest, oldest first"""
+        if not os.path.isdir(self.releases_dir):
+            return []
+        manifests = []
+        for name in os.listdir(self.releases_dir):
+            if name.endswith(".json"):
+                with open(os.path.join(self.releases_dir, name), "r") as f:
+                    manifests.append(json.load(f))
+        return sorted(manifests, key=lambda m: (m["created_at"], m["id"]))
+
+    def get(self, release_id: str) -> Dict[str, Any]:
+        """Manifest by id or unique id prefix"""
+        path = os.path.join(self.releases_dir, f"{release_id}.json")
+        if not os.path.exists(path):
+            matches = [m["id"] for m in self.releases() if m["id"].startswith(release_id)]
+            if len(matches) != 1:
+                raise KeyError(f"No release matching '{release_id}'" if not matches else
+                               f"Ambiguous release '{release_id}': {', '.join(matches)}")
+            path = os.path.join(self.releases_dir, f"{matches[0]}.json")
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def create(self, description: str = "") -> Dict[str, Any]:
+        """
+        Snapshot the live artifacts as a release and mark it active (it is what is live).
+        Returns the active release unchanged when nothing differs from it.
+        """
+        self.recover()
+        current_id = self.current()
+        current = self.get(current_id) if current_id else None
+        known = current["artifacts"] if current else {}
+
+        stats = self._load_stats()
+        entries = {}
+        for name, path in self.artifacts.items():
+            if os.path.exists(path):
+                entries[name] = self._store(path, stats)
+        os.makedirs(self.root, exist_ok=True)
+        _write_json_atomic(self.stats_path, stats)
+        if current is not None and entries == known:
+            return current
+
+        now = time.time()
+        digest = hashlib.sha256(json.dumps(entries, sort_keys=True).encode("utf-8")).hexdigest()
+        manifest = {
+            "id": f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{digest[:8]}",
+            "created_at": now,
+            "description": description,
+            "parent": current_id,
+            "artifacts": entries,
+        }
+        os.makedirs(self.releases_dir, exist_ok=True)
+        _write_json_atomic(os.path.join(self.releases_dir, f"{manifest['id']}.json"), manifest)
+        self._set_current(manifest["id"])
+        return manifest
+
+    def activate(self, release_id: str) -> Dict[str, Any]:
+        """
+        Make a release live. Every copy is staged before any live file changes; the
+        renames and the CURRENT move are then journaled and replayed by recover()
+        if the process dies half way.
+        """
+        self.recover()
+        manifest = self.get(release_id)
+        steps = []
+        try:
+            for name, path in self.artifacts.items():
+                entry = manifest["artifacts"].get(name)
+                if entry is None:
+                    # Optional artifact the release does not have (e.g. no distilled student)
+                    steps.append({"remove": path})
+                    continue
+                obj = self.object_path(entry["sha256"])
+                if not os.path.exists(obj):
+                    raise FileNotFoundError(f"Object for '{name}' missing from registry: {obj}")
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                steps.append({"tmp": _copy_to_temp(obj, path), "path": path, "sha256": entry["sha256"]})
+        except Exception:
+            for step in steps:
+                if "tmp" in step and os.path.exists(step["tmp"]):
+                    os.remove(step["tmp"])
+            raise
+
+        os.makedirs(self.root, exist_ok=True)
+        _write_json_atomic(self.journal_path, {"release": manifest["id"], "steps": steps})
+        self.recover()
+        return manifest
+
+    def recover(self):
+        """Finish an activation whose journal is still present (idempotent)"""
+        try:
+            with open(self.journal_path, "r") as f:
+                journal = json.load(f)
+        except FileNotFoundError:
+            return
+        stats = self._load_stats()
+        for step in journal["steps"]:
+            if "remove" in step:
+                if os.path.exists(step["remove"]):
+                    os.remove(step["remove"])
+                stats.pop(os.path.abspath(step["remove"]), None)
+                continue
+            if os.path.exists(step["tmp"]):
+                os.replace(step["tmp"], step["path"])
+            # The fresh copy is the release's content: no need to hash it on the next create
+            stats[os.path.abspath(step["path"])] = _stat_key(os.stat(step["path"])) + [step["sha256"]]
+        _write_json_atomic(self.stats_path, stats)
+        self._set_current(journal["release"])
+        os.remove(self.journal_path)
+
+    def _set_current(self, release_id: str):
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self.current_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(release_id + "\n")
+        os.replace(tmp, self.current_path)
+
+    # ------------------------------------------------------------------
+    # Diff / GC
+    # ------------------------------------------------------------------
+    def diff(self, a: str, b: Optional[str] = None) -> Dict[str, Any]:
+        """Per-artifact changes from release a to release b (default: the active one)"""
+        if b is None:
+            b = self.current()
+            if b is None:
+                raise KeyError("No active release to compare against")
+        old, new = self.get(a), self.get(b)
+        changes = {}
+        for name in sorted(set(old["artifacts"]) | set(new["artifacts"])):
+            x, y = old["artifacts"].get(name), new["artifacts"].get(name)
+            if x == y:
+                continue
+            if x is None or y is None:
+                changes[name] = {"status": "added" if x is None else "removed"}
+                continue
+            change = {"status": "changed", "size": [x["size"], y["size"]]}
+            detail = self._json_diff(x["sha256"], y["sha256"])
+            if detail is not None:
+                change["entries"] = detail
+            changes[name] = change
+        return {"from": old["id"], "to": new["id"], "changes": changes}
+
+    def _json_diff(self, sha_a: str, sha_b: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.object_path(sha_a), "r") as f:
+                a = json.load(f)
+            with open(self.object_path(sha_b), "r") as f:
+                b = json.load(f)
+        except (UnicodeDecodeError, ValueError):
+            return None  # not JSON (pickled models)
+        out = {}
+        _walk_diff(a, b, "", out)
+        return out
+
+    def gc(self, keep: int = 10, retention_days: Optional[float] = None, dry_run: bool = False) -> Dict[str, Any]:
+        """
+        Drop releases that are neither among the newest `keep` nor younger than
+        `retention_days` (the active one always stays), then unreferenced objects.
+        """
+        self.recover()
+        releases = self.releases()
+        current_id = self.current()
+        kept = {m["id"] for m in releases[-keep:]} if keep > 0 else set()
+        if current_id:
+            kept.add(current_id)
+        if retention_days is not None:
+            cutoff = time.time() - retention_days * 86400
+            kept |= {m["id"] for m in releases if m["created_at"] >= cutoff}
+        dropped = [m for m in releases if m["id"] not in kept]
+
+        referenced = {e["sha256"] for m in releases if m["id"] in kept for e in m["artifacts"].values()}
+        orphans = []
+        if os.path.isdir(self.objects_dir):
+            for shard in os.listdir(self.objects_dir):
+                shard_dir = os.path.join(self.objects_dir, shard)
+                for sha in os.listdir(shard_dir):
+                    if sha not in referenced:
+                        orphans.append(os.path.join(shard_dir, sha))
+
+        freed = sum(os.stat(p).st_size for p in orphans)
+        if not dry_run:
+            for m in dropped:
+                os.remove(os.path.join(self.releases_dir, f"{m['id']}.json"))
+            for p in orphans:
+                os.remove(p)
+        return {"releases_removed": [m["id"] for m in dropped], "objects_removed": len(orphans),
+                "bytes_freed": freed, "dry_run": dry_run}
+
+
+def _walk_diff(a, b, prefix: str, out: Dict[str, Any]):
+    """Leaf-level changes between two JSON values: lists as added/removed counts, scalars as from/to"""
+    if isinstance(a, dict) and isinstance(b, dict):
+        for key in sorted(set(a) | set(b), key=str):
+            path = f"{prefix}.{key}" if prefix else str(key)
+            if key not in a:
+                out[path] = {"added": True}
+            elif key not in b:
+                out[path] = {"removed": True}
+            elif a[key] != b[key]:
+                _walk_diff(a[key], b[key], path, out)
+    elif isinstance(a, list) and isinstance(b, list):
+        try:
+            sa, sb = set(map(_hashable, a)), set(map(_hashable, b))
+            added, removed = len(sb - sa), len(sa - sb)
+            # Same members, different order or duplicates
+            out[prefix] = {"added": added, "removed": removed} if added or removed else {"length": [len(a), len(b)]}
+        except TypeError:
+            out[prefix] = {"length": [len(a), len(b)]}
+    else:
+        out[prefix] = {"from": a, "to": b}
+
+
+def _hashable(value):
+    return json.dumps(value, sort_keys=True) if isinstance(value, (list, dict)) else value
+
+
+class ReleaseWatcher:
+    """Cheap check for a newly activated release: stats CURRENT at most every `interval` seconds"""
+
+    def __init__(self, registry: ArtifactRegistry, interval: float = 2.0):
+        self.registry = registry
+        self.interval = interval
+        self._checked = time.monotonic()
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self):
+        try:
+            st = os.stat(self.registry.current_path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        now = time.monotonic()
+        if now - self._checked < self.interval:
+            return False
+        self._checked = now
+        stamp = self._read_stamp()
+        if stamp == self._stamp:
+            return False
+        self._stamp = stamp
+        return stamp is not None
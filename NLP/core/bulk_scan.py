@@ -0,0 +1,210 @@
+"""
+Streaming bulk scan of prompt files (JSONL / CSV / one prompt per line).
+
+- Records are read lazily and grouped into batches. Each batch is scored by a
+  worker process that built its scanner (pipeline, models) once, in the pool
+  initializer, so nothing is reloaded per prompt or per batch.
+- At most `workers * 2` batches are in flight. Results are written in input order
+  as JSONL: the input record plus a `result` field.
+- After every written batch `<output>.ckpt` records the records done and the output
+  size. An interrupted run resumes there: the output is truncated to the last
+  complete batch and already-scanned records are skipped without being scored.
+  The checkpoint is removed once the scan finishes.
+
+Scanners are built by a picklable factory: `factory(*factory_args)` must return a
+callable mapping a list of prompts to a list of JSON-serializable result dicts.
+"""
+
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+# Same keys the ML trainer accepts from DataExtractor output
+PROMPT_KEYS = ("prompt", "Prompt", "text", "UserQuery")
+
+_worker_scan = None
+
+
+def iter_records(path: str, field: Optional[str] = None) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """(record, prompt) pairs from a .jsonl / .csv / .json / plain-text file, streamed"""
+    ext = os.path.splitext(path)[1].lower()
+    with open(path, "r", encoding="utf-8", newline="" if ext == ".csv" else None) as f:
+        if ext == ".csv":
+            # Prompts with embedded newlines are common; the csv module handles quoting
+            csv.field_size_limit(sys.maxsize)
+            rows = csv.DictReader(f)
+        elif ext == ".json":
+            # A JSON array is loaded whole; use JSONL to stream large files
+            rows = json.load(f)
+        elif ext in (".jsonl", ".ndjson"):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({"prompt": line.rstrip("\r\n")} for line in f if line.strip())
+        for row in rows:
+            if not isinstance(row, dict):
+                row = {"prompt": row}
+            yield row, _prompt_of(row, field)
+
+
+def _prompt_of(row: Dict[str, Any], field: Optional[str]) -> str:
+    if field:
+        value = row.get(field)
+    else:
+        value = next((row[k] for k in PROMPT_KEYS if row.get(k)), None)
+    return value if isinstance(value, str) else ("" if value is None else str(value))
+
+
+def _json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+def _init_worker(factory: Callable, factory_args: tuple):
+    global _worker_scan
+    _worker_scan = factory(*factory_args)
+
+
+def _scan_batch(prompts):
+    return _worker_scan(prompts)
+
+
+def _load_checkpoint(ckpt_path: str, input_path: str) -> Dict[str, Any]:
+    try:
+        with open(ckpt_path, "r") as f:
+            ckpt = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return ckpt if ckpt.get("input") == os.path.abspath(input_path) else {}
+
+
+def _save_checkpoint(ckpt_path: str, ckpt: Dict[str, Any]):
+    tmp = ckpt_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(ckpt, f)
+    os.replace(tmp, ckpt_path)
+
+
+def bulk_scan(input_path: str, output_path: str, factory: Callable, factory_args: tuple = (),
+              workers: int = 1, batch_size: int = 64, resume: bool = True, field: Optional[str] = None,
+              limit: Optional[int] = None, report_every: float = 5.0,
+              label: Optional[Callable[[Dict[str, Any]], str]] = None) -> Dict[str, Any]:
+    """
+    Score every prompt of input_path into output_path (JSONL, input order).
+    workers <= 1 scores in this process. `limit` caps the records done in total (the
+    checkpoint is kept, so a later run continues). Returns counts, throughput and
+    the verdict histogram.
+    """
+    label = label or (lambda r: r.get("verdict") or r.get("classification") or "unknown")
+    ckpt_path = output_path + ".ckpt"
+    ckpt = _load_checkpoint(ckpt_path, input_path) if resume else {}
+    if ckpt and (not os.path.exists(output_path) or os.path.getsize(output_path) < ckpt["output_bytes"]):
+        print(f"⚠️ {output_path} is shorter than its checkpoint, starting over")
+        ckpt = {}
+    done = ckpt.get("records", 0)
+    labels = Counter(ckpt.get("labels", {}))
+
+    out = open(output_path, "a+b" if ckpt else "wb")
+    if ckpt:
+        # Drop anything written after the last complete batch
+        out.truncate(ckpt["output_bytes"])
+        out.seek(0, os.SEEK_END)
+        print(f"↩️  Resuming {input_path} at record {done:,}")
+
+    records = iter_records(input_path, field)
+    for _ in range(done):
+        next(records, None)
+    exhausted = False
+
+    def batches():
+        nonlocal exhausted
+        remaining = None if limit is None else max(0, limit - done)
+        batch = []
+        for record, prompt in records:
+            if remaining is not None:
+                if remaining == 0:
+                    break
+                remaining -= 1
+            batch.append((record, prompt))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        else:
+            exhausted = True
+        if batch:
+            yield batch
+
+    pool = None
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(factory, factory_args))
+    else:
+        _init_worker(factory, factory_args)
+
+    start = time.time()
+    last_report = start
+    scanned = 0
+
+    def write(batch, results):
+        nonlocal done, scanned, last_report
+        lines = []
+        for (record, _), result in zip(batch, results):
+            labels[label(result)] += 1
+            lines.append(json.dumps({**record, "result": result}, default=_json_default, ensure_ascii=False))
+        out.write(("\n".join(lines) + "\n").encode("utf-8"))
+        out.flush()
+        done += len(batch)
+        scanned += len(batch)
+        _save_checkpoint(ckpt_path, {"input": os.path.abspath(input_path), "records": done,
+                                     "output_bytes": out.tell(), "labels": dict(labels)})
+        now = time.time()
+        if now - last_report >= report_every:
+            last_report = now
+            print(f"⚡ {done:,} records | {scanned / (now - start):,.0f} prompts/s")
+
+    try:
+        if pool is None:
+            for batch in batches():
+                write(batch, _scan_batch([p for _, p in batch]))
+        else:
+            # Bounded window of in-flight batches, collected in submission order
+            in_flight = deque()
+            for batch in batches():
+                in_flight.append((batch, pool.submit(_scan_batch, [p for _, p in batch])))
+                if len(in_flight) >= workers * 2:
+                    b, future = in_flight.popleft()
+                    write(b, future.result())
+            while in_flight:
+                b, future = in_flight.popleft()
+                write(b, future.result())
+    finally:
+        out.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.time() - start
+    if exhausted and os.path.exists(ckpt_path):
+        os.remove(ckpt_path)
+    stats = {
+        "records": done,
+        "complete": exhausted,
+        "scanned": scanned,
+        "elapsed_s": elapsed,
+        "prompts_per_s": scanned / elapsed if elapsed > 0 else 0.0,
+        "labels": dict(labels),
+    }
+    print(f"✅ Scanned {scanned:,} prompts in {elapsed:.1f}s ({stats['prompts_per_s']:,.0f} prompts/s) "
+          f"-> {output_path}")
+    print(f"   Verdicts: {dict(labels)}")
+    return stats
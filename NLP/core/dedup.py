@@ -0,0 +1,203 @@
+"""
+Near-duplicate detection for prompt corpora (MinHash + LSH).
+
+Jailbreak corpora contain many near-identical variants (renamed personas, one
+changed sentence, different separators). Exact `set()` dedup keeps them all, which
+inflates the trigram DB, training time and evaluation bias.
+
+- Prompts are shingled into word k-grams; token ids come from a shared vocabulary
+  and shingles are hashed with NumPy, a chunk of prompts at a time
+- MinHash signatures use (a*x + b) mod p permutations, reduced per prompt with
+  np.minimum.reduceat, so each chunk is a few array operations
+- LSH bands are folded into one 64-bit key per band; rows sharing a key are
+  candidate pairs, optionally verified by signature agreement
+- Clusters are the connected components of the verified pairs; the first prompt
+  of each cluster is its representative
+
+Memory stays bounded: only band keys (8 bytes per band per prompt) live in RAM,
+signatures are spilled to a temporary memmap for verification, and chunk size is
+capped by a shingle budget.
+"""
+
+import os
+import re
+import tempfile
+import time
+import numpy as np
+from typing import Iterable, Dict, Any, List, Tuple
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+PRIME = np.uint64(4294967291)  # largest prime below 2^32: hash values fit in uint32
+MASK32 = np.uint64(0xFFFFFFFF)
+TOKEN_RE = re.compile(r"\w+")
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows <= num_perm whose S-curve threshold
+    (1 / bands) ** (1 / rows) is closest to the requested Jaccard threshold.
+    """
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.a = rng.integers(1, int(PRIME), num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, int(PRIME), num_perm, dtype=np.uint64)
+        # Odd multipliers that mix the k token ids of a shingle into one value
+        self.mix = rng.integers(1, 2 ** 31, shingle_size, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+        self.vocab: Dict[str, int] = {}
+
+    def shingles(self, text: str) -> np.ndarray:
+        """Hashed word k-grams of the lowercased text (at least one per prompt)"""
+        get = self.vocab.setdefault
+        # Ids start at 1 so the zero padding below never collides with a real token
+        ids = np.array([get(t, len(self.vocab) + 1) for t in TOKEN_RE.findall(text.lower())], dtype=np.uint64)
+        k = self.shingle_size
+        if len(ids) < k:
+            # Short prompts: the whole token sequence is one shingle
+            ids = np.concatenate([ids, np.zeros(k - len(ids), dtype=np.uint64)])
+        h = np.zeros(len(ids) - k + 1, dtype=np.uint64)
+        for j in range(k):
+            h = h * np.uint64(1000003) + ids[j:len(ids) - k + 1 + j] * self.mix[j]
+        return (h ^ (h >> np.uint64(32))) & MASK32
+
+    def signatures(self, shingle_sets: List[np.ndarray]) -> np.ndarray:
+        """MinHash signatures (n, num_perm) uint32 for a chunk of prompts"""
+        lengths = np.array([len(s) for s in shingle_sets])
+        flat = np.concatenate(shingle_sets)
+        starts = np.r_[0, np.cumsum(lengths)[:-1]]
+        hashed = (self.a[:, None] * flat[None, :] + self.b[:, None]) % PRIME
+        return np.minimum.reduceat(hashed, starts, axis=1).T.astype(np.uint32)
+
+
+def dedup_near_duplicates(prompts: Iterable[str], threshold: float = 0.8, num_perm: int = 64,
+                          shingle_size: int = 3, verify: bool = True, chunk_shingles: int = 200_000,
+                          seed: int = 1) -> Dict[str, Any]:
+    """
+    Cluster near-duplicate prompts (estimated Jaccard >= threshold over word shingles).
+
+    Returns:
+        keep:        sorted indices of cluster representatives (first member of each cluster)
+        cluster_of:  cluster id per input prompt
+        stats:       counts, size histogram, largest clusters (representative index + size)
+    """
+    start = time.time()
+    hasher = MinHasher(num_perm, shingle_size, seed)
+    bands, rows = lsh_params(threshold, num_perm)
+    band_mix = np.random.default_rng(seed + 1).integers(1, 2 ** 62, (bands, rows), dtype=np.uint64) | np.uint64(1)
+
+    key_chunks: List[np.ndarray] = []
+    sig_file = tempfile.NamedTemporaryFile(prefix="minhash_", suffix=".bin", delete=False) if verify else None
+    n = 0
+    try:
+        pending, pending_shingles = [], 0
+
+        def flush():
+            nonlocal pending, pending_shingles
+            if not pending:
+                return
+            sigs = hasher.signatures(pending)
+            # One 64-bit key per band: rows of the band folded with random odd multipliers
+            banded = sigs[:, :bands * rows].astype(np.uint64).reshape(len(sigs), bands, rows)
+            key_chunks.append((banded * band_mix[None, :, :]).sum(axis=2))
+            if sig_file is not None:
+                sig_file.write(sigs.tobytes())
+            pending, pending_shingles = [], 0
+
+        for text in prompts:
+            s = hasher.shingles(text or "")
+            pending.append(s)
+            pending_shingles += len(s)
+            n += 1
+            if pending_shingles >= chunk_shingles:
+                flush()
+        flush()
+
+        if n == 0:
+            return {"keep": [], "cluster_of": np.zeros(0, dtype=np.int64), "stats": {"input": 0, "clusters": 0}}
+
+        keys = np.concatenate(key_chunks)
+        del key_chunks
+
+        # Candidate edges: every row linked to the first row sharing its key, per band
+        src, dst = [], []
+        for band in range(bands):
+            _, first, inverse = np.unique(keys[:, band], return_index=True, return_inverse=True)
+            leader = first[inverse]
+            linked = np.flatnonzero(leader != np.arange(n))
+            src.append(linked)
+            dst.append(leader[linked])
+        src = np.concatenate(src)
+        dst = np.concatenate(dst)
+        candidates = len(src)
+
+        if verify and candidates:
+            sig_file.flush()
+            sigs = np.memmap(sig_file.name, dtype=np.uint32, mode="r", shape=(n, num_perm))
+            ok = np.zeros(candidates, dtype=bool)
+            order = np.argsort(src, kind="stable")
+            for i in range(0, candidates, 50_000):
+                idx = order[i:i + 50_000]
+                agreement = (sigs[src[idx]] == sigs[dst[idx]]).mean(axis=1)
+                ok[idx] = agreement >= threshold
+            del sigs
+            src, dst = src[ok], dst[ok]
+    finally:
+        if sig_file is not None:
+            sig_file.close()
+            os.unlink(sig_file.name)
+
+    graph = coo_matrix((np.ones(len(src), dtype=np.int8), (src, dst)), shape=(n, n))
+    n_clusters, labels = connected_components(graph, directed=False)
+
+    # Representative = first prompt of each cluster (keeps input order)
+    _, first_idx = np.unique(labels, return_index=True)
+    keep = np.sort(first_idx)
+    sizes = np.bincount(labels)
+    rep_of_cluster = np.empty(n_clusters, dtype=np.int64)
+    rep_of_cluster[labels[first_idx]] = first_idx
+    largest = np.argsort(-sizes, kind="stable")[:10]
+
+    stats = {
+        "input": n,
+        "clusters": int(n_clusters),
+        "removed": int(n - n_clusters),
+        "duplicate_rate": float(1 - n_clusters / n),
+        "candidate_pairs": int(candidates),
+        "verified_pairs": int(len(src)),
+        "lsh": {"threshold": threshold, "num_perm": num_perm, "bands": bands, "rows": rows},
+        "size_histogram": {
+            "1": int((sizes == 1).sum()),
+            "2-5": int(((sizes >= 2) & (sizes <= 5)).sum()),
+            "6-20": int(((sizes >= 6) & (sizes <= 20)).sum()),
+            "21-100": int(((sizes >= 21) & (sizes <= 100)).sum()),
+            ">100": int((sizes > 100).sum()),
+        },
+        "largest": [{"representative": int(rep_of_cluster[c]), "size": int(sizes[c])}
+                    for c in largest if sizes[c] > 1],
+        "elapsed_s": time.time() - start,
+    }
+    return {"keep": keep.tolist(), "cluster_of": labels, "stats": stats}
+
+
+def print_cluster_report(result: Dict[str, Any], prompts: List[str]):
+    stats = result["stats"]
+    if not stats.get("input"):
+        return
+    print(f"🧹 Near-duplicate dedup: {stats['input']} -> {stats['clusters']} prompts "
+          f"({stats['removed']} removed, {stats['duplicate_rate']:.1%}) in {stats['elapsed_s']:.1f}s")
+    print(f"   Cluster sizes: {stats['size_histogram']}")
+    for c in stats["largest"][:5]:
+        snippet = " ".join(prompts[c["representative"]].split())[:70]
+        print(f"   └─ {c['size']:>5}x  {snippet}...")
@@ -0,0 +1,79 @@
+"""
+Single-pass text normalization shared by every extractor.
+
+`normalize(prompt)` returns one immutable NormalizedText per prompt (memoized, so
+every extractor of a layer reads the same object instead of re-splitting the text):
+
+- raw:    the prompt as received (character statistics read this, since
+          invisible characters are themselves an obfuscation signal)
+- text:   NFKC + zero-width characters removed + homoglyphs folded to Latin
+- lower:  lowercase view of `text`
+- tokens / lower_tokens / offsets: whitespace tokens of `text` with (start, end)
+- folded_tokens / folded: lowercase tokens with leetspeak folded ("1gn0r3" -> "ignore"),
+          joined by single spaces. Trigram and marker lookups use this view so
+          obfuscated variants hit the same indexes as the plain text.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Tuple
+
+ZERO_WIDTH = "\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff\u00ad\u180e"
+
+# Cyrillic / Greek letters that render like Latin ones (NFKC leaves these alone)
+HOMOGLYPHS = {
+    "а": "a", "в": "b", "е": "e", "к": "k", "м": "m", "н": "h", "о": "o", "р": "p", "с": "c",
+    "т": "t", "у": "y", "х": "x", "і": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "һ": "h", "ԛ": "q",
+    "ԝ": "w", "ɡ": "g",
+    "А": "A", "В": "B", "Е": "E", "К": "K", "М": "M", "Н": "H", "О": "O", "Р": "P", "С": "C",
+    "Т": "T", "Х": "X", "І": "I", "Ј": "J", "Ѕ": "S",
+    "α": "a", "ο": "o", "ρ": "p", "ι": "i", "κ": "k", "ν": "v", "τ": "t", "υ": "u", "χ": "x",
+    "Α": "A", "Β": "B", "Ε": "E", "Ζ": "Z", "Η": "H", "Ι": "I", "Κ": "K", "Μ": "M", "Ν": "N",
+    "Ο": "O", "Ρ": "P", "Τ": "T", "Υ": "Y", "Χ": "X",
+}
+
+CLEAN_TABLE = str.maketrans({**{c: None for c in ZERO_WIDTH}, **HOMOGLYPHS})
+LEET_TABLE = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"})
+LEET_CHARS = frozenset("013457@$")
+TOKEN_RE = re.compile(r"\S+")
+
+
+def fold_token(token: str) -> str:
+    """Leetspeak folding of one lowercase token; only tokens mixing letters and leet characters change"""
+    if LEET_CHARS.isdisjoint(token) or not any(c.isalpha() for c in token):
+        return token
+    return token.translate(LEET_TABLE)
+
+
+def fold_phrase(phrase: str) -> str:
+    """Fold a stored pattern (trigram, marker) the same way prompts are folded"""
+    return " ".join(fold_token(t) for t in normalize(phrase).lower_tokens)
+
+
+class NormalizedText:
+    __slots__ = ("raw", "text", "lower", "tokens", "lower_tokens", "offsets", "folded_tokens", "folded")
+
+    def __init__(self, raw: str):
+        self.raw = raw
+        if raw.isascii():
+            # Nothing for NFKC / zero-width / homoglyph folding to do
+            text = raw
+        else:
+            text = raw.translate(CLEAN_TABLE)
+            if not unicodedata.is_normalized("NFKC", text):
+                text = unicodedata.normalize("NFKC", text).translate(CLEAN_TABLE)
+        self.text = text
+        self.lower = text.lower()
+
+        matches = list(TOKEN_RE.finditer(text))
+        self.tokens: Tuple[str, ...] = tuple(m.group() for m in matches)
+        self.offsets: Tuple[Tuple[int, int], ...] = tuple(m.span() for m in matches)
+        self.lower_tokens: Tuple[str, ...] = tuple(t.lower() for t in self.tokens)
+        self.folded_tokens: Tuple[str, ...] = tuple(fold_token(t) for t in self.lower_tokens)
+        self.folded = " ".join(self.folded_tokens)
+
+
+@lru_cache(maxsize=512)
+def normalize(prompt: str) -> NormalizedText:
+    return NormalizedText(prompt or "")
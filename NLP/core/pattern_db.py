@@ -1,60 +1,191 @@
 import json
+import hashlib
 import numpy as np
 import os
-from copy import deepcopy
+import re
+import time
+import threading
+from collections import OrderedDict
+from core.spacy_profiles import load_profile, resolve_profiles
+from core.normalizer import fold_phrase
+
+PATTERN_KEYS = ['trigrams', 'pos_templates', 'keywords', 'regex_exact']
+USER_ID_RE = re.compile(r'^[A-Za-z0-9_\-][A-Za-z0-9_.\-]{0,127}$')
+
+
+class CompiledPatterns:
+    """Matcher structures for one pattern set: hash sets for phrases, compiled regexes"""
+
+    def __init__(self, patterns):
+        # Stored trigrams are folded like prompts (NormalizedText.folded_tokens)
+        self.trigrams = frozenset(fold_phrase(t) for t in patterns.get('trigrams', []))
+        self.keywords = frozenset(patterns.get('keywords', []))
+        self.pos_templates = tuple(patterns.get('pos_templates', []))
+        self.regexes = []
+        for p in patterns.get('regex_exact', []):
+            try:
+                self.regexes.append(re.compile(p, re.IGNORECASE))
+            except re.error:
+                print(f"[Warn] Invalid regex pattern ignored: {p}")
+        # Rough footprint used by the per-user LRU budget
+        self.size_bytes = 512 + sum(len(s) + 80 for key in PATTERN_KEYS for s in patterns.get(key, []))
+
+
+class PatternView:
+    """Global patterns plus an optional user overlay; lookups check both, nothing is copied"""
+
+    def __init__(self, base, overlay=None):
+        self.base = base
+        self.overlay = overlay
+        self.regexes = base.regexes + overlay.regexes if overlay else base.regexes
+
+    def has_trigram(self, trigram):
+        return trigram in self.base.trigrams or (self.overlay is not None and trigram in self.overlay.trigrams)
+
 
 class PatternDatabase:
-    def __init__(self, config):
+    def __init__(self, config, nlp=None):
         self.global_path = config['patterns']['global_path']
         self.user_dir = config['patterns']['user_dir']
         self.mock_embeddings = config['embeddings'].get('mock', False)
+        # Per-user overlays are loaded on first use and evicted LRU past this budget
+        self.user_cache_bytes = int(config['patterns'].get('user_cache_mb', 64) * 1024 * 1024)
+        # How often (seconds) a cached overlay re-checks its file for changes
+        self.user_check_interval = config['patterns'].get('user_check_interval', 2.0)
         
         # Load global patterns
+        self.reload_global()
+            
+        # user_id -> {'patterns', 'compiled', 'stamp', 'checked'}
+        self.user_cache = OrderedDict()
+        self.user_cache_used = 0
+        self._lock = threading.RLock()
+        self.embedding_model = self._load_embeddings(config, nlp)
+
+    def reload_global(self):
+        """(Re)read the global pattern file, e.g. after a registry release was activated"""
         with open(self.global_path, 'r') as f:
             self.global_data = json.load(f)
             self.global_patterns = self.global_data['global_patterns']
-            
-        self.user_overrides = {}
-        self.embedding_model = self._load_embeddings(config)
-        self._load_user_patterns()
+        self._compiled_global = None
 
-    def _load_embeddings(self, config):
+    def _load_embeddings(self, config, nlp=None):
         """Load SpaCy or mock embeddings based on config"""
         if self.mock_embeddings:
             print("[Info] Using Mock Embeddings (no memory overhead)")
             return MockEmbeddingModel()
         
+        if nlp is not None:
+            # Reuse a pipeline loaded by the host process instead of loading a second copy
+            return SpacyEmbeddingModel(nlp)
+        
+        # Embedding lookups only read vocabulary vectors, so no component needs to run
+        profiles = resolve_profiles(config)
+        profile = config.get('spacy', {}).get('embedding_profile', 'vectors')
+        model_name = config['embeddings'].get('model', 'en_core_web_md')
+        if profile in profiles and not profiles[profile].get('blank'):
+            # embeddings.model stays the source of truth for which vectors to use
+            profiles[profile] = {**profiles[profile], 'model': model_name}
         try:
-            import spacy
-            model_name = config['embeddings'].get('model', 'en_core_web_md')
-            print(f"[Info] Loading SpaCy embeddings model: {model_name}...")
-            nlp = spacy.load(model_name)
+            print(f"[Info] Loading SpaCy embeddings model: {model_name} (profile '{profile}')...")
+            nlp = load_profile(profile, profiles)
             return SpacyEmbeddingModel(nlp)
         except Exception as e:
             print(f"[Warning] Failed to load SpaCy model '{model_name}': {e}. Falling back to mock.")
             return MockEmbeddingModel()
 
-    def _load_user_patterns(self):
-        """Load all user-specific pattern files"""
-        if not os.path.exists(self.user_dir):
-            return
-            
-        for filename in os.listdir(self.user_dir):
-            if filename.endswith('.json'):
-                user_id = filename.replace('.json', '')
-                with open(os.path.join(self.user_dir, filename), 'r') as f:
-                    self.user_overrides[user_id] = json.load(f)
+    # ------------------------------------------------------------------
+    # Per-user overlays (lazy, LRU-bounded)
+    # ------------------------------------------------------------------
+    def user_path(self, user_id):
+        """users/<shard>/<user_id>.json (shard = first 2 hex chars of sha1), or flat users/<user_id>.json"""
+        if not user_id or not USER_ID_RE.match(user_id):
+            return None
+        shard = hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:2]
+        sharded = os.path.join(self.user_dir, shard, f"{user_id}.json")
+        return sharded if os.path.exists(sharded) else os.path.join(self.user_dir, f"{user_id}.json")
+
+    def _file_stamp(self, path):
+        try:
+            st = os.stat(path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _user_entry(self, user_id):
+        """Cached overlay for user_id, (re)loaded when missing or its file changed"""
+        if not user_id or not USER_ID_RE.match(user_id):
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self.user_cache.get(user_id)
+            if entry is not None:
+                self.user_cache.move_to_end(user_id)
+                if now - entry['checked'] < self.user_check_interval:
+                    return entry
+                entry['checked'] = now
+        # Stat outside the lock; the path is re-resolved so a newly sharded file is picked up
+        path = self.user_path(user_id)
+        if entry is not None and self._file_stamp(path) == entry['stamp']:
+            return entry
+
+        stamp = self._file_stamp(path)
+        patterns = {}
+        if stamp is not None:
+            try:
+                with open(path, 'r') as f:
+                    patterns = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[Warning] Could not load user patterns {path}: {e}")
+        entry = {'patterns': patterns, 'compiled': CompiledPatterns(patterns) if patterns else None,
+                 'stamp': stamp, 'checked': now}
+
+        with self._lock:
+            old = self.user_cache.pop(user_id, None)
+            if old is not None:
+                self.user_cache_used -= self._entry_size(old)
+            self.user_cache[user_id] = entry
+            self.user_cache_used += self._entry_size(entry)
+            # Evict least recently used overlays (never the one just loaded)
+            while self.user_cache_used > self.user_cache_bytes and len(self.user_cache) > 1:
+                _, evicted = self.user_cache.popitem(last=False)
+                self.user_cache_used -= self._entry_size(evicted)
+        return entry
+
+    def _entry_size(self, entry):
+        return entry['compiled'].size_bytes if entry['compiled'] else 256
+
+    def user_patterns(self, user_id):
+        """Raw override lists of one user ({} if none)"""
+        entry = self._user_entry(user_id)
+        return entry['patterns'] if entry else {}
+
+    def compiled(self, user_id=None):
+        """PatternView over the compiled global set and the user's overlay"""
+        if self._compiled_global is None:
+            self._compiled_global = CompiledPatterns(self.global_patterns)
+        entry = self._user_entry(user_id) if user_id else None
+        return PatternView(self._compiled_global, entry['compiled'] if entry else None)
+
+    def cache_stats(self):
+        with self._lock:
+            return {'users_cached': len(self.user_cache), 'bytes_used': self.user_cache_used,
+                    'budget_bytes': self.user_cache_bytes}
 
     def get_patterns(self, user_id=None):
-        """Merge global + user-specific patterns"""
-        patterns = deepcopy(self.global_patterns)
+        """
+        Merge global + user-specific patterns. Without a user overlay this is the
+        global dict itself (treat it as read-only); hot paths use compiled() instead.
+        """
+        user_p = self.user_patterns(user_id) if user_id else {}
+        if not user_p:
+            return self.global_patterns
         
-        if user_id and user_id in self.user_overrides:
-            user_p = self.user_overrides[user_id]
-            # Merge lists
-            for key in ['trigrams', 'pos_templates', 'keywords', 'regex_exact']:
-                if key in user_p:
-                    patterns[key].extend(user_p[key])
+        patterns = dict(self.global_patterns)
+        # Merge lists
+        for key in PATTERN_KEYS:
+            if key in user_p:
+                patterns[key] = patterns.get(key, []) + user_p[key]
                     
         return patterns
     
@@ -65,22 +196,65 @@ class PatternDatabase:
 
     def add_pattern(self, pattern_type, value, source='global', user_id=None, auto=False):
         """Add pattern with versioning"""
-        target = self.global_patterns if not user_id else self.user_overrides.setdefault(user_id, {})
+        if user_id:
+            self._add_user_pattern(user_id, pattern_type, value)
+            return
+        target = self.global_patterns
         
         if pattern_type not in target:
             target[pattern_type] = []
             
         if value not in target[pattern_type]:
             target[pattern_type].append(value)
+            self._compiled_global = None
             
             # If global, we should persist immediately (simplified)
-            if not user_id:
-                self._save_global()
+            self._save_global()
+
+    def add_patterns(self, pattern_type, values, save=True):
+        """
+        Add many global patterns in memory (set membership, not a list scan per value)
+        and persist once. Returns how many were new.
+        """
+        target = self.global_patterns.setdefault(pattern_type, [])
+        seen = set(target)
+        added = 0
+        for value in values:
+            if value not in seen:
+                seen.add(value)
+                target.append(value)
+                added += 1
+        self._compiled_global = None
+        if added and save:
+            self._save_global()
+        return added
+
+    def _add_user_pattern(self, user_id, pattern_type, value):
+        # Overlays can be evicted at any time, so user patterns are written through to their file
+        path = self.user_path(user_id)
+        if path is None:
+            raise ValueError(f"Invalid user id: {user_id!r}")
+        patterns = {k: list(v) for k, v in self.user_patterns(user_id).items()}
+        if value in patterns.setdefault(pattern_type, []):
+            return
+        patterns[pattern_type].append(value)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(patterns, f, indent=2)
+        os.replace(tmp, path)
+        with self._lock:
+            entry = self.user_cache.pop(user_id, None)
+            if entry is not None:
+                self.user_cache_used -= self._entry_size(entry)
 
     def _save_global(self):
-        self.global_data['updated_at'] = "2026-01-25T..." # Use actual time in real impl
-        with open(self.global_path, 'w') as f:
+        self.global_data['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        # Write-then-rename: servers and the artifact registry never see a half-written file
+        tmp = f"{self.global_path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
             json.dump(self.global_data, f, indent=2)
+        os.replace(tmp, self.global_path)
 
 class SpacyEmbeddingModel:
     def __init__(self, nlp):
@@ -1,54 +1,93 @@
-import spacy
+import time
+import random
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import chain
+from core.spacy_profiles import load_profile, tagger_signature
+from core.normalizer import normalize
 
 class PatternLearner:
-    def __init__(self, pattern_db):
+    def __init__(self, pattern_db, profile="mining", profiles=None):
         self.pattern_db = pattern_db
         self.approval_queue = []
         self.frequency_threshold = 3
+        # POS templates only need tags and sentence boundaries (no parser)
+        self.profile = profile
+        self.profiles = profiles
         try:
-           self.nlp = spacy.load("en_core_web_sm")
-        except:
+           self.nlp = load_profile(profile, profiles)
+        except Exception:
            self.nlp = None # Should handle gracefully if not loaded yet
     
-    def bulk_train(self, prompts, min_frequency=2):
+    def bulk_train(self, prompts, min_frequency=2, n_process=1, batch_size=64, sample=None, seed=0):
         """
         Train the system on a large list of 'lethal' prompts.
         Extracts patterns that appear frequently across the dataset.
+
+        POS templates are mined with nlp.pipe over the tagger + senter profile, sharded
+        over `n_process` workers that each return a Counter. `sample` caps how many
+        prompts are parsed for POS templates (trigrams always use the full corpus);
+        min_frequency then applies to the sampled counts.
         """
-        all_trigrams = {}
-        all_pos = {}
-        
         print(f"🧠 Training on {len(prompts)} lethal prompts...")
-        
-        for p in prompts:
-            # 1. Trigrams
-            trigrams = self._extract_trigrams(p)
-            for t in trigrams:
-                all_trigrams[t] = all_trigrams.get(t, 0) + 1
-            
-            # 2. POS Templates (structural fingerprints)
-            pos_templates = self._extract_pos_templates(p)
-            for pt in pos_templates:
-                all_pos[pt] = all_pos.get(pt, 0) + 1
-                
-        # Filter and Add Trigrams
-        new_trigrams = 0
-        for t, freq in all_trigrams.items():
-            if freq >= min_frequency:
-                self.pattern_db.add_pattern('trigrams', t, auto=True)
-                new_trigrams += 1
-                
-        # Filter and Add POS Templates
-        new_pos = 0
-        for pt, freq in all_pos.items():
-            if freq >= min_frequency:
-                # We only add unique templates to avoid bloat
-                self.pattern_db.add_pattern('pos_templates', pt, auto=True)
-                new_pos += 1
+        start = time.time()
+
+        # 1. Trigrams (string-only, cheap enough for the whole corpus)
+        all_trigrams = Counter(chain.from_iterable(map(self._extract_trigrams, prompts)))
+
+        # 2. POS Templates (structural fingerprints)
+        texts = [p for p in prompts if p]
+        if sample and len(texts) > sample:
+            texts = random.Random(seed).sample(texts, sample)
+            print(f"   Sampling {sample} prompts for POS templates")
+        pos_start = time.time()
+        all_pos = self._mine_pos_templates(texts, n_process, batch_size)
+        pos_elapsed = time.time() - pos_start
+        if texts and pos_elapsed > 0:
+            print(f"   ⚡ POS mining: {len(texts)} prompts in {pos_elapsed:.1f}s "
+                  f"({len(texts) / pos_elapsed:.0f} prompts/s, {n_process} process(es))")
                 
-        print(f"✅ Training complete! Added {new_trigrams} trigrams and {new_pos} POS templates.")
+        # Filter and Add Trigrams (in memory; latest.json is written once at the end)
+        new_trigrams = self.pattern_db.add_patterns(
+            'trigrams', (t for t, freq in all_trigrams.items() if freq >= min_frequency), save=False)
+
+        # Filter and Add POS Templates (only comparable with templates from the same pipeline)
+        if all_pos:
+            signature = tagger_signature(self.nlp)
+            patterns = self.pattern_db.global_patterns
+            if patterns.get('pos_templates') and patterns.get('pos_templates_model') != signature:
+                print(f"   Replacing {len(patterns['pos_templates'])} POS templates mined with "
+                      f"{patterns.get('pos_templates_model') or 'an unrecorded model'} ({signature} now)")
+                patterns['pos_templates'] = []
+            patterns['pos_templates_model'] = signature
+        # We only add unique templates to avoid bloat
+        new_pos = self.pattern_db.add_patterns(
+            'pos_templates', (pt for pt, freq in all_pos.items() if freq >= min_frequency), save=False)
+        # One write of latest.json for the whole run
+        if new_trigrams or new_pos or all_pos:
+            self.pattern_db._save_global()
+
+        elapsed = time.time() - start
+        print(f"✅ Training complete! Added {new_trigrams} trigrams and {new_pos} POS templates "
+              f"({len(prompts) / elapsed if elapsed else 0:.0f} prompts/s).")
         return {"new_trigrams": new_trigrams, "new_pos": new_pos}
 
+    def _mine_pos_templates(self, texts, n_process=1, batch_size=64):
+        """Counter of POS templates over texts; per-worker Counters merged with a reduce"""
+        if not self.nlp or not texts:
+            return Counter()
+        if n_process <= 1:
+            return _count_templates(self.nlp, texts, batch_size)
+
+        # Shards several times the worker count so a slow shard does not stall the pool
+        size = max(1, -(-len(texts) // (n_process * 4)))
+        shards = [texts[i:i + size] for i in range(0, len(texts), size)]
+        with ProcessPoolExecutor(max_workers=n_process, initializer=_init_miner,
+                                 initargs=(self.profile, self.profiles)) as pool:
+            counters = pool.map(_mine_shard, shards, [batch_size] * len(shards))
+            return reduce(lambda total, c: total.update(c) or total, counters, Counter())
+
     def auto_extract(self, attack_prompt):
         """Extract patterns from confirmed attack"""
         candidates = {
@@ -73,28 +112,50 @@ class PatternLearner:
     
     def _extract_trigrams(self, text):
         if not text: return []
-        words = text.lower().split()
+        # Same folded view NGramExtractor matches against
+        words = normalize(text).folded_tokens
         if len(words) < 3: return []
         return [' '.join(words[i:i+3]) for i in range(len(words)-2)]
     
     def _extract_pos_templates(self, text):
         """Extract POS sequence patterns"""
         if not self.nlp or not text: return []
-        
-        # Protect against massive strings which crash spacy
-        if len(text) > 100000:
-            print(f"[Warning] Truncating massive prompt ({len(text)} chars) for structural analysis...")
-            text = text[:100000]
             
         try:
-            doc = self.nlp(text)
-            templates = []
-            for sent in doc.sents:
-                # We filter out very short sentences for POS templates
-                if len(sent) > 4:
-                    template = ' '.join([token.pos_ for token in sent])
-                    templates.append(template)
-            return templates
+            return _doc_templates(self.nlp(_truncate(text)))
         except Exception as e:
             print(f"[Warning] POS extraction failed: {e}")
             return []
+
+
+MAX_CHARS = 100000
+_MINER_NLP = None
+
+
+def _truncate(text):
+    # Protect against massive strings which crash spacy
+    if len(text) > MAX_CHARS:
+        print(f"[Warning] Truncating massive prompt ({len(text)} chars) for structural analysis...")
+        return text[:MAX_CHARS]
+    return text
+
+
+def _doc_templates(doc):
+    # We filter out very short sentences for POS templates
+    return [' '.join([token.pos_ for token in sent]) for sent in doc.sents if len(sent) > 4]
+
+
+def _count_templates(nlp, texts, batch_size):
+    counts = Counter()
+    for doc in nlp.pipe((_truncate(t) for t in texts), batch_size=batch_size):
+        counts.update(_doc_templates(doc))
+    return counts
+
+
+def _init_miner(profile, profiles):
+    global _MINER_NLP
+    _MINER_NLP = load_profile(profile, profiles)
+
+
+def _mine_shard(texts, batch_size):
+    return _count_templates(_MINER_NLP, texts, batch_size)
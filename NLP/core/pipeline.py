@@ -6,6 +6,9 @@ from extractors.ngram_extractor import NGramExtractor
 from extractors.syntax_extractor import SyntaxExtractor
 from extractors.statistical_extractor import StatisticalExtractor
 from extractors.embedding_extractor import EmbeddingExtractor
+from extractors.pos_template_extractor import POSTemplateExtractor
+from core.spacy_profiles import resolve_profiles
+from core.artifact_registry import ArtifactRegistry, ReleaseWatcher
 import json
 
 class DetectionPipeline:
@@ -26,21 +29,47 @@ class DetectionPipeline:
         # or load a default one. To separate concerns, let's assume 'config' is a dict.
         pass
 
-    def setup(self, config, weights):
-        self.pattern_db = PatternDatabase(config)
+    def setup(self, config, weights, nlp=None):
+        # nlp: optional pre-loaded spaCy pipeline shared with other layers
+        self.pattern_db = PatternDatabase(config, nlp=nlp)
         self.regex_filter = RegexFilter(self.pattern_db)
+        syntax_profile = config.get('spacy', {}).get('syntax_profile', 'nlp')
+        syntax = SyntaxExtractor(nlp=nlp, profile=syntax_profile, profiles=resolve_profiles(config))
         self.extractors = {
             'ngram': NGramExtractor(self.pattern_db),
-            'syntax': SyntaxExtractor(),
+            'syntax': syntax,
             'stats': StatisticalExtractor(),
             'embedding': EmbeddingExtractor(self.pattern_db)
         }
+        # Off until weights.json has a validated weight for pos_template_matches
+        pos_config = config.get('pos_templates', {})
+        if pos_config.get('enabled', False):
+            self.extractors['pos_templates'] = POSTemplateExtractor(self.pattern_db, nlp=syntax.nlp,
+                                                                    max_distance=pos_config.get('max_distance', 1))
         self.scorer = ScoringEngine(weights)
         self.review_queue = ReviewQueue(config['review_queue'].get('path', 'checkpoints/reviews/queue.jsonl')) # path override support
+        # Patterns/weights are reloaded when cli.py activates a registry release (checkpoint / rollback)
+        self.registry = ArtifactRegistry.from_config(config)
+        self.release_watcher = ReleaseWatcher(self.registry, config.get('checkpoints', {}).get('check_interval', 2.0))
+
+    def _maybe_reload(self):
+        if not self.release_watcher.changed():
+            return
+        try:
+            self.pattern_db.reload_global()
+            with open(self.registry.artifacts['weights'], 'r') as f:
+                weights = json.load(f)
+            # New objects swapped in whole, so in-flight requests keep a consistent view
+            self.scorer = ScoringEngine(weights)
+            self.extractors['embedding'] = EmbeddingExtractor(self.pattern_db)
+            print(f"🔄 Release {self.registry.current()} activated: patterns and weights reloaded")
+        except Exception as e:
+            print(f"[Error] Release reload failed: {e}")
     
-    def detect(self, prompt, user_id=None):
+    def detect(self, prompt, user_id=None, doc=None, enqueue_review=True, profile='full'):
+        self._maybe_reload()
         # Stage 1: Regex fast-fail
-        regex_result = self.regex_filter.check(prompt)
+        regex_result = self.regex_filter.check(prompt, user_id=user_id)
         if regex_result['match']:
             return {
                 'classification': 'suspicious',
@@ -50,24 +79,89 @@ class DetectionPipeline:
             }
         
         # Stage 2: Parallel feature extraction
+        features = self._extract_features(prompt, doc, user_id)
+        
+        # Stage 3: Scoring
+        # The scorer expects a flat dict of features
+        result = self.scorer.score(features, user_id=user_id, profile=profile)
+        return self._finish(prompt, features, result, enqueue_review, profile)
+
+    def screen(self, prompt, user_id=None):
+        """
+        Parse-free stages only: regex fast-fail and trigram lookup, both with the
+        user's pattern overlay. Used by the integrated gateway on prompts its prefilter
+        would let skip the parse; 'match' means the full pipeline must run.
+        """
+        self._maybe_reload()
+        regex_result = self.regex_filter.check(prompt, user_id=user_id)
+        if regex_result['match']:
+            return {'match': True, 'stage': 'regex', 'pattern': regex_result['pattern']}
+        trigrams = self.extractors['ngram'].extract(prompt, user_id=user_id)
+        return {'match': trigrams['trigram_matches'] > 0, 'stage': 'trigram', **trigrams}
+
+    def detect_batch(self, prompts, user_id=None, enqueue_review=True, batch_size=64, profile='full'):
+        """
+        Run detect over a list of prompts, preserving input order. Prompts that pass the
+        regex stage are parsed together with nlp.pipe and scored with one matrix product.
+        Under a 'verdict'/'scores' response profile the feature and pattern dicts are not built.
+        """
+        self._maybe_reload()
+        results = [None] * len(prompts)
+        pending = []
+        for i, prompt in enumerate(prompts):
+            regex_result = self.regex_filter.check(prompt, user_id=user_id)
+            if regex_result['match']:
+                results[i] = {
+                    'classification': 'suspicious',
+                    'score': regex_result['score'],
+                    'stage': 'regex',
+                    'pattern': regex_result['pattern']
+                }
+            else:
+                pending.append(i)
+
+        try:
+            docs = list(self.extractors['syntax'].nlp.pipe([prompts[i] for i in pending], batch_size=batch_size))
+        except Exception as e:
+            print(f"[Error] Batch parse failed, parsing one by one: {e}")
+            docs = [None] * len(pending)
+        pending_features = [self._extract_features(prompts[i], doc, user_id) for i, doc in zip(pending, docs)]
+
+        scored = self.scorer.score_batch(pending_features, user_id=user_id, profile=profile)
+        for i, features, result in zip(pending, pending_features, scored):
+            results[i] = self._finish(prompts[i], features, result, enqueue_review, profile)
+        return results
+
+    def _extract_features(self, prompt, doc=None, user_id=None):
+        # One parse shared by every extractor that reads the Doc
+        if doc is None:
+            try:
+                doc = self.extractors['syntax'].nlp(prompt)
+            except Exception as e:
+                print(f"[Error] Parse failed: {e}")
         features = {}
         for name, extractor in self.extractors.items():
             # Some extractors might fail if external deps missing (mocking handled inside)
             try:
-                result = extractor.extract(prompt)
+                if getattr(extractor, 'uses_user_patterns', False):
+                    result = extractor.extract(prompt, doc=doc, user_id=user_id)
+                else:
+                    result = extractor.extract(prompt, doc=doc)
                 features.update(result)
             except Exception as e:
                 print(f"[Error] Extractor {name} failed: {e}")
-        
-        # Stage 3: Scoring
-        # The scorer expects a flat dict of features
-        result = self.scorer.score(features)
+        return features
+
+    def _finish(self, prompt, features, result, enqueue_review, profile='full'):
         classification = self.scorer.classify(result['score'])
         
         # Stage 4: Borderline handling
-        if classification == 'borderline':
+        # (callers that defer review to a background worker pass enqueue_review=False)
+        if classification == 'borderline' and enqueue_review:
             self.review_queue.enqueue(prompt, result['score'], features)
         
+        if profile != 'full':
+            return {'classification': classification, 'score': result['score']}
         return {
             'classification': classification,
             'score': result['score'],
@@ -0,0 +1,76 @@
+"""
+Response profiles and fast JSON encoding for the analyze endpoints.
+
+Clients pick a profile with `options["profile"]` (or `?profile=` on the raw endpoints):
+- verdict: the verdict and latency only (plus blocking_layer / shadow_task_id in the cascade)
+- scores:  scores, stages and classifications, without explanations, feature dicts,
+           matched patterns or the echoed prompt
+- full:    everything (default, same response as before profiles existed)
+
+Layers read the profile before building their result: under `verdict`/`scores`
+DetectionPipeline/ScoringEngine never build the normalized, weighted or matched-pattern
+dicts and MLFirewall never formats an explanation or copies its feature dict. The API
+servers encode the projected dict with orjson straight into the response body,
+skipping pydantic validation and jsonable_encoder.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback, same output but slower
+    orjson = None
+
+PROFILES = ("verdict", "scores", "full")
+DEFAULT_PROFILE = "full"
+
+# Kept by the verdict profile (when present)
+VERDICT_FIELDS = ("verdict", "blocking_layer", "shadow_task_id", "latency_ms")
+# Dropped by the scores profile, at every level of a cascade result
+HEAVY_FIELDS = frozenset(("prompt", "explanation", "features", "weighted_features", "matched_patterns"))
+
+
+def resolve_profile(options: Optional[Dict[str, Any]]) -> str:
+    """Profile requested in an options dict; ValueError if unknown"""
+    profile = (options or {}).get("profile") or DEFAULT_PROFILE
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown response profile '{profile}'. Expected one of {list(PROFILES)}")
+    return profile
+
+
+def project(result: Dict[str, Any], profile: str) -> Dict[str, Any]:
+    """Drop the fields a profile does not return (nested layer results included)"""
+    if profile == "full":
+        return result
+    if profile == "verdict":
+        return {k: result[k] for k in VERDICT_FIELDS if k in result}
+    return {k: (_project_layers(v) if k == "layers" else v)
+            for k, v in result.items() if k not in HEAVY_FIELDS}
+
+
+def _project_layers(layers: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: {k: v for k, v in layer.items() if k not in HEAVY_FIELDS} if isinstance(layer, dict) else layer
+            for name, layer in layers.items()}
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_ORJSON_OPTIONS)
+else:
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
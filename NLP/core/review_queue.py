@@ -1,11 +1,14 @@
 import json
 import uuid
 import os
+import threading
 from datetime import datetime
 
 class ReviewQueue:
     def __init__(self, queue_path='checkpoints/reviews/queue.jsonl'):
         self.queue_path = queue_path
+        # Background workers (e.g. shadow ML scoring) enqueue concurrently with requests
+        self._lock = threading.Lock()
         self._ensure_dir()
         self.queue = self._load_queue()
     
@@ -28,8 +31,8 @@ class ReviewQueue:
             for item in self.queue:
                 f.write(json.dumps(item) + '\n')
 
-    def enqueue(self, prompt, score, features):
-        """Add borderline case to queue"""
+    def enqueue(self, prompt, score, features, extra=None):
+        """Add borderline case to queue. `extra` carries additional signals (e.g. ML scores)."""
         entry = {
             'id': uuid.uuid4().hex,
             'prompt': prompt,
@@ -38,8 +41,13 @@ class ReviewQueue:
             'timestamp': datetime.utcnow().isoformat(),
             'status': 'pending'
         }
-        self.queue.append(entry)
-        self._save()
+        if extra:
+            entry.update(extra)
+        with self._lock:
+            self.queue.append(entry)
+            # Append-only write: new entries don't rewrite the whole file
+            with open(self.queue_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
         
     def get_pending(self, limit=50):
         """Get next batch for review"""
@@ -48,15 +56,16 @@ class ReviewQueue:
     def mark_reviewed(self, entry_id, verdict, reviewer):
         """Update entry after human review"""
         found = None
-        for entry in self.queue:
-            if entry['id'] == entry_id:
-                entry['status'] = 'reviewed'
-                entry['verdict'] = verdict  # 'suspicious' or 'benign'
-                entry['reviewer'] = reviewer
-                entry['reviewed_at'] = datetime.utcnow().isoformat()
-                found = entry
-                break
-        self._save()
+        with self._lock:
+            for entry in self.queue:
+                if entry['id'] == entry_id:
+                    entry['status'] = 'reviewed'
+                    entry['verdict'] = verdict  # 'suspicious' or 'benign'
+                    entry['reviewer'] = reviewer
+                    entry['reviewed_at'] = datetime.utcnow().isoformat()
+                    found = entry
+                    break
+            self._save()
         return found
         
         # Note: logic for triggering pattern extraction is in higher level controller
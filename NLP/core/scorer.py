@@ -1,6 +1,7 @@
+import numpy as np
+
 class ScoringEngine:
     def __init__(self, weights_config):
-        self.weights = weights_config
         self.normalization_caps = {
             'trigram_matches': 3,
             'modal_verb_count': 3,
@@ -9,34 +10,90 @@ class ScoringEngine:
             'parse_tree_depth': 12,
             'parenthetical_depth': 5,
             'avg_word_length': 10,
-            'delimiter_count': 10
+            'delimiter_count': 10,
+            'pos_template_matches': 3
         }
-    
-    def score(self, features):
-        """Normalize + weight features"""
-        normalized = self._normalize(features)
-        
-        # Merge global + user weights logic would happen in pipeline usually, 
-        # but here we assume 'weights_config' passed in acts as the active configuration.
-        # We look for keys in 'global' section of weights if structured that way, 
-        # or flat if passed flat.
+        self.compile(weights_config)
+
+    def compile(self, weights_config):
+        """
+        Freeze weights.json into arrays: one feature order, a caps vector and one
+        weight vector per user (global weights with that user's overrides applied).
+        Call again whenever the weights change.
+        """
         # Based on config/weights.json structure: {"global": {...}, "user_overrides": ...}
-        
-        active_weights = self.weights.get('global', self.weights)
-        
-        weighted = {}
-        for k, w in active_weights.items():
-            if k in normalized:
-                weighted[k] = normalized[k] * w
-        
-        final_score = sum(weighted.values())
-        
-        return {
-            'score': final_score,
-            'normalized_features': normalized,
-            'weighted_features': weighted
-        }
-    
+        # (a flat {feature: weight} dict is accepted as the global section)
+        self.weights = weights_config
+        global_weights = weights_config.get('global', weights_config)
+        overrides = weights_config.get('user_overrides', {}) if 'global' in weights_config else {}
+
+        order = list(global_weights)
+        for user_weights in overrides.values():
+            order += [k for k in user_weights if k not in order]
+        self.feature_order = order
+        self.feature_index = {k: i for i, k in enumerate(order)}
+
+        # Uncapped features pass through unchanged (cap 1, no clipping)
+        self.caps = np.array([self.normalization_caps.get(k, 1.0) for k in order], dtype=float)
+        self.clip = np.array([1.0 if k in self.normalization_caps else np.inf for k in order])
+
+        self.global_vector = np.array([global_weights.get(k, 0.0) for k in order], dtype=float)
+        self.user_vectors = {}
+        for user_id, user_weights in overrides.items():
+            vector = self.global_vector.copy()
+            for k, w in user_weights.items():
+                vector[self.feature_index[k]] = w
+            self.user_vectors[user_id] = vector
+        # Weighted features per weight vector (a feature only counts if it has a weight entry)
+        self._global_mask = np.array([k in global_weights for k in order])
+        self._user_masks = {u: self._global_mask | np.array([k in overrides[u] for k in order])
+                            for u in overrides}
+
+    def weight_vector(self, user_id=None):
+        return self.user_vectors.get(user_id, self.global_vector)
+
+    def score(self, features, user_id=None, profile='full'):
+        """Normalize + weight features (per-user weights when weights.json has overrides for user_id)"""
+        return self.score_batch([features], user_id=user_id, profile=profile)[0]
+
+    def score_batch(self, feature_dicts, user_id=None, profile='full'):
+        """
+        score() for many feature dicts: one clip-divide and one matrix-vector product.
+        The per-feature dicts (normalized_features, weighted_features) are only built
+        for the 'full' response profile; other profiles get the score alone.
+        """
+        if not feature_dicts:
+            return []
+        x, present = self._vectorize(feature_dicts)
+        weighted_matrix = self._normalize_matrix(x) * self.weight_vector(user_id)
+        scores = weighted_matrix.sum(axis=1).tolist()
+        if profile != 'full':
+            return [{'score': final_score} for final_score in scores]
+        masks = (present & self._user_masks.get(user_id, self._global_mask)).tolist()
+        order = self.feature_order
+
+        results = []
+        for features, row, mask, final_score in zip(feature_dicts, weighted_matrix.tolist(), masks, scores):
+            results.append({
+                'score': final_score,
+                'normalized_features': self._normalize(features),
+                'weighted_features': {k: w for k, w, m in zip(order, row, mask) if m}
+            })
+        return results
+
+    def _vectorize(self, feature_dicts):
+        """(n, features) values in compiled order; missing features are 0 and flagged absent"""
+        order = self.feature_order
+        x = np.fromiter((f.get(k, np.nan) for f in feature_dicts for k in order), dtype=float,
+                        count=len(feature_dicts) * len(order)).reshape(len(feature_dicts), len(order))
+        present = x == x  # NaN marks a missing feature
+        x[~present] = 0.0
+        return x, present
+
+    def _normalize_matrix(self, x):
+        """Same scaling as _normalize, for the compiled features (bools arrive as 0/1)"""
+        return np.minimum(x / self.caps, self.clip)
+
     def _normalize(self, features):
         """Scale to [0,1]"""
         normalized = {}
@@ -49,13 +106,13 @@ class ScoringEngine:
                 normalized[key] = min(value / cap, 1.0)
             else:
                 # Assume already normalized (like embedding_similarity) or no norm needed
-                normalized[key] = value  
+                normalized[key] = value
         return normalized
-    
+
     def classify(self, score, thresholds=None):
         if thresholds is None:
             thresholds = {'high': 0.55, 'low': 0.45}
-            
+
         if score > thresholds['high']:
             return 'suspicious'
         elif score < thresholds['low']:
@@ -1,5 +1,6 @@
 import numpy as np
 from scipy.spatial.distance import cosine
+from core.normalizer import normalize
 
 class EmbeddingExtractor:
     def __init__(self, pattern_db):
@@ -7,8 +8,8 @@ class EmbeddingExtractor:
         # Use default if not present
         self.attack_prototype = np.array(pattern_db.get_patterns().get('embedding_prototype', [0]*300))
     
-    def extract(self, prompt):
-        words = [w.lower() for w in prompt.split() if w.isalpha()]
+    def extract(self, prompt, doc=None):
+        words = [w for w in normalize(prompt).folded_tokens if w.isalpha()]
         valid_words = [w for w in words if w in self.model]
         
         if not valid_words:
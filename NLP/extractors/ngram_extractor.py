@@ -1,30 +1,27 @@
+from core.normalizer import normalize
+
 class NGramExtractor:
+    # Reads per-user pattern overlays, so the pipeline passes user_id
+    uses_user_patterns = True
+
     def __init__(self, pattern_db):
-        # We grab global patterns initially. 
-        # In a real per-inference context, we might pass pattern_db to extract() 
-        # but the interface defined in spec says __init__(pattern_db).
-        # We'll assume for MVP we check against global + loaded patterns.
         self.pattern_db = pattern_db
     
-    def extract(self, prompt):
-        # Generate all trigrams from prompt
-        prompt_trigrams = self._generate_trigrams(prompt.lower())
+    def extract(self, prompt, doc=None, user_id=None):
+        # Generate all trigrams from the folded view (lowercase, homoglyph/leet folded)
+        prompt_trigrams = self._generate_trigrams(normalize(prompt).folded_tokens)
         
-        # Get latest patterns (could optimize to not fetch every time)
-        trigrams = self.pattern_db.get_patterns()['trigrams']
+        # Compiled global trigram set + the user's overlay (set lookups, no copies)
+        patterns = self.pattern_db.compiled(user_id)
         
-        # Count matches against database
-        matches = sum(1 for tg in prompt_trigrams if tg in trigrams)
-        
-        matched_patterns = [tg for tg in prompt_trigrams if tg in trigrams]
+        matched_patterns = [tg for tg in prompt_trigrams if patterns.has_trigram(tg)]
         
         return {
-            'trigram_matches': matches,
+            'trigram_matches': len(matched_patterns),
             'matched_patterns': matched_patterns
         }
     
-    def _generate_trigrams(self, text):
-        words = text.split()
+    def _generate_trigrams(self, words):
         if len(words) < 3:
             return []
         return [' '.join(words[i:i+3]) for i in range(len(words)-2)]
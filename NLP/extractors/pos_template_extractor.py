@@ -0,0 +1,160 @@
+"""
+Structural matching against the POS templates mined by PatternLearner.
+
+Templates ("PRON AUX ADV PROPN PUNCT", ...) are encoded once as byte strings of
+small tag ids, so a sentence is matched without joining strings:
+
+- exact: one set lookup of the sentence's tag bytes
+- approximate (edit distance <= max_distance): deletion neighbourhoods. Every
+  template is indexed under each variant with up to `max_distance` tags removed;
+  a sentence looks up its own deletion variants, and candidates are confirmed
+  with a banded Levenshtein check (two sequences within distance k always share
+  a variant, the check drops the rare pairs that share one but are further apart)
+
+Sentence boundaries and tags come from one `doc.to_array` call on the shared parse.
+Docs without POS annotation (tokenizer profile) yield no matches, and so does a
+parse from a pipeline other than the one the templates were mined with
+(`pos_templates_model` in the pattern file, see tagger_signature): tag sequences
+and sentence splits of different models are not comparable.
+
+Off by default (`pos_templates.enabled` in system.yaml) until weights.json carries
+a validated weight for pos_template_matches.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+from spacy.attrs import POS, SENT_START
+from core.spacy_profiles import tagger_signature
+
+# Same cut as PatternLearner: shorter sentences are never mined as templates
+MIN_TEMPLATE_LEN = 5
+
+
+class POSTemplateIndex:
+    def __init__(self, templates: Iterable[str], max_distance: int = 1):
+        self.max_distance = max_distance
+        self.tag_ids: Dict[str, int] = {}
+        self.exact: Set[bytes] = set()
+        self.variants: Dict[bytes, List[bytes]] = {}
+        for template in templates:
+            tags = template.split()
+            if len(tags) >= MIN_TEMPLATE_LEN:
+                self.exact.add(self.encode(tags))
+        for seq in self.exact:
+            for variant in self._deletions(seq):
+                self.variants.setdefault(variant, []).append(seq)
+
+    def __len__(self):
+        return len(self.exact)
+
+    def encode(self, tags: Iterable[str]) -> bytes:
+        """Tag names -> one byte per tag (ids assigned on first sight)"""
+        ids = self.tag_ids
+        return bytes(ids.setdefault(t, len(ids) + 1) for t in tags)
+
+    def match(self, seq: bytes) -> Optional[int]:
+        """Edit distance to the closest template if within max_distance, else None"""
+        if seq in self.exact:
+            return 0
+        if self.max_distance == 0:
+            return None
+        best = None
+        for variant in self._deletions(seq):
+            for candidate in self.variants.get(variant, ()):
+                d = _bounded_distance(seq, candidate, self.max_distance)
+                if d is not None and (best is None or d < best):
+                    best = d
+                    if d == 1:
+                        return 1
+        return best
+
+    def _deletions(self, seq: bytes) -> Set[bytes]:
+        """seq and every variant with up to max_distance tags removed"""
+        frontier = {seq}
+        out = {seq}
+        for _ in range(self.max_distance):
+            frontier = {s[:i] + s[i + 1:] for s in frontier for i in range(len(s))}
+            out |= frontier
+        return out
+
+
+def _bounded_distance(a: bytes, b: bytes, k: int) -> Optional[int]:
+    """Levenshtein distance if <= k (banded DP), else None"""
+    if abs(len(a) - len(b)) > k:
+        return None
+    inf = k + 1
+    prev = {j: j for j in range(0, min(len(b), k) + 1)}
+    for i in range(1, len(a) + 1):
+        cur = {}
+        lo, hi = max(0, i - k), min(len(b), i + k)
+        for j in range(lo, hi + 1):
+            if j == 0:
+                cur[j] = i
+                continue
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev.get(j - 1, inf) + cost, prev.get(j, inf) + 1, cur.get(j - 1, inf) + 1)
+        if min(cur.values()) > k:
+            return None
+        prev = cur
+    d = prev.get(len(b), inf)
+    return d if d <= k else None
+
+
+class POSTemplateExtractor:
+    def __init__(self, pattern_db, nlp=None, max_distance: int = 1):
+        self.pattern_db = pattern_db
+        self.nlp = nlp
+        self.max_distance = max_distance
+        self._index = None
+        self._source = None
+        self._source_size = -1
+        self._signature = tagger_signature(nlp) if nlp is not None else None
+        self._warned = None
+
+    @property
+    def index(self) -> POSTemplateIndex:
+        # Rebuilt only when the learner adds templates or the pattern file is reloaded
+        # (no per-call pattern copies)
+        templates = self.pattern_db.global_patterns.get('pos_templates', [])
+        if self._index is None or templates is not self._source or len(templates) != self._source_size:
+            self._index = POSTemplateIndex(templates, self.max_distance)
+            self._source = templates
+            self._source_size = len(templates)
+        return self._index
+
+    def comparable(self) -> bool:
+        """Templates were mined with the pipeline that parses our docs"""
+        mined_with = self.pattern_db.global_patterns.get('pos_templates_model')
+        if mined_with == self._signature:
+            return True
+        if self._warned != mined_with:
+            self._warned = mined_with
+            print(f"[Warning] POS templates mined with {mined_with or 'an unrecorded model'}, "
+                  f"prompts parsed with {self._signature}: template matching skipped")
+        return False
+
+    def extract(self, prompt, doc=None):
+        if doc is None:
+            if self.nlp is None:
+                return {'pos_template_matches': 0, 'pos_template_ratio': 0.0}
+            doc = self.nlp(prompt)
+
+        index = self.index
+        sentences = matches = 0
+        if len(doc) and doc.has_annotation("POS") and len(index) and self.comparable():
+            strings = doc.vocab.strings
+            arr = doc.to_array([POS, SENT_START])
+            tag_ids = index.tag_ids
+            # Unknown tags map to 0, which no template contains
+            codes = bytes(tag_ids.get(strings[int(p)], 0) if p else 0 for p in arr[:, 0])
+            starts = [i for i, s in enumerate(arr[:, 1]) if s == 1 or i == 0]
+            for begin, end in zip(starts, starts[1:] + [len(doc)]):
+                if end - begin < MIN_TEMPLATE_LEN:
+                    continue
+                sentences += 1
+                if index.match(codes[begin:end]) is not None:
+                    matches += 1
+
+        return {
+            'pos_template_matches': matches,
+            'pos_template_ratio': matches / sentences if sentences else 0.0
+        }
@@ -1,24 +1,24 @@
-from textstat import flesch_kincaid_grade
 from collections import Counter
+from core.normalizer import normalize
+from extractors.text_stats import char_stats, fk_grade
 
 class StatisticalExtractor:
-    def extract(self, prompt):
-        words = prompt.split()
+    def extract(self, prompt, doc=None):
+        norm = normalize(prompt)
+        words = norm.tokens
         
+        # Character statistics read the raw prompt (invisible characters count);
+        # word statistics and readability read the normalized text
+        chars = char_stats(prompt)
         return {
             'char_count': len(prompt),
             'word_count': len(words),
-            'fk_grade': self._safe_fk_grade(prompt),
-            'special_char_ratio': self._special_char_ratio(prompt),
-            'repetition_ratio': self._repetition_ratio(words),
-            'delimiter_count': self._delimiter_count(prompt),
+            'fk_grade': self._safe_fk_grade(norm.text),
+            'special_char_ratio': chars['special_char_ratio'],
+            'repetition_ratio': self._repetition_ratio(norm.lower_tokens),
+            'delimiter_count': chars['delimiter_count'],
             'avg_word_length': self._avg_word_length(words)
         }
-    
-    def _delimiter_count(self, text):
-        # Common delimiters used in exploits (attention exploits, separators, and messy prompts)
-        delimiters = "-_=|:;,.\\/<>[]{}()?!*#@$%^&+"
-        return sum(1 for c in text if c in delimiters)
 
     def _avg_word_length(self, words):
         if not words:
@@ -27,16 +27,13 @@ class StatisticalExtractor:
     
     def _safe_fk_grade(self, text):
         try:
-            return flesch_kincaid_grade(text)
+            return fk_grade(text)
         except:
             return 0.0
-            
-    def _special_char_ratio(self, text):
-        special = sum(1 for c in text if not c.isalnum() and c != ' ')
-        return special / len(text) if len(text) > 0 else 0
+
     
     def _repetition_ratio(self, words):
         if not words:
             return 0
-        most_common = Counter([w.lower() for w in words]).most_common(1)[0]
+        most_common = Counter(words).most_common(1)[0]
         return most_common[1] / len(words)
@@ -0,0 +1,145 @@
+"""
+Fused syntax-feature kernel.
+
+One `doc.to_array` call plus vectorized NumPy passes replace the per-feature loops
+(and the recursive parse-depth walk) that used to traverse each Doc 6-8 times.
+Parse depth uses pointer jumping over the HEAD column, so it is iterative and
+safe on arbitrarily deep parses.
+
+Used by the NLP SyntaxExtractor and the ML FeatureExtractor. The result is cached
+on the Doc, so when the integrated gateway shares one parse between both layers
+the kernel runs once per prompt.
+
+Docs from the parser-less "fast"/"tokenizer" profiles are handled too: parse depth
+is dropped (0), passive voice falls back to "be + VBN" from tags, and tag/POS
+features fall back to word lists when there is no tagger.
+"""
+
+import numpy as np
+from spacy.attrs import HEAD, DEP, POS, TAG, LOWER, LENGTH, IS_PUNCT, IS_SPACE, SENT_START
+
+NEGATION_WORDS = ["not", "without", "except", "unless", "besides", "never", "no", "avoid"]
+CONDITIONAL_WORDS = ["if", "when", "unless", "provided that", "assuming", "in case"]
+ROLE_TARGET_POS = ["NOUN", "PROPN", "ADJ"]
+# Fallbacks for Docs without a parser / tagger
+MODAL_WORDS = ["can", "could", "may", "might", "must", "shall", "should", "will", "would", "ought"]
+BE_FORMS = ["be", "is", "am", "are", "was", "were", "been", "being"]
+
+CACHE_KEY = "syntax_stats"
+_COLUMNS = [HEAD, DEP, POS, TAG, LOWER, LENGTH, IS_PUNCT, IS_SPACE, SENT_START]
+
+
+def syntax_stats(doc):
+    """
+    All token-level syntax statistics of a parsed Doc in one pass:
+
+    parse_tree_depth, modal_verb_count, passive_voice_ratio, is_imperative,
+    role_pattern, negation_count, conditional_count, sentence_count,
+    question_count, word_count (non-punct, non-space tokens), word_chars.
+    """
+    cached = doc.user_data.get(CACHE_KEY)
+    if cached is not None:
+        return cached
+
+    n = len(doc)
+    if n == 0:
+        stats = {
+            "parse_tree_depth": 0, "modal_verb_count": 0, "passive_voice_ratio": 0.0,
+            "is_imperative": False, "role_pattern": False, "negation_count": 0,
+            "conditional_count": 0, "sentence_count": 0, "question_count": 0,
+            "word_count": 0, "word_chars": 0
+        }
+        doc.user_data[CACHE_KEY] = stats
+        return stats
+
+    strings = doc.vocab.strings
+    has_dep = doc.has_annotation("DEP")
+    has_tag = doc.has_annotation("TAG")
+    has_pos = doc.has_annotation("POS")
+    arr = doc.to_array(_COLUMNS)
+    # HEAD is a signed offset to the head token; DEP/POS/TAG/LOWER are string hashes
+    heads = np.arange(n) + arr[:, 0].astype(np.int64)
+    dep, pos, tag, lower = arr[:, 1], arr[:, 2], arr[:, 3], arr[:, 4]
+    length = arr[:, 5].astype(np.int64)
+    is_punct, is_space = arr[:, 6] == 1, arr[:, 7] == 1
+    sent_start = arr[:, 8].astype(np.int64) == 1
+
+    def ids(labels):
+        return np.array([strings[label] for label in labels], dtype=np.uint64)
+
+    # Words / lengths
+    words = ~is_punct & ~is_space
+    word_count = int(words.sum())
+    word_chars = int(length[words].sum())
+
+    # Modals, negations, conditionals
+    is_modal = (tag == ids(["MD"])[0]) if has_tag else np.isin(lower, ids(MODAL_WORDS))
+    modal_verb_count = int(is_modal.sum())
+    negation_count = int(((dep == ids(["neg"])[0]) | np.isin(lower, ids(NEGATION_WORDS))).sum())
+    conditional_count = int(((pos == ids(["SCONJ"])[0]) | np.isin(lower, ids(CONDITIONAL_WORDS))).sum())
+
+    # Passive voice: verbs with an auxpass/nsubjpass child
+    is_verb = pos == ids(["VERB"])[0]
+    total_verbs = int(is_verb.sum())
+    if has_dep:
+        passive_children = np.isin(dep, ids(["auxpass", "nsubjpass"])) & (heads != np.arange(n))
+        passive_heads = np.unique(heads[passive_children])
+        passive_count = int(is_verb[passive_heads].sum())
+    elif has_tag:
+        # No parser: a past participle right after a form of "be"
+        passive_count = int(((tag[1:] == ids(["VBN"])[0]) & np.isin(lower[:-1], ids(BE_FORMS))).sum())
+    else:
+        passive_count = 0
+    passive_voice_ratio = passive_count / total_verbs if total_verbs > 0 else 0.0
+
+    # Imperative: first token is a verb
+    is_imperative = bool(is_verb[0])
+
+    # Role pattern: "you are [NOUN/PROPN/ADJ]"
+    role_pattern = False
+    if n >= 3:
+        you, are = ids(["you", "are"])
+        # Without POS tags any following word counts
+        target = np.isin(pos[2:], ids(ROLE_TARGET_POS)) if has_pos else ~(is_punct[2:] | is_space[2:])
+        role_pattern = bool(np.any((lower[:-2] == you) & (lower[1:-1] == are) & target))
+
+    # Parse depth (nodes on the longest root-to-leaf path) by pointer jumping:
+    # after k rounds ptr[i] is the 2^k-th ancestor and dist[i] the edges walked
+    parse_tree_depth = 0
+    if has_dep:
+        ptr = heads.copy()
+        dist = (ptr != np.arange(n)).astype(np.int64)
+        for _ in range(int(np.ceil(np.log2(n))) + 1):
+            nxt = ptr[ptr]
+            if np.array_equal(nxt, ptr):
+                break
+            dist = dist + dist[ptr]
+            ptr = nxt
+        parse_tree_depth = int(dist.max()) + 1
+
+    # Sentences: the first token always starts one
+    sent_start[0] = True
+    sentence_count = int(sent_start.sum())
+    # A sentence is a question when its last non-space token ends with '?'
+    sent_id = np.cumsum(sent_start) - 1
+    non_space = np.flatnonzero(~is_space)
+    question_count = 0
+    if len(non_space):
+        last = non_space[np.r_[sent_id[non_space][1:] != sent_id[non_space][:-1], True]]
+        question_count = sum(1 for i in last if doc[int(i)].text.endswith("?"))
+
+    stats = {
+        "parse_tree_depth": parse_tree_depth,
+        "modal_verb_count": modal_verb_count,
+        "passive_voice_ratio": passive_voice_ratio,
+        "is_imperative": is_imperative,
+        "role_pattern": role_pattern,
+        "negation_count": negation_count,
+        "conditional_count": conditional_count,
+        "sentence_count": sentence_count,
+        "question_count": question_count,
+        "word_count": word_count,
+        "word_chars": word_chars
+    }
+    doc.user_data[CACHE_KEY] = stats
+    return stats
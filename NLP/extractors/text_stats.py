@@ -0,0 +1,104 @@
+"""
+Fast character-class statistics and Flesch-Kincaid grade.
+
+- char_stats: one histogram of the prompt's ASCII bytes (`np.bincount`) dotted
+  with per-class masks, instead of one Python loop per feature. Non-ASCII
+  characters are split off with `str.translate` and classified once per distinct
+  character.
+- fk_grade: textstat's flesch_kincaid_grade rules (same word, sentence and
+  syllable counts) with a memoized per-word syllable count, so repeated words
+  cost one cache hit. Syllables come from cmudict (pyphen for words it lacks), like
+  textstat. cmudict is never downloaded at runtime: install it with
+  `python -m nltk.downloader cmudict` (the Dockerfile does). Without it fk_grade
+  is 0.0, the value the extractors produced when textstat could not load it.
+
+Used by the NLP StatisticalExtractor and the ML FeatureExtractor.
+"""
+
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+DELIMITERS = "-_=|:;,.\\/<>[]{}()?!*#@$%^&+"
+
+# Per-ASCII-code class masks: delimiter, and "special" (not alphanumeric, not a space)
+_DELIMITER_MASK = np.array([chr(c) in DELIMITERS for c in range(128)], dtype=np.int64)
+_SPECIAL_MASK = np.array([not chr(c).isalnum() and c != 32 for c in range(128)], dtype=np.int64)
+_DROP_ASCII = dict.fromkeys(range(128))
+
+# textstat's remove_punctuation: drop quotes that are not contraction apostrophes, then
+# everything but word characters, whitespace and apostrophes
+_NONCONTRACTION_APOSTROPHE = re.compile(r"\'(?![tsd]|ve|ll|re)")
+_PUNCTUATION = re.compile(r"[^\w\s\']")
+_SENTENCE = re.compile(r"\b[^.!?]+[.!?]*")
+
+SYLLABLE_CACHE_SIZE = 65536
+
+
+def char_stats(text: str) -> dict:
+    """delimiter_count and special_char_ratio of the raw text in one pass"""
+    if not text:
+        return {"delimiter_count": 0, "special_char_ratio": 0}
+    # ASCII bytes (non-ASCII characters dropped) -> 128-bin histogram
+    hist = np.bincount(np.frombuffer(text.encode("ascii", "ignore"), dtype=np.uint8), minlength=128)
+    special = int(hist @ _SPECIAL_MASK)
+    if not text.isascii():
+        # Delimiters are all ASCII; the rest is classified once per distinct character
+        wide = Counter(text.translate(_DROP_ASCII))
+        special += sum(n for c, n in wide.items() if not c.isalnum())
+    return {
+        "delimiter_count": int(hist @ _DELIMITER_MASK),
+        "special_char_ratio": special / len(text),
+    }
+
+
+def list_words(text: str):
+    """textstat.list_words with default arguments"""
+    return _PUNCTUATION.sub("", _NONCONTRACTION_APOSTROPHE.sub("", text)).split()
+
+
+@lru_cache(maxsize=1)
+def _syllable_sources():
+    """(cmudict or None, pyphen) loaded once; cmudict only if it is already installed"""
+    from pyphen import Pyphen
+    try:
+        import nltk
+        nltk.data.find("corpora/cmudict")
+        cmu = nltk.corpus.cmudict.dict()
+    except Exception:
+        print("⚠️ NLTK cmudict not installed (python -m nltk.downloader cmudict): fk_grade reported as 0.0")
+        cmu = None
+    return cmu, Pyphen(lang="en_US")
+
+
+@lru_cache(maxsize=SYLLABLE_CACHE_SIZE)
+def syllables(word: str) -> int:
+    """Syllables in one lowercase word (cmudict vowel phones, else pyphen hyphenation points + 1)"""
+    cmu, pyphen = _syllable_sources()
+    entry = cmu.get(word) if cmu is not None else None
+    if entry:
+        return sum(1 for p in entry[0] if p[-1].isdigit())
+    return len(pyphen.positions(word)) + 1
+
+
+def fk_grade(text: str) -> float:
+    """Flesch-Kincaid grade: 0.39 * words/sentence + 11.8 * syllables/word - 15.59 (0.0 without cmudict)"""
+    if _syllable_sources()[0] is None:
+        return 0.0
+    words = list_words(text)
+    if not words:
+        return 0.0
+    # Sentences of <= 2 words are not counted (at least one sentence per text)
+    sentences = _SENTENCE.findall(text)
+    short = sum(1 for s in sentences if len(list_words(s)) <= 2)
+    sentence_count = max(1, len(sentences) - short)
+
+    # Lowercased after punctuation removal, like textstat (the apostrophe rule is case-sensitive)
+    syllable_count = sum(syllables(w.lower()) for w in words)
+    words_per_sentence = len(words) / sentence_count
+    syllables_per_word = syllable_count / len(words)
+    if syllables_per_word == 0:
+        return 0.0
+    return 0.39 * words_per_sentence + 11.8 * syllables_per_word - 15.59
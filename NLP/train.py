@@ -1,31 +1,149 @@
 import os
+import time
 import yaml
 import json
+import threading
 import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 from core.pipeline import DetectionPipeline
 from core.pattern_learner import PatternLearner
+from core.spacy_profiles import resolve_profiles
+from core.dedup import dedup_near_duplicates, print_cluster_report
+from core.artifact_registry import ArtifactRegistry
 
-def get_repo_files(repo_path):
-    """List all files in the git repo using git ls-tree"""
+CORPUS_EXTENSIONS = ('.mkd', '.txt', '.md')
+CORPUS_CACHE_PATH = 'data/cache/corpus_prompts.json'
+# Bump when extract_prompts changes so cached results are re-extracted
+EXTRACT_VERSION = 1
+# Blobs are handed to workers in chunks (one process round-trip per chunk, not per file)
+CHUNK_BLOBS = 64
+CHUNK_BYTES = 4 * 1024 * 1024
+
+def get_repo_blobs(repo_path, extensions=CORPUS_EXTENSIONS):
+    """(path, blob sha) of every prompt file at HEAD, from a single git ls-tree"""
     result = subprocess.run(
-        ['git', '-C', repo_path, 'ls-tree', '-r', 'HEAD', '--name-only'],
-        capture_output=True, text=True
+        ['git', '-C', repo_path, 'ls-tree', '-r', '-z', 'HEAD'],
+        capture_output=True
     )
     if result.returncode != 0:
-        print(f"Error listing files: {result.stderr}")
+        print(f"Error listing files: {result.stderr.decode('utf-8', errors='ignore')}")
         return []
-    return result.stdout.splitlines()
+    blobs = []
+    for entry in result.stdout.split(b'\0'):
+        if not entry:
+            continue
+        # "<mode> <type> <sha>\t<path>" (-z: paths are not quoted)
+        meta, path = entry.split(b'\t', 1)
+        _, obj_type, sha = meta.split()
+        path = path.decode('utf-8', errors='ignore')
+        if obj_type == b'blob' and path.endswith(extensions):
+            blobs.append((path, sha.decode()))
+    return blobs
 
-def get_file_content(repo_path, file_path):
-    """Read file content using git show to bypass Windows filename issues"""
-    result = subprocess.run(
-        ['git', '-C', repo_path, 'show', f'HEAD:{file_path}'],
-        capture_output=True, text=True, encoding='utf-8', errors='ignore'
-    )
-    if result.returncode != 0:
-        return None
-    return result.stdout
+def iter_blob_contents(repo_path, shas):
+    """
+    Stream (sha, bytes) for every blob through one `git cat-file --batch` process.
+    Object names are fed from a thread so neither pipe can fill up and deadlock.
+    """
+    proc = subprocess.Popen(['git', '-C', repo_path, 'cat-file', '--batch'],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed():
+        try:
+            for sha in shas:
+                proc.stdin.write(f"{sha}\n".encode())
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+    writer = threading.Thread(target=feed, daemon=True)
+    writer.start()
+    try:
+        for _ in shas:
+            header = proc.stdout.readline().split()
+            if len(header) < 3:  # "<sha> missing"
+                continue
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # trailing newline
+            yield header[0].decode(), data
+    finally:
+        writer.join()
+        proc.stdout.close()
+        proc.wait()
+
+def extract_blob_prompts(data):
+    """Decode a blob the way `git show` + text mode did (utf-8, universal newlines) and extract"""
+    content = data.decode('utf-8', errors='ignore').replace('\r\n', '\n').replace('\r', '\n')
+    return extract_prompts(content) if content else []
+
+def extract_blob_chunk(chunk):
+    """[(sha, prompts)] for a chunk of (sha, bytes) blobs (one worker task)"""
+    return [(sha, extract_blob_prompts(data)) for sha, data in chunk]
+
+def iter_blob_chunks(blobs, max_blobs=CHUNK_BLOBS, max_bytes=CHUNK_BYTES):
+    """Group streamed (sha, bytes) blobs into chunks of at most max_blobs / ~max_bytes"""
+    chunk, size = [], 0
+    for sha, data in blobs:
+        chunk.append((sha, data))
+        size += len(data)
+        if len(chunk) >= max_blobs or size >= max_bytes:
+            yield chunk
+            chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def load_corpus_cache(path=CORPUS_CACHE_PATH):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                cache = json.load(f)
+            if cache.get('version') == EXTRACT_VERSION:
+                return cache['blobs']
+        except (OSError, ValueError, KeyError):
+            print(f"⚠️ Ignoring unreadable corpus cache {path}")
+    return {}
+
+def save_corpus_cache(blobs, path=CORPUS_CACHE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'version': EXTRACT_VERSION, 'blobs': blobs}, f)
+    os.replace(tmp, path)
+
+def read_repo_prompts(repo_path, workers=None, cache_path=CORPUS_CACHE_PATH):
+    """
+    Prompts per file at HEAD. Blobs stream from one cat-file process into a worker
+    pool in chunks, with a bounded window of chunks in flight so the corpus is never
+    queued in memory at once; results are cached by blob SHA so unchanged files are
+    not read again.
+    Returns [(path, prompts)] in ls-tree order.
+    """
+    start = time.time()
+    blobs = get_repo_blobs(repo_path)
+    cache = load_corpus_cache(cache_path)
+    pending = sorted({sha for _, sha in blobs if sha not in cache})
+
+    if pending:
+        workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+            for chunk in iter_blob_chunks(iter_blob_contents(repo_path, pending)):
+                in_flight.append(pool.submit(extract_blob_chunk, chunk))
+                if len(in_flight) >= workers * 2:
+                    cache.update(in_flight.popleft().result())
+            while in_flight:
+                cache.update(in_flight.popleft().result())
+
+    # Keep only blobs still in the tree so the cache does not grow forever
+    live = {sha for _, sha in blobs}
+    cache = {sha: found for sha, found in cache.items() if sha in live}
+    save_corpus_cache(cache, cache_path)
+
+    print(f"  ⚡ Read {len(blobs)} files ({len(blobs) - len(pending)} cached, "
+          f"{len(pending)} parsed) in {time.time() - start:.1f}s")
+    return [(path, cache.get(sha, [])) for path, sha in blobs]
 
 def extract_prompts(content):
     """Deep scan content for potential jailbreak prompts"""
@@ -72,27 +190,37 @@ def main():
         
     pipeline = DetectionPipeline()
     pipeline.setup(config, weights)
-    learner = PatternLearner(pipeline.pattern_db)
+    # Snapshot what is live now so this run can be rolled back (cli.py rollback --to <id>)
+    registry = ArtifactRegistry.from_config(config)
+    before = registry.create("before train.py")
+    mining = config.get('mining', {})
+    learner = PatternLearner(pipeline.pattern_db, profile=mining.get('profile', 'mining'),
+                             profiles=resolve_profiles(config))
     
     # 2. Extract prompts from repo
     print(f"📁 Reading jailbreaks from {repo_path}...")
-    files = get_repo_files(repo_path)
     prompts = []
     
-    for f in files:
-        if f.endswith('.mkd') or f.endswith('.txt') or f.endswith('.md'):
-            content = get_file_content(repo_path, f)
-            if content:
-                found = extract_prompts(content)
-                if found:
-                    print(f"  └─ Found {len(found)} prompts in {f}")
-                    prompts.extend(found)
+    for f, found in read_repo_prompts(repo_path):
+        if found:
+            print(f"  └─ Found {len(found)} prompts in {f}")
+            prompts.extend(found)
+
+    # Near-duplicate variants would inflate trigram counts; keep one per cluster
+    prompts = list(dict.fromkeys(prompts))
+    dedup_cfg = config.get('dedup', {})
+    if dedup_cfg.get('enabled', True) and prompts:
+        dedup = dedup_near_duplicates(prompts, threshold=dedup_cfg.get('threshold', 0.8),
+                                      num_perm=dedup_cfg.get('num_perm', 64))
+        print_cluster_report(dedup, prompts)
+        prompts = [prompts[i] for i in dedup['keep']]
 
     print(f"\n📦 TOTAL: Extracted {len(prompts)} distinct lethal prompts.")
     
     # 3. Bulk Train
     if prompts:
-        stats = learner.bulk_train(prompts, min_frequency=1)
+        stats = learner.bulk_train(prompts, min_frequency=1, n_process=mining.get('n_process', 1),
+                                   batch_size=mining.get('batch_size', 64), sample=mining.get('sample'))
         
         # 4. Update Embedding Prototype (Semantic Fingerprint)
         print("🧠 Updating semantic fingerprint...")
@@ -112,6 +240,8 @@ def main():
         pipeline.pattern_db._save_global()
         print(f"✨ Training finished: {stats}")
         print(f"💾 Patterns saved to {config['patterns']['global_path']}")
+        release = registry.create(f"train.py: {len(prompts)} prompts")
+        print(f"📌 Release {release['id']} active (previous: {before['id']})")
     else:
         print("❌ No prompts found to train on.")
 